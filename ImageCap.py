@@ -1,11 +1,10 @@
 import os
-from camera_interface import CameraInterface, load_config
+from camera_interface import CameraInterface, load_config, load_backend
 
 def capture_image(cam, filepath):
     success = 0
     try:
-        os.makedirs(os.path.dirname(filepath), exist_ok=True)
-        cam.capture_image(filepath)
+        filepath, _ = cam.capture_image(filepath).result()
         if os.path.isfile(filepath):
             print('Image captured successfully')
             success = 1
@@ -20,11 +19,12 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Image Capture Script')
     parser.add_argument('cam_id', type=int, help='Camera ID to use')
     parser.add_argument('filepath', type=str, help='File path to save the captured image')
+    parser.add_argument('--backend', choices=['spinnaker', 'simulated'], default='spinnaker', help='Camera backend to use')
     args = parser.parse_args()
 
     cam = None
     try:
-        cam = CameraInterface(cam_id=args.cam_id)
+        cam = CameraInterface(cam_id=args.cam_id, backend=load_backend(args.backend))
         config = load_config(cam.serial_number)
 
         # Capture a single image
@@ -0,0 +1,287 @@
+import queue
+import threading
+import time
+from collections import deque
+from camera_interface import CameraInterface, load_config, load_backend
+from frame_grabber import RateMeter
+from interval_scheduler import IntervalScheduler
+from metrics import start_exporter
+
+# How the cameras are kept in step
+FREE_RUN = "free-run"  # Every camera streams at its own frame rate, frames are paired by time only
+SOFTWARE = "software"  # Every camera waits for trigger(), sent to all of them at once over USB
+HARDWARE = "hardware"  # The primary streams and drives an output line wired to the trigger input of the others
+TRIGGER_MODES = [FREE_RUN, SOFTWARE, HARDWARE]
+
+class SyncFrame:
+    def __init__(self, serial_number, frame, frame_id, camera_timestamp, timestamp):
+        self.serial_number = serial_number
+        self.frame = frame
+        self.frame_id = frame_id
+        self.camera_timestamp = camera_timestamp  # Nanoseconds on the camera's own clock
+        self.timestamp = timestamp  # Seconds on the engine's common clock (time.perf_counter)
+
+class FrameSet:
+    # One frame from every camera, taken within the engine's matching tolerance
+    def __init__(self, index, frames):
+        self.index = index
+        self.frames = frames  # serial number -> SyncFrame
+
+    @property
+    def timestamp(self):
+        return min(frame.timestamp for frame in self.frames.values())
+
+    @property
+    def skew(self):
+        # Seconds between the first and last camera of the set
+        timestamps = [frame.timestamp for frame in self.frames.values()]
+        return max(timestamps) - min(timestamps)
+
+class AcquisitionEngine:
+    # Drives every connected camera from one process: the cameras are enumerated once, share
+    # one system instance and each gets a grab thread. Frames are stamped on a common clock
+    # and matched across cameras into FrameSets, so the skew between cameras can be measured.
+    def __init__(self, backend, serial_numbers=None, trigger=FREE_RUN, primary=None, output_line="Line1",
+                 trigger_line="Line3", tolerance=None, queue_size=16, grab_timeout=500):
+        if trigger not in TRIGGER_MODES:
+            raise ValueError(f"Unknown trigger mode {trigger}, use one of {TRIGGER_MODES}")
+        self.spin = backend
+        self.trigger_mode = trigger
+        self.output_line = output_line
+        self.trigger_line = trigger_line
+        self.grab_timeout = grab_timeout  # ms, how often the grab threads check for stop()
+        self.system = self.spin.System.GetInstance()
+        self.camera_list = self.system.GetCameras()
+        self.cameras = {}
+        try:
+            if serial_numbers:
+                # Attach by serial, the other cameras are never initialized
+                for serial_number in serial_numbers:
+                    cam = CameraInterface(backend=backend, camera_list=self.camera_list, serial_number=serial_number)
+                    self.cameras[cam.serial_number] = cam
+            else:
+                for cam_id in range(self.camera_list.GetSize()):
+                    cam = CameraInterface(cam_id, backend=backend, camera_list=self.camera_list)
+                    if cam_id == 0:
+                        cam.list_cameras()
+                    self.cameras[cam.serial_number] = cam
+            for cam in self.cameras.values():
+                cam.apply_config(load_config(cam.serial_number))
+        except Exception:
+            self.cleanup()
+            raise
+        if not self.cameras:
+            self.cleanup()
+            raise Exception("No cameras to acquire from")
+        self.primary = primary or next(iter(self.cameras))
+        if self.primary not in self.cameras:
+            self.cleanup()
+            raise Exception(f"Primary camera {self.primary} is not connected")
+        # Frames further apart than this are not the same exposure; half the slowest frame period by default
+        self.tolerance = tolerance if tolerance is not None else 0.5 * max(self.frame_period(cam) for cam in self.cameras.values())
+        self.clock_offsets = {}
+        self.pending = {serial_number: deque() for serial_number in self.cameras}
+        self.pending_lock = threading.Lock()
+        self.frame_sets = queue.Queue(maxsize=queue_size)
+        self.stop_event = threading.Event()
+        self.threads = []
+        self.trigger_scheduler = None
+        self.error = None
+        self.sets_matched = 0
+        self.sets_dropped = 0
+        self.unmatched_frames = 0
+        self.triggers_sent = 0
+        self.frames_grabbed = {serial_number: 0 for serial_number in self.cameras}
+        self.incomplete_frames = {serial_number: 0 for serial_number in self.cameras}
+        self.set_rate = RateMeter()
+
+    def frame_period(self, cam):
+        try:
+            return 1.0 / cam.get_property("AcquisitionFrameRate")
+        except Exception:
+            return 0.01
+
+    def configure_triggers(self):
+        # Trigger settings can only change while the cameras are stopped
+        for serial_number, cam in self.cameras.items():
+            cam.stop_acquisition()
+            cam.set_property("TriggerMode", "Off")
+            if self.trigger_mode == FREE_RUN:
+                continue
+            if self.trigger_mode == HARDWARE and serial_number == self.primary:
+                cam.set_property("LineSelector", self.output_line)
+                cam.set_property("LineMode", "Output")
+                cam.set_property("LineSource", "ExposureActive")
+                continue
+            cam.set_property("TriggerSelector", "FrameStart")
+            cam.set_property("TriggerSource", "Software" if self.trigger_mode == SOFTWARE else self.trigger_line)
+            try:
+                cam.set_property("TriggerOverlap", "ReadOut")  # Accept the next trigger during readout
+            except Exception as e:
+                print(f"Failed to set TriggerOverlap on {serial_number}: {e}")
+            cam.set_property("TriggerMode", "On")
+
+    def latch_clock_offsets(self):
+        # Offset from each camera's clock to time.perf_counter, so camera timestamps can be
+        # compared across cameras. Cameras without a timestamp latch use the host arrival time.
+        for serial_number, cam in self.cameras.items():
+            try:
+                before = time.perf_counter_ns()
+                cam.execute_command("TimestampLatch")
+                after = time.perf_counter_ns()
+                self.clock_offsets[serial_number] = (before + after) // 2 - cam.get_property("TimestampLatchValue")
+            except Exception as e:
+                print(f"No timestamp latch on {serial_number}, using arrival times: {e}")
+
+    def start(self, trigger_rate=None):
+        # trigger_rate: software triggers per second sent by the engine, None to call trigger() yourself
+        self.configure_triggers()
+        self.latch_clock_offsets()
+        self.stop_event.clear()
+        # Secondaries first, so they are listening before the primary drives the trigger line
+        for serial_number in sorted(self.cameras, key=lambda serial_number: serial_number == self.primary):
+            self.cameras[serial_number].start_acquisition()
+        self.threads = [threading.Thread(target=self.grab_frames, args=(serial_number,), daemon=True) for serial_number in self.cameras]
+        for thread in self.threads:
+            thread.start()
+        if trigger_rate and self.trigger_mode == SOFTWARE:
+            self.trigger_scheduler = IntervalScheduler(1.0 / trigger_rate, float('inf'), lambda index: self.trigger(), log=None)
+            threading.Thread(target=self.trigger_scheduler.run, daemon=True).start()
+
+    def stop(self):
+        if self.trigger_scheduler:
+            self.trigger_scheduler.stop()
+            self.trigger_scheduler = None
+        self.stop_event.set()
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        for cam in self.cameras.values():
+            try:
+                cam.stop_acquisition()
+                cam.set_property("TriggerMode", "Off")
+            except Exception as e:
+                print(f"Failed to stop camera {cam.serial_number}: {e}")
+
+    def trigger(self):
+        # One software trigger to every camera, back to back
+        if self.trigger_mode != SOFTWARE:
+            raise Exception(f"trigger() needs the {SOFTWARE} trigger mode, the engine uses {self.trigger_mode}")
+        for cam in self.cameras.values():
+            cam.execute_command("TriggerSoftware")
+        self.triggers_sent += 1
+
+    def grab_frames(self, serial_number):
+        cam = self.cameras[serial_number]
+        offset = self.clock_offsets.get(serial_number)
+        while not self.stop_event.is_set():
+            try:
+                image = cam.next_image(self.grab_timeout)
+            except cam.spin.SpinnakerException as e:
+                if "Failed waiting for EventData" in str(e):
+                    continue  # No trigger within grab_timeout
+                if "Stream has been aborted" in str(e):
+                    print(f"Stream aborted on {serial_number}, restarting acquisition...")
+                    cam.restart_acquisition()
+                    continue
+                self.error = e
+                break
+            arrival_time = time.perf_counter()
+            if image.IsIncomplete():
+                image.Release()
+                self.incomplete_frames[serial_number] += 1
+                cam.incomplete_counter.increment()
+                continue
+            camera_timestamp = image.GetTimeStamp()
+            convert_start = time.perf_counter()
+            frame = SyncFrame(serial_number, image.GetNDArray().copy(), image.GetFrameID(), camera_timestamp,
+                              (camera_timestamp + offset) / 1e9 if offset is not None else arrival_time)
+            image.Release()
+            cam.convert_latency.observe(time.perf_counter() - convert_start)
+            cam.frames_counter.increment()
+            self.frames_grabbed[serial_number] += 1
+            self.match(frame)
+
+    def match(self, frame):
+        # Pair the oldest pending frame of every camera once all cameras have one. A frame
+        # too old to belong with the newest of the heads has no partners and is dropped.
+        with self.pending_lock:
+            self.pending[frame.serial_number].append(frame)
+            while all(self.pending.values()):
+                newest = max(frames[0].timestamp for frames in self.pending.values())
+                stale = [frames for frames in self.pending.values() if newest - frames[0].timestamp > self.tolerance]
+                if stale:
+                    for frames in stale:
+                        frames.popleft()
+                        self.unmatched_frames += 1
+                    continue
+                frame_set = FrameSet(self.sets_matched, {serial_number: frames.popleft() for serial_number, frames in self.pending.items()})
+                self.sets_matched += 1
+                self.set_rate.tick()
+                try:
+                    self.frame_sets.put_nowait(frame_set)
+                except queue.Full:
+                    self.sets_dropped += 1
+
+    def get_frame_set(self, timeout=None):
+        # Oldest matched FrameSet, or None on timeout
+        try:
+            return self.frame_sets.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def stats(self):
+        return {
+            "cameras": len(self.cameras),
+            "trigger_mode": self.trigger_mode,
+            "sets_matched": self.sets_matched,
+            "sets_dropped": self.sets_dropped,
+            "unmatched_frames": self.unmatched_frames,
+            "triggers_sent": self.triggers_sent,
+            "frames_grabbed": dict(self.frames_grabbed),
+            "incomplete_frames": dict(self.incomplete_frames),
+            "set_fps": self.set_rate.rate(),
+        }
+
+    def cleanup(self):
+        for cam in self.cameras.values():
+            cam.cleanup()
+        self.cameras = {}
+        try:
+            self.camera_list.Clear()
+            self.system.ReleaseInstance()
+        except self.spin.SpinnakerException as e:
+            print(f"Exception during system release: {e}")
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Synchronized Multi-Camera Acquisition')
+    parser.add_argument('--backend', choices=['spinnaker', 'simulated'], default='spinnaker', help='Camera backend to use')
+    parser.add_argument('--serials', nargs='*', help='Serial numbers of the cameras to use, all connected cameras by default')
+    parser.add_argument('--trigger', choices=TRIGGER_MODES, default=SOFTWARE, help='How the cameras are synchronized')
+    parser.add_argument('--primary', type=str, help='Serial number of the camera driving the trigger line (hardware)')
+    parser.add_argument('--rate', type=float, default=10.0, help='Software triggers per second')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds to acquire for')
+    args = parser.parse_args()
+
+    engine = None
+    start_exporter("acquisition_engine")
+    try:
+        engine = AcquisitionEngine(load_backend(args.backend), args.serials, trigger=args.trigger, primary=args.primary)
+        skews = []
+        engine.start(trigger_rate=args.rate)
+        end_time = time.perf_counter() + args.duration
+        while time.perf_counter() < end_time:
+            frame_set = engine.get_frame_set(timeout=0.5)
+            if frame_set is not None:
+                skews.append(frame_set.skew)
+        engine.stop()
+        print(engine.stats())
+        if skews:
+            skews.sort()
+            print(f"Skew over {len(skews)} frame sets: median {skews[len(skews) // 2] * 1000:.3f}ms, max {skews[-1] * 1000:.3f}ms")
+    except Exception as e:
+        print(f'Acquisition failed: {e}')
+    finally:
+        if engine:
+            engine.cleanup()
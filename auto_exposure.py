@@ -0,0 +1,168 @@
+import math
+import time
+from camera_interface import CameraInterface, load_backend
+from config_store import get_store
+from preview import PreviewPipeline, PIXEL_FORMAT_BITS
+
+MEAN = "mean"  # Bring the mean level to target_mean, without exceeding max_saturation
+SATURATION = "saturation"  # Bring the fraction of saturated pixels to target_saturation
+TARGETS = [MEAN, SATURATION]
+
+class AutoExposure:
+    # Software auto exposure on top of set_property and get_frame. Brightness is close to
+    # proportional to the exposure time, and to 10^(gain/20), so the search runs on
+    # log(exposure) and on gain in dB: the first step assumes that slope, the following ones
+    # are secant steps through the last two measurements, kept inside the bracket of known
+    # too-dark and too-bright settings, with bisection when a step would leave it. Gain only
+    # goes up once the exposure reaches max_exposure.
+    def __init__(self, cam, target=MEAN, target_mean=0.45, target_saturation=0.001, max_saturation=0.002, tolerance=None,
+                 max_exposure=None, max_gain=None, settle_frames=1, max_frames=30, frame_source=None):
+        if target not in TARGETS:
+            raise ValueError(f"Unknown target {target}, use one of {TARGETS}")
+        self.cam = cam
+        self.target = target
+        self.target_mean = target_mean
+        self.target_saturation = target_saturation
+        self.max_saturation = max_saturation
+        if tolerance is None:
+            tolerance = 0.03 if target == MEAN else target_saturation * 0.5
+        self.tolerance = tolerance
+        self.settle_frames = settle_frames  # Frames dropped after a change, they may predate it
+        self.max_frames = max_frames
+        self.frame_source = frame_source or cam.get_frame  # Callable returning the next frame
+        exposure_min, exposure_max, _ = cam.get_limits("ExposureTime")
+        gain_min, gain_max, _ = cam.get_limits("Gain")
+        self.exposure_range = (exposure_min, min(exposure_max, max_exposure or exposure_max))
+        self.gain_range = (gain_min, min(gain_max, max_gain if max_gain is not None else gain_max))
+        try:
+            bit_depth = PIXEL_FORMAT_BITS.get(cam.get_property("PixelFormat"))
+        except Exception:
+            bit_depth = None
+        # The preview pipeline already computes the mean and saturation on a decimated frame
+        self.pipeline = PreviewPipeline(max_size=(480, 360), bit_depth=bit_depth, overlay=False)
+        self.frames = 0
+        self.history = []
+
+    def measure(self):
+        for _ in range(self.settle_frames + 1):
+            frame = self.frame_source()
+            self.frames += 1
+            while frame is None or frame.size == 0:
+                if self.frames >= 2 * self.max_frames:
+                    raise Exception("No usable frames from the camera")
+                frame = self.frame_source()
+                self.frames += 1
+        self.pipeline.render(frame)
+        return self.pipeline.mean_level, self.pipeline.saturated_fraction
+
+    def error(self, mean, saturated):
+        # (signed error, usable for a secant step); positive means too bright
+        if self.target == MEAN:
+            if saturated > self.max_saturation:
+                return max(math.log(max(mean, 1e-3) / self.target_mean), math.log(1.25)), False
+            if mean < 1e-3:
+                return -math.log(8), False
+            return math.log(mean / self.target_mean), mean < 0.98
+        if saturated == 0:
+            return -math.log(2), False
+        return math.log(saturated / self.target_saturation), saturated < 0.5
+
+    def converged(self, mean, saturated):
+        if self.target == MEAN:
+            return abs(mean - self.target_mean) <= self.tolerance and saturated <= self.max_saturation
+        return abs(saturated - self.target_saturation) <= self.tolerance
+
+    def search(self, prop, x_min, x_max, to_value, to_x, slope):
+        # x is the searched variable, log brightness grows by about slope per unit of x
+        x = min(max(to_x(self.cam.get_property(prop)), x_min), x_max)
+        lo, hi = x_min, x_max
+        lo_measured = hi_measured = False
+        previous = None
+        while self.frames < self.max_frames:
+            self.cam.set_property(prop, to_value(x))
+            mean, saturated = self.measure()
+            error, informative = self.error(mean, saturated)
+            self.history.append({"frames": self.frames, prop: to_value(x), "mean": mean, "saturated": saturated})
+            if self.converged(mean, saturated):
+                return "converged"
+            if error > 0:
+                hi, hi_measured = x, True
+            else:
+                lo, lo_measured = x, True
+            if x >= x_max and error < 0:
+                return "too dark"
+            if x <= x_min and error > 0:
+                return "too bright"
+            if lo_measured and hi_measured and hi - lo < 0.01 / slope:
+                # The target can't be met exactly, e.g. the mean is capped by saturation
+                self.cam.set_property(prop, to_value(lo))
+                return "converged"
+            if informative and previous is not None and previous[2] and previous[1] != error:
+                x_next = x - error * (x - previous[0]) / (error - previous[1])
+            else:
+                x_next = x - error / slope
+            # Stay strictly inside the bracket, bisecting if the step would leave it
+            if x_next >= hi:
+                x_next = (x + hi) / 2 if hi_measured else x_max
+            elif x_next <= lo:
+                x_next = (x + lo) / 2 if lo_measured else x_min
+            previous = (x, error, informative)
+            x = x_next
+        return "out of frames"
+
+    def run(self):
+        start_time = time.perf_counter()
+        self.frames = 0
+        self.history = []
+        # Exposure first, it adds no noise; gain starts at its minimum
+        self.cam.set_property("Gain", self.gain_range[0])
+        status = self.search("ExposureTime", math.log(self.exposure_range[0]), math.log(self.exposure_range[1]), math.exp, math.log, 1.0)
+        if status == "too dark" and self.gain_range[1] > self.gain_range[0]:
+            status = self.search("Gain", self.gain_range[0], self.gain_range[1], float, float, math.log(10) / 20)
+        mean, saturated = self.pipeline.mean_level, self.pipeline.saturated_fraction
+        return {
+            "status": status,
+            "converged": status == "converged",
+            "frames": self.frames,
+            "seconds": time.perf_counter() - start_time,
+            "ExposureTime": self.cam.get_property("ExposureTime"),
+            "Gain": self.cam.get_property("Gain"),
+            "mean": mean,
+            "saturated_fraction": saturated,
+        }
+
+    def save(self, result):
+        # Store the tuned settings as the camera's configuration
+        get_store().save(self.cam.serial_number, {"ExposureTime": result["ExposureTime"], "Gain": result["Gain"]})
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Software Auto Exposure')
+    parser.add_argument('cam_id', type=int, help='Camera ID to use')
+    parser.add_argument('--backend', choices=['spinnaker', 'simulated'], default='spinnaker', help='Camera backend to use')
+    parser.add_argument('--target', choices=TARGETS, default=MEAN, help='What to tune for')
+    parser.add_argument('--target-mean', type=float, default=0.45, help='Target mean level, as a fraction of full scale')
+    parser.add_argument('--target-saturation', type=float, default=0.001, help='Target fraction of saturated pixels')
+    parser.add_argument('--max-exposure', type=float, help='Longest exposure in microseconds before gain is raised')
+    parser.add_argument('--max-frames', type=int, default=30, help='Give up after this many frames')
+    parser.add_argument('--save', action='store_true', help='Save the result to camera_config.json')
+    args = parser.parse_args()
+
+    cam = None
+    try:
+        cam = CameraInterface(cam_id=args.cam_id, backend=load_backend(args.backend))
+        auto_exposure = AutoExposure(cam, target=args.target, target_mean=args.target_mean, target_saturation=args.target_saturation,
+                                     max_exposure=args.max_exposure, max_frames=args.max_frames)
+        result = auto_exposure.run()
+        print(f"{result['status']} after {result['frames']} frames ({result['seconds']:.2f} seconds): "
+              f"ExposureTime {result['ExposureTime']:.1f}, Gain {result['Gain']:.2f}, "
+              f"mean {result['mean'] * 100:.1f}%, saturated {result['saturated_fraction'] * 100:.3f}%")
+        if args.save:
+            auto_exposure.save(result)
+            print(f"Saved to the configuration of camera {cam.serial_number}")
+    except Exception as e:
+        print(f'Auto exposure failed: {e}')
+    finally:
+        if cam:
+            cam.stop_acquisition()
+            del cam
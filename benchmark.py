@@ -0,0 +1,1178 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARKS = {}
+
+def benchmark(name):
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+def report(label, samples, unit='ms', scale=1000):
+    samples = sorted(samples)
+    if not samples:
+        print(f"{label}: no samples")
+        return
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    print(f"{label}: n={len(samples)} median={statistics.median(samples) * scale:.2f}{unit} "
+          f"mean={statistics.mean(samples) * scale:.2f}{unit} p95={p95 * scale:.2f}{unit} max={samples[-1] * scale:.2f}{unit}")
+
+def open_camera(args):
+    from camera_interface import CameraInterface, load_backend
+    backend = load_backend(args.backend)
+    if args.backend == 'simulated':
+        settings = {"width": args.width, "height": args.height, "bit_depth": args.bit_depth, "frame_rate": args.fps,
+                    "incomplete_rate": args.incomplete_rate, "abort_rate": args.abort_rate}
+        backend.configure(**{key: value for key, value in settings.items() if value is not None})
+    return CameraInterface(cam_id=args.cam_id, backend=backend)
+
+def grab_frames(cam, count, process=None):
+    # Grab frames the way liveView.py does, restarting the stream when it aborts
+    latencies = []
+    incomplete = 0
+    restarts = 0
+    start_time = time.perf_counter()
+    while len(latencies) + incomplete < count:
+        frame_start = time.perf_counter()
+        try:
+            frame = cam.get_frame()
+        except cam.spin.SpinnakerException as e:
+            if "Stream has been aborted" not in str(e):
+                raise
+            restarts += 1
+            cam.restart_acquisition()
+            continue
+        if frame.size == 0:
+            incomplete += 1
+            continue
+        if process:
+            process(frame)
+        latencies.append(time.perf_counter() - frame_start)
+    elapsed = time.perf_counter() - start_time
+    return latencies, incomplete, restarts, elapsed
+
+@benchmark('get-frame')
+def get_frame(args):
+    cam = open_camera(args)
+    try:
+        latencies, incomplete, restarts, elapsed = grab_frames(cam, args.frames)
+    finally:
+        cam.cleanup()
+    report("get_frame", latencies)
+    print(f"throughput: {len(latencies) / elapsed:.1f} fps, incomplete frames: {incomplete}, stream restarts: {restarts}")
+
+@benchmark('capture-image')
+def capture_image(args):
+    cam = open_camera(args)
+    latencies = []
+    failures = 0
+    try:
+        with tempfile.TemporaryDirectory() as output_dir:
+            for i in range(args.frames):
+                start_time = time.perf_counter()
+                try:
+                    cam.capture_image(os.path.join(output_dir, f'capture_{i}.tiff'))
+                except Exception as e:
+                    print(f"Capture {i} failed: {e}")
+                    failures += 1
+                    cam.restart_acquisition()
+                    continue
+                latencies.append(time.perf_counter() - start_time)
+    finally:
+        cam.cleanup()
+    report("capture_image", latencies)
+    print(f"failed captures: {failures}")
+
+@benchmark('live-view')
+def live_view(args):
+    # The liveView.py loop: grab, resize and (with --display) show each frame
+    import cv2
+
+    def show(frame):
+        resized_frame = cv2.resize(frame, (640, 480))
+        if args.display:
+            cv2.imshow("Benchmark", resized_frame)
+            cv2.waitKey(1)
+
+    cam = open_camera(args)
+    try:
+        latencies, incomplete, restarts, elapsed = grab_frames(cam, args.frames, process=show)
+    finally:
+        cam.cleanup()
+        if args.display:
+            cv2.destroyAllWindows()
+    report("grab + resize + display", latencies)
+    print(f"throughput: {len(latencies) / elapsed:.1f} fps, incomplete frames: {incomplete}, stream restarts: {restarts}")
+
+@benchmark('frame-pool')
+def frame_pool(args):
+    # Allocating get_frame versus leasing frames from a FramePool, by copy and zero-copy
+    import tracemalloc
+    from frame_pool import FramePool
+
+    cam = open_camera(args)
+    try:
+        for mode in ('get_frame', 'pool copy', 'pool zero-copy'):
+            pool = FramePool(num_slots=4)
+            latencies = []
+            tracemalloc.start()
+            for _ in range(args.frames):
+                start_time = time.perf_counter()
+                if mode == 'get_frame':
+                    cam.get_frame()
+                else:
+                    lease = cam.get_frame_into(pool, copy=(mode == 'pool copy'))
+                    if lease is not None:
+                        lease.release()
+                latencies.append(time.perf_counter() - start_time)
+            _, peak_memory = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            report(mode, latencies)
+            print(f"  peak traced memory: {peak_memory / 1e6:.1f}MB")
+            if mode != 'get_frame':
+                print(f"  pool stats: {pool.stats()}")
+    finally:
+        cam.cleanup()
+
+@benchmark('grab-thread')
+def grab_thread(args):
+    # Acquisition and display rates with a slow display, grabbing inline versus on a FrameGrabber thread
+    import cv2
+    from frame_grabber import FrameGrabber
+
+    def display(frame):
+        cv2.resize(frame, (640, 480))
+        time.sleep(args.display_delay / 1000)  # Stand-in for imshow/waitKey stalls
+
+    cam = open_camera(args)
+    try:
+        camera_drops = getattr(cam.camera, 'dropped_frames', 0)
+        _, _, _, elapsed = grab_frames(cam, args.frames, process=display)
+        dropped = getattr(cam.camera, 'dropped_frames', 0) - camera_drops
+        print(f"inline: acquisition {args.frames / elapsed:.1f} fps, display {args.frames / elapsed:.1f} fps, "
+              f"frames lost in the camera buffer: {dropped}")
+
+        camera_drops = getattr(cam.camera, 'dropped_frames', 0)
+        grabber = FrameGrabber(cam)
+        grabber.start()
+        displayed = 0
+        start_time = time.perf_counter()
+        while displayed < args.frames:
+            lease = grabber.get_latest(timeout=1)
+            if lease is None:
+                continue
+            with lease:
+                display(lease.frame)
+            displayed += 1
+        elapsed = time.perf_counter() - start_time
+        grabber.stop()
+        stats = grabber.stats()
+        dropped = getattr(cam.camera, 'dropped_frames', 0) - camera_drops
+        print(f"grab thread: acquisition {stats['frames_grabbed'] / elapsed:.1f} fps, display {displayed / elapsed:.1f} fps, "
+              f"frames lost in the camera buffer: {dropped}, frames skipped by the display: {stats['frames_replaced']}")
+    finally:
+        cam.cleanup()
+
+@benchmark('record')
+def record(args):
+    # Sustained recording throughput and frame loss with the writer thread pool
+    from recorder import Recorder
+
+    cam = open_camera(args)
+    try:
+        with tempfile.TemporaryDirectory() as output_dir:
+            camera_drops = getattr(cam.camera, 'dropped_frames', 0)
+            recorder = Recorder(cam, output_dir, num_writers=args.writers, queue_size=args.queue_size)
+            stats = recorder.record(args.duration)
+            stats["camera_buffer_drops"] = getattr(cam.camera, 'dropped_frames', 0) - camera_drops
+    finally:
+        cam.cleanup()
+    print(f"{args.writers} writers, queue {args.queue_size}: {stats['grab_fps']:.1f} fps grabbed, "
+          f"{stats['write_mb_per_s']:.1f} MB/s written")
+    lost = stats['dropped_frames'] + stats['camera_buffer_drops']
+    print(f"frames grabbed {stats['frames_grabbed']}, written {stats['frames_written']}, dropped by recorder {stats['dropped_frames']}, "
+          f"lost in camera buffer {stats['camera_buffer_drops']} ({lost / max(1, stats['frames_grabbed'] + stats['camera_buffer_drops']) * 100:.1f}% loss), "
+          f"peak queue depth {stats['peak_queue_depth']}")
+
+def directory_usage(path):
+    files = [os.path.join(root, name) for root, _, names in os.walk(path) for name in names]
+    return len(files), sum(os.path.getsize(name) for name in files)
+
+@benchmark('timelapse-store')
+def timelapse_store(args):
+    # Writing one TIFF per frame versus appending to a chunked HDF5 container
+    import cv2
+    from timelapse_store import TimelapseWriter, TimelapseReader
+
+    cam = open_camera(args)
+    try:
+        frames = [cam.get_frame() for _ in range(min(args.frames, 8))]
+    finally:
+        cam.cleanup()
+    frames = [frames[i % len(frames)] for i in range(args.frames)]
+    raw_bytes = sum(frame.nbytes for frame in frames)
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        tiff_dir = os.path.join(output_dir, 'tiff')
+        os.makedirs(tiff_dir)
+        latencies = []
+        for i, frame in enumerate(frames):
+            start_time = time.perf_counter()
+            cv2.imwrite(os.path.join(tiff_dir, f'image_{i:06d}.tiff'), frame)
+            latencies.append(time.perf_counter() - start_time)
+        file_count, size = directory_usage(tiff_dir)
+        report("tiff per frame", latencies)
+        print(f"  {file_count} files, {size / 1e6:.1f}MB ({size / raw_bytes * 100:.0f}% of raw), {raw_bytes / 1e6 / sum(latencies):.1f} MB/s")
+
+        for compression in ('gzip', 'lzf', None):
+            path = os.path.join(output_dir, f'run_{compression}.h5')
+            latencies = []
+            with TimelapseWriter(path, compression=compression) as writer:
+                for i, frame in enumerate(frames):
+                    start_time = time.perf_counter()
+                    writer.append(frame, time.time(), serial_number='bench', shutter_open_duration=1.0)
+                    latencies.append(time.perf_counter() - start_time)
+            size = os.path.getsize(path)
+            report(f"hdf5 {compression or 'uncompressed'} per frame", latencies)
+            print(f"  1 file, {size / 1e6:.1f}MB ({size / raw_bytes * 100:.0f}% of raw), {raw_bytes / 1e6 / sum(latencies):.1f} MB/s")
+            with TimelapseReader(path) as reader:
+                start_time = time.perf_counter()
+                for i in range(0, len(reader), max(1, len(reader) // 10)):
+                    reader[i]
+                print(f"  random frame read: {(time.perf_counter() - start_time) / min(10, len(reader)) * 1000:.2f}ms")
+
+@benchmark('raw-stream')
+def raw_stream(args):
+    # Appending frames to a memory-mapped raw stream versus encoding TIFFs, and replay read speed
+    import cv2
+    import numpy as np
+    from raw_stream import RawStreamWriter, RawStreamReader
+
+    cam = open_camera(args)
+    try:
+        frames = [cam.get_frame() for _ in range(min(args.frames, 8))]
+    finally:
+        cam.cleanup()
+    frames = [frames[i % len(frames)] for i in range(args.frames)]
+    raw_bytes = sum(frame.nbytes for frame in frames)
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        latencies = []
+        for i, frame in enumerate(frames):
+            start_time = time.perf_counter()
+            cv2.imwrite(os.path.join(output_dir, f'image_{i:06d}.tiff'), frame)
+            latencies.append(time.perf_counter() - start_time)
+        report("tiff write per frame", latencies)
+
+        path = os.path.join(output_dir, 'run.raw')
+        latencies = []
+        cpu_start = time.process_time()
+        with RawStreamWriter(path, frames[0].shape, frames[0].dtype, len(frames)) as writer:
+            for frame in frames:
+                start_time = time.perf_counter()
+                writer.append(frame)
+                latencies.append(time.perf_counter() - start_time)
+        cpu_time = time.process_time() - cpu_start
+        report("raw stream append per frame", latencies)
+        print(f"  {raw_bytes / 1e6 / sum(latencies):.1f} MB/s, {cpu_time / len(frames) * 1000:.2f}ms CPU per frame including the final flush")
+
+        start_time = time.perf_counter()
+        for i in range(len(frames)):
+            cv2.imread(os.path.join(output_dir, f'image_{i:06d}.tiff'), cv2.IMREAD_UNCHANGED)
+        print(f"tiff replay read: {(time.perf_counter() - start_time) / len(frames) * 1000:.2f}ms per frame")
+        reader = RawStreamReader(path)
+        start_time = time.perf_counter()
+        for i in range(len(reader)):
+            reader[i].sum(dtype=np.uint64)  # Touch every pixel
+        print(f"raw stream replay read: {(time.perf_counter() - start_time) / len(reader) * 1000:.2f}ms per frame")
+
+@benchmark('shutter')
+def shutter(args):
+    # OPEN/CLOSE round trips against a fake Arduino: the old write/sleep(1)/readline versus ShutterController
+    import serial
+    from fake_arduino import FakeArduino
+    from shutter import ShutterController
+
+    arduino = FakeArduino()
+    try:
+        start_time = time.perf_counter()
+        ser = serial.Serial(arduino.port, 9600, timeout=1)
+        time.sleep(2)
+        connect_time = time.perf_counter() - start_time
+        ser.reset_input_buffer()  # Drop the ready message, as the old code never read it
+        legacy_times = []
+        for i in range(args.frames):
+            command = 'OPEN' if i % 2 == 0 else 'CLOSE'
+            start_time = time.perf_counter()
+            ser.write((command + '\n').encode())
+            time.sleep(1)
+            ser.readline()
+            legacy_times.append(time.perf_counter() - start_time)
+        ser.close()
+        print(f"fixed sleeps: connect {connect_time * 1000:.0f}ms")
+        report("fixed sleeps per command", legacy_times)
+
+        arduino.reset()
+        start_time = time.perf_counter()
+        controller = ShutterController(arduino.port)
+        connect_time = time.perf_counter() - start_time
+        controller_times = []
+        for i in range(args.frames):
+            command = 'OPEN' if i % 2 == 0 else 'CLOSE'
+            start_time = time.perf_counter()
+            controller.command(command)
+            controller_times.append(time.perf_counter() - start_time)
+        controller.disconnect()
+        print(f"acknowledgements: connect {connect_time * 1000:.0f}ms (fake boot time {arduino.boot_time * 1000:.0f}ms)")
+        report("acknowledgements per command", controller_times)
+        print(f"servo sweep alone: {91 * arduino.step_delay * 1000:.0f}ms")
+    finally:
+        arduino.stop()
+
+@benchmark('shutter-broker')
+def shutter_broker(args):
+    # A live view start/stop cycle (connect, OPEN, CLOSE, disconnect) reopening the port each
+    # time versus going through the port's shutter broker
+    from fake_arduino import FakeArduino
+    from shutter import ShutterController
+    from shutter_broker import connect_shutter
+
+    arduino = FakeArduino(boot_time=args.boot_time)
+    try:
+        cycle_times = []
+        command_times = []
+        for _ in range(args.frames):
+            start_time = time.perf_counter()
+            arduino.reset()  # Opening the port resets the Uno
+            shutter = ShutterController(arduino.port)
+            for command in ('OPEN', 'CLOSE'):
+                command_start = time.perf_counter()
+                shutter.command(command)
+                command_times.append(time.perf_counter() - command_start)
+            shutter.disconnect()
+            cycle_times.append(time.perf_counter() - start_time)
+        report("direct connection per cycle", cycle_times)
+        report("direct connection per command", command_times)
+
+        arduino.reset()
+        connect_shutter(arduino.port, python=sys.executable).disconnect()  # Start the broker
+        cycle_times = []
+        command_times = []
+        for _ in range(args.frames):
+            start_time = time.perf_counter()
+            shutter = connect_shutter(arduino.port, python=sys.executable)
+            for command in ('OPEN', 'CLOSE'):
+                command_start = time.perf_counter()
+                shutter.command(command)
+                command_times.append(time.perf_counter() - command_start)
+            shutter.disconnect()
+            cycle_times.append(time.perf_counter() - start_time)
+        connect_shutter(arduino.port, python=sys.executable).shutdown_broker()
+        report("broker per cycle", cycle_times)
+        report("broker per command", command_times)
+    finally:
+        arduino.stop()
+
+@benchmark('interval-schedule')
+def interval_schedule(args):
+    # Start time error of each capture against its ideal time, start + i * interval, for the old
+    # whole-second sleep loop and IntervalScheduler. The fake capture takes a random part of the interval.
+    import random
+    from interval_scheduler import IntervalScheduler
+
+    rng = random.Random(0)
+    durations = [rng.uniform(0.1, 0.6) * args.interval for _ in range(args.frames)]
+
+    start_time = time.monotonic()
+    legacy_errors = []
+    for i in range(args.frames):
+        capture_start = time.monotonic()
+        legacy_errors.append(capture_start - (start_time + i * args.interval))
+        time.sleep(durations[i])
+        sleep_time = max(0, args.interval - (time.monotonic() - capture_start))
+        for _ in range(int(sleep_time)):
+            time.sleep(1)
+    report("sleep loop start error", legacy_errors)
+    print(f"sleep loop drift after {args.frames} captures: {legacy_errors[-1]:.3f}s")
+
+    scheduler = IntervalScheduler(args.interval, args.frames, lambda i: time.sleep(durations[i]), log=None)
+    scheduler.run()
+    scheduler_errors = [record.jitter for record in scheduler.records]
+    report("scheduler start error", scheduler_errors)
+    print(f"scheduler drift after {args.frames} captures: {scheduler_errors[-1]:.6f}s")
+
+@benchmark('multi-camera')
+def multi_camera(args):
+    # Every camera driven from one process by AcquisitionEngine: matched set rate, cross-camera skew and memory
+    import psutil
+    from acquisition_engine import AcquisitionEngine
+    from camera_interface import load_backend
+
+    backend = load_backend(args.backend)
+    if args.backend == 'simulated':
+        backend.configure(num_cameras=args.cameras)
+    start_time = time.perf_counter()
+    engine = AcquisitionEngine(backend, trigger=args.trigger)
+    print(f"opened {len(engine.cameras)} cameras in {(time.perf_counter() - start_time) * 1000:.0f}ms")
+    try:
+        skews = []
+        engine.start(trigger_rate=args.fps or 30.0)
+        end_time = time.perf_counter() + args.duration
+        while time.perf_counter() < end_time:
+            frame_set = engine.get_frame_set(timeout=0.5)
+            if frame_set is not None:
+                skews.append(frame_set.skew)
+        engine.stop()
+        stats = engine.stats()
+        print(f"{args.trigger}: {stats['sets_matched']} frame sets at {stats['set_fps']:.1f}/s, {stats['unmatched_frames']} unmatched frames, {stats['sets_dropped']} sets dropped")
+        report("cross-camera skew", skews)
+        print(f"process memory: {psutil.Process().memory_info().rss / 1024 ** 2:.0f}MB")
+    finally:
+        engine.cleanup()
+
+class MockNodeMap:
+    # Wraps a node map, counting lookups and charging each one a fixed cost like a GenICam lookup
+    def __init__(self, node_map, lookup_cost):
+        self.node_map = node_map
+        self.lookup_cost = lookup_cost
+        self.lookups = 0
+
+    def GetNode(self, name):
+        self.lookups += 1
+        end_time = time.perf_counter() + self.lookup_cost
+        while time.perf_counter() < end_time:
+            pass
+        return self.node_map.GetNode(name)
+
+@benchmark('node-cache')
+def node_cache(args):
+    # A live view trackbar tick (read the exposure minimum, write exposure and gain) with node
+    # handles and limits cached per camera, versus looking the nodes up on every call
+    cam = open_camera(args)
+    try:
+        cam.node_map = MockNodeMap(cam.node_map, lookup_cost=20e-6)
+        ticks = args.frames * 50
+
+        def tick(i):
+            cam.set_property("ExposureTime", max(1000.0 + i % 100, cam.get_property_min("ExposureTime")))
+            cam.set_property("Gain", float(i % 10))
+
+        for label, cached in (("uncached", False), ("cached", True)):
+            cam.nodes.clear()
+            cam.limits.clear()
+            cam.node_map.lookups = 0
+            times = []
+            for i in range(ticks):
+                if not cached:
+                    cam.nodes.clear()
+                    cam.limits.clear()
+                start_time = time.perf_counter()
+                tick(i)
+                times.append(time.perf_counter() - start_time)
+            report(f"{label} trackbar tick", times, unit='us', scale=1e6)
+            print(f"{label}: {cam.node_map.lookups / ticks:.2f} node lookups per tick")
+
+        config = {"Gain": 1.0, "BlackLevel": 0.5, "ExposureTime": 5000.0, "ExposureAuto": "Off", "GainAuto": "Off"}
+        start_time = time.perf_counter()
+        for i in range(ticks):
+            config["Gain"] = float(i % 10)
+            cam.set_properties(config)
+        print(f"set_properties of {len(config)} settings: {(time.perf_counter() - start_time) / ticks * 1e6:.1f}us per call")
+    finally:
+        cam.cleanup()
+
+@benchmark('config-save')
+def config_save(args):
+    # Cost to the display thread of a trackbar tick: the old read-modify-write of the whole
+    # config file versus a debounced ConfigStore update
+    from config_store import ConfigStore
+    with tempfile.TemporaryDirectory() as work_dir:
+        path = os.path.join(work_dir, 'camera_config.json')
+        configs = {str(18000000 + i): {"ExposureTime": 10000, "Gain": 0, "BlackLevel": 0} for i in range(8)}
+        with open(path, 'w') as f:
+            json.dump(configs, f)
+        ticks = args.frames * 10
+
+        legacy_times = []
+        for i in range(ticks):
+            start_time = time.perf_counter()
+            with open(path, 'r') as f:
+                all_configs = json.load(f)
+            all_configs["18000000"]["Gain"] = i
+            with open(path, 'w') as f:
+                json.dump(all_configs, f, indent=4)
+            legacy_times.append(time.perf_counter() - start_time)
+        report("rewrite per tick", legacy_times, unit='us', scale=1e6)
+
+        store = ConfigStore(path, os.path.join(work_dir, 'camera_profiles.json'))
+        store_times = []
+        for i in range(ticks):
+            start_time = time.perf_counter()
+            store.update("18000000", {"Gain": i})
+            store_times.append(time.perf_counter() - start_time)
+        start_time = time.perf_counter()
+        store.flush()
+        report("debounced update per tick", store_times, unit='us', scale=1e6)
+        print(f"{ticks} ticks, {store.flushes} file write(s), final flush {(time.perf_counter() - start_time) * 1000:.2f}ms")
+
+SENSOR_SIZES = [(720, 540), (1440, 1080), (2448, 2048), (4096, 3000)]
+
+@benchmark('preview')
+def preview(args):
+    # Per-frame preview cost at several sensor sizes: the old cv2.resize to 640x480 versus
+    # PreviewPipeline (decimation, LUT, histogram and saturation overlay)
+    import numpy as np
+    import cv2
+    from preview import PreviewPipeline, DECIMATION_MODES
+
+    rng = np.random.default_rng(0)
+    repeats = max(10, args.frames)
+    for width, height in SENSOR_SIZES:
+        for bits in (8, 12):
+            dtype = np.uint8 if bits == 8 else np.uint16
+            frame = rng.integers(0, 1 << bits, (height, width), dtype=dtype)
+            times = []
+            for _ in range(repeats):
+                start_time = time.perf_counter()
+                cv2.resize(frame, (640, 480))
+                times.append(time.perf_counter() - start_time)
+            report(f"{width}x{height} {bits}-bit resize", times)
+            for mode in DECIMATION_MODES:
+                pipeline = PreviewPipeline(bit_depth=bits, mode=mode)
+                pipeline.render(frame)  # Allocates the buffers
+                times = []
+                for _ in range(repeats):
+                    start_time = time.perf_counter()
+                    pipeline.render(frame)
+                    times.append(time.perf_counter() - start_time)
+                report(f"{width}x{height} {bits}-bit {mode} pipeline", times)
+
+@benchmark('auto-exposure')
+def auto_exposure(args):
+    # Frames needed to reach a 45% mean level from several starting exposures: AutoExposure's
+    # secant/bisection search versus stepping the exposure by a fixed amount each frame, the
+    # way a trackbar is dragged by hand
+    from auto_exposure import AutoExposure
+    cam = open_camera(args)
+    try:
+        target, tolerance, step, max_frames = 0.45, 0.03, 1000.0, 60
+        for start in (50.0, 2000.0, 20000.0, 60000.0):
+            cam.set_property("Gain", 0.0)
+            cam.set_property("ExposureTime", start)
+            tuner = AutoExposure(cam, target_mean=target, tolerance=tolerance, max_frames=max_frames)
+            result = tuner.run()
+
+            cam.set_property("ExposureTime", start)
+            exposure_min, exposure_max, _ = cam.get_limits("ExposureTime")
+            frames = 0
+            while frames < max_frames:
+                cam.get_frame()  # Settle frame, as AutoExposure drops one too
+                tuner.pipeline.render(cam.get_frame())
+                frames += 2
+                mean = tuner.pipeline.mean_level
+                if abs(mean - target) <= tolerance and tuner.pipeline.saturated_fraction <= tuner.max_saturation:
+                    break
+                exposure = cam.get_property("ExposureTime") + (step if mean < target else -step)
+                cam.set_property("ExposureTime", min(max(exposure, exposure_min), exposure_max))
+            print(f"from {start:.0f}us: search {result['status']} in {result['frames']} frames ({result['ExposureTime']:.0f}us), "
+                  f"linear steps of {step:.0f}us {frames} frames" + ("" if frames < max_frames else " (gave up)"))
+    finally:
+        cam.cleanup()
+
+@benchmark('metrics')
+def metrics_overhead(args):
+    # What the telemetry adds to every frame: a counter increment and two histogram
+    # observations, and the cost of one export of the registry
+    from metrics import Metrics, MetricsExporter
+    registry = Metrics()
+    frames = registry.counter("frames_total", "18000000")
+    grab_latency = registry.histogram("grab_latency_seconds", "18000000")
+    convert_latency = registry.histogram("convert_latency_seconds", "18000000")
+    rounds = args.frames * 100
+    start_time = time.perf_counter()
+    for i in range(rounds):
+        frames.increment()
+        grab_latency.observe(i * 1e-6)
+        convert_latency.observe(i * 1e-7)
+    elapsed = time.perf_counter() - start_time
+    print(f"per frame: {elapsed / rounds * 1e6:.2f}us over {rounds} frames")
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        exporter = MetricsExporter(registry, "benchmark", directory=work_dir)
+        export_times = []
+        for _ in range(args.frames):
+            start_time = time.perf_counter()
+            exporter.export()
+            export_times.append(time.perf_counter() - start_time)
+        report("export", export_times)
+
+@benchmark('log-bus')
+def log_bus(args):
+    # Posting cost from several threads, then GUI responsiveness under a flood of log lines: the
+    # old one insert per line into an unbounded Text widget versus LogView's batched, capped
+    # drain. The old inserts are made on the Tk thread here, as Tk calls from other threads
+    # aren't safe. Responsiveness is how late a 20ms timer fires while lines arrive.
+    import queue
+    import threading
+    from log_bus import LogBus, LogView
+    lines_per_second, duration = 20000, 2.0
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        bus = LogBus(directory=work_dir)
+        posts = args.frames * 500
+        def post_lines(source):
+            for i in range(posts):
+                bus.post(source, f"line {i} of a camera process")
+        threads = [threading.Thread(target=post_lines, args=(f"camera{i}",)) for i in range(4)]
+        start_time = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start_time
+        bus.close()
+        print(f"post from 4 threads: {elapsed / (4 * posts) * 1e6:.2f}us per line")
+
+        try:
+            import tkinter as tk
+            root = tk.Tk()
+        except Exception as e:
+            print(f"Skipping the Tk part, no display: {e}")
+            return
+
+        def feed(send, stop_event):
+            # Bursts of lines every 5ms, lines_per_second overall
+            burst = int(lines_per_second * 0.005)
+            deadline = time.perf_counter()
+            count = 0
+            while not stop_event.is_set():
+                for _ in range(burst):
+                    send(f"line {count} of a camera process")
+                    count += 1
+                deadline += 0.005
+                time.sleep(max(0.0, deadline - time.perf_counter()))
+
+        def run(name, setup):
+            text_widget = tk.Text(root, width=60, height=20)
+            text_widget.pack()
+            send, poll = setup(text_widget)
+            lateness = []
+            stop_event = threading.Event()
+            expected = [time.perf_counter() + 0.02]
+            def heartbeat():
+                now = time.perf_counter()
+                lateness.append(now - expected[0])
+                expected[0] = now + 0.02
+                if not stop_event.is_set():
+                    root.after(20, heartbeat)
+            root.after(20, heartbeat)
+            if poll:
+                root.after(1, poll)
+            feeder = threading.Thread(target=feed, args=(send, stop_event), daemon=True)
+            feeder.start()
+            end_time = time.perf_counter() + duration
+            while time.perf_counter() < end_time:
+                root.update()
+            stop_event.set()
+            feeder.join()
+            report(f"{name} timer lateness", lateness)
+            print(f"{name}: {int(text_widget.index('end-1c').split('.')[0]) - 1} lines in the widget")
+            text_widget.destroy()
+
+        def direct(text_widget):
+            lines = queue.SimpleQueue()
+            def poll():
+                while True:
+                    try:
+                        line = lines.get_nowait()
+                    except queue.Empty:
+                        break
+                    text_widget.insert(tk.END, line + "\n")
+                if text_widget.winfo_exists():
+                    root.after(1, poll)
+            return lines.put, poll
+
+        def batched(text_widget):
+            gui_bus = LogBus(directory=work_dir)
+            LogView(text_widget, gui_bus)
+            return lambda line: gui_bus.post("camera0", line), None
+
+        run("insert per line", direct)
+        run("LogView", batched)
+        root.destroy()
+
+@benchmark('frame-qc')
+def frame_qc(args):
+    # Background quality check per frame at several sensor sizes: the statistics alone, and
+    # with reading the TIFF back as FrameQC does, against what submitting costs the capture thread
+    import numpy as np
+    import cv2
+    from frame_qc import FrameQC, frame_statistics
+
+    rng = np.random.default_rng(0)
+    repeats = max(5, args.frames // 2)
+    with tempfile.TemporaryDirectory() as work_dir:
+        for width, height in SENSOR_SIZES:
+            frame = rng.integers(0, 4096, (height, width), dtype=np.uint16)
+            path = os.path.join(work_dir, f"frame_{width}x{height}.tiff")
+            cv2.imwrite(path, frame)
+            times = []
+            for _ in range(repeats):
+                start_time = time.perf_counter()
+                frame_statistics(frame, 12)
+                times.append(time.perf_counter() - start_time)
+            report(f"{width}x{height} statistics", times)
+
+            qc = FrameQC(os.path.join(work_dir, "run_qc.jsonl"), bit_depth=12)
+            submit_times = []
+            futures = []
+            for i in range(repeats):
+                start_time = time.perf_counter()
+                futures.append(qc.submit(i, path))
+                submit_times.append(time.perf_counter() - start_time)
+            check_times = [future.result().stats["seconds"] for future in futures]
+            qc.close()
+            report(f"{width}x{height} read and check", check_times)
+            report(f"{width}x{height} submit", submit_times, unit='us', scale=1e6)
+
+@benchmark('shutter-timing')
+def shutter_timing(args):
+    # How long the sample is lit per capture against a fake Arduino: the old OPEN, sleep,
+    # capture, CLOSE sequence versus the armed capture that triggers the frame once the shutter
+    # is open and closes it as soon as the frame has arrived. Lit time counts from the middle
+    # of the opening sweep to the middle of the closing one, as in interval_engine.py.
+    import capture_server
+    from fake_arduino import FakeArduino
+    from interval_engine import IntervalRun
+    from shutter import ShutterController
+
+    laser_shutter_time = 0.1
+    arduino = FakeArduino()
+    controller = ShutterController(arduino.port)
+    client = capture_server.connect(args.cam_id, python=sys.executable, backend=args.backend)
+    try:
+        with tempfile.TemporaryDirectory() as output_dir:
+            legacy_times = []
+            for i in range(args.frames):
+                open_sent = time.perf_counter()
+                controller.command("OPEN")
+                opened = time.perf_counter()
+                time.sleep(laser_shutter_time)
+                client.capture(os.path.join(output_dir, f'legacy_{i}.tiff'))
+                close_sent = time.perf_counter()
+                controller.command("CLOSE")
+                closed = time.perf_counter()
+                legacy_times.append((close_sent + closed) / 2 - (open_sent + opened) / 2)
+
+            run = IntervalRun({"cam_id": args.cam_id, "laser_shutter_time": laser_shutter_time, "output_dir": output_dir},
+                              args.backend, shutter=controller, log=lambda message: None)
+            run.capture_client = client
+            timings = []
+            for i in range(args.frames):
+                timings.append(run.timed_capture(os.path.join(output_dir, f'triggered_{i}.tiff'), False)[2])
+    finally:
+        client.shutdown()
+        controller.disconnect()
+        arduino.stop()
+
+    print(f"requested exposure to light: {laser_shutter_time * 1000:.0f}ms, servo sweep {91 * arduino.step_delay * 1000:.0f}ms")
+    report("open, sleep, capture, close: lit", legacy_times)
+    report("armed trigger: lit", [timing["illumination"] for timing in timings])
+    for key in ("open_latency", "trigger_offset", "frame_latency", "close_latency"):
+        report(f"armed trigger: {key}", [timing[key] for timing in timings])
+
+@benchmark('run-journal')
+def run_journal_overhead(args):
+    # What journaling a capture costs the capture thread: RunJournal's flushed writes with
+    # batched fsync, against an fsync per record. Then a short interval run that dies after
+    # half its captures, is read back and resumed from its journal.
+    from interval_scheduler import IntervalScheduler
+    from run_journal import RunJournal, read_journal, COMPLETED, PLANNED, RESUME
+
+    records = max(100, args.frames * 10)
+    timing = {"open_latency": 0.455, "trigger_offset": 0.09, "frame_latency": 0.01, "close_latency": 0.455,
+              "fully_open": 0.1, "illumination": 0.556}
+    with tempfile.TemporaryDirectory() as work_dir:
+        journal = RunJournal(os.path.join(work_dir, "batched.jsonl"))
+        batched_times = []
+        for i in range(records):
+            start_time = time.perf_counter()
+            journal.write(PLANNED, index=i)
+            journal.write(COMPLETED, index=i, attempt=0, path=f"/data/run/image_{i}.tiff", frame_index=None, timing=timing)
+            batched_times.append(time.perf_counter() - start_time)
+        journal.close()
+        report("batched fsync, per capture", batched_times, unit='us', scale=1e6)
+        print(f"fsyncs: {journal.syncs} for {records} captures")
+
+        synced_times = []
+        with open(os.path.join(work_dir, "synced.jsonl"), 'a') as f:
+            for i in range(records):
+                start_time = time.perf_counter()
+                for record in ({"event": PLANNED, "index": i},
+                               {"event": COMPLETED, "index": i, "path": f"/data/run/image_{i}.tiff", "timing": timing}):
+                    f.write(json.dumps(record) + "\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+                synced_times.append(time.perf_counter() - start_time)
+        report("fsync per record, per capture", synced_times, unit='us', scale=1e6)
+
+        path = os.path.join(work_dir, "run_journal.jsonl")
+        total = 20
+        interval = 0.05
+        journal = RunJournal(path)
+        scheduler = None
+        def capture(index):
+            journal.write(PLANNED, index=index)
+            journal.write(COMPLETED, index=index, attempt=0, path=f"image_{index}.tiff", frame_index=None, timing={})
+            if index == total // 2 - 1:
+                scheduler.stop()  # The process dies here, the journal is never closed
+        scheduler = IntervalScheduler(interval, total, capture, log=None)
+        journal.start({}, time.time(), interval, total)
+        scheduler.run()
+        time.sleep(interval * 3)  # Down for a few captures
+
+        start_time = time.perf_counter()
+        state = read_journal(path)
+        first_index = state.first_due()
+        read_time = time.perf_counter() - start_time
+        journal = RunJournal(path)
+        journal.write(RESUME, index=first_index)
+        scheduler = IntervalScheduler(interval, total, capture, log=None)
+        scheduler.run(time.monotonic() - (time.time() - state.start_time), first_index)
+        journal.close()
+        state = read_journal(path)
+        print(f"resume: journal read in {read_time * 1000:.2f}ms, restarted at capture {first_index + 1}, "
+              f"{state.captured} of {total} captured, {len(scheduler.records)} after the restart")
+
+@benchmark('interval-engine')
+def interval_engine(args):
+    # Start time jitter of many cameras' interval schedules in one process: an IntervalScheduler
+    # thread per camera against one MultiScheduler, with captures that take capture_time each
+    # and deadlines that coincide for every camera. Then a short end-to-end run of the engine
+    # with the simulated cameras behind their capture servers.
+    import threading
+    from interval_scheduler import IntervalScheduler, MultiScheduler
+    interval = 0.2
+    capture_time = 0.02
+    captures = max(10, args.frames)
+
+    def capture(index):
+        time.sleep(capture_time)
+
+    for cameras in (8, 32, 64):
+        schedulers = [IntervalScheduler(interval, captures, capture, log=None) for _ in range(cameras)]
+        threads = [threading.Thread(target=scheduler.run) for scheduler in schedulers]
+        start_time = time.perf_counter()
+        cpu_time = time.process_time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start_time
+        cpu_time = time.process_time() - cpu_time
+        jitters = [abs(record.jitter) for scheduler in schedulers for record in scheduler.records if not record.skipped]
+        report(f"{cameras} cameras, thread each: start jitter", jitters)
+        print(f"{cameras} cameras, thread each: {len(jitters) / elapsed:.0f} captures/s, CPU {cpu_time / elapsed * 100:.0f}%")
+
+        schedulers = [IntervalScheduler(interval, captures, capture, log=None) for _ in range(cameras)]
+        start_time = time.perf_counter()
+        cpu_time = time.process_time()
+        MultiScheduler(schedulers, log=None).run()
+        elapsed = time.perf_counter() - start_time
+        cpu_time = time.process_time() - cpu_time
+        jitters = [abs(record.jitter) for scheduler in schedulers for record in scheduler.records if not record.skipped]
+        report(f"{cameras} cameras, one scheduler: start jitter", jitters)
+        print(f"{cameras} cameras, one scheduler: {len(jitters) / elapsed:.0f} captures/s, CPU {cpu_time / elapsed * 100:.0f}%")
+
+    if args.backend != 'simulated':
+        return
+    import simulated_camera
+    from interval_engine import IntervalEngine, IntervalRun
+    with tempfile.TemporaryDirectory() as output_dir:
+        runs = [IntervalRun({"cam_id": cam_id, "interval": 0.5 / 60, "duration": 5 / 3600, "recapture": False,
+                             "output_dir": os.path.join(output_dir, f"cam{cam_id}")}, args.backend, log=lambda message: None)
+                for cam_id in range(simulated_camera.SETTINGS["num_cameras"])]
+        import capture_server
+        for run in runs:
+            # Capture server startup isn't part of the schedule
+            run.capture_client = capture_server.connect(run.cam_id, python=sys.executable, backend=args.backend)
+        engine = IntervalEngine(runs, log=None)
+        start_time = time.perf_counter()
+        engine.run()
+        elapsed = time.perf_counter() - start_time
+        engine.close()
+        jitters = [abs(record.jitter) for run in runs for record in run.scheduler.records if not record.skipped]
+        report(f"engine, {len(runs)} simulated cameras: start jitter", jitters)
+        print(f"engine: {sum(run.captured_images for run in runs)} of {sum(run.total_images for run in runs)} captured in {elapsed:.1f}s")
+
+@benchmark('save-codecs')
+def save_codecs(args):
+    # Encode and write time against file size for every codec, on camera frames at the sensor
+    # resolution (set it with --width/--height/--bit-depth for the simulated camera). Then what
+    # saving costs the capture thread: writing each frame in place, as capture_image did,
+    # against handing it to a FrameWriter.
+    from frame_writer import CODECS, DEFAULT_CODEC, FrameWriter, codec_path, write_frame
+
+    cam = open_camera(args)
+    try:
+        frames = [cam.get_frame() for _ in range(max(3, args.frames // 4))]
+    finally:
+        cam.cleanup()
+    frames = [frame for frame in frames if frame.size]
+    height, width = frames[0].shape[:2]
+    raw_size = frames[0].nbytes
+    print(f"{width}x{height} {frames[0].dtype}, {raw_size / 1e6:.2f}MB per frame")
+    codecs = [(codec, None) for codec in CODECS if codec != "png"] + [("png", level) for level in (1, 3, 6, 9)]
+    with tempfile.TemporaryDirectory() as output_dir:
+        for codec, level in codecs:
+            name = codec if level is None else f"{codec} level {level}"
+            times = []
+            sizes = []
+            for i in range(args.frames):
+                path = codec_path(os.path.join(output_dir, f"frame_{i}"), codec)
+                start_time = time.perf_counter()
+                sizes.append(write_frame(path, frames[i % len(frames)], codec, level))
+                times.append(time.perf_counter() - start_time)
+            size = statistics.mean(sizes)
+            print(f"{name}: median {statistics.median(times) * 1000:.1f}ms, {size / 1e6:.2f}MB ({size / raw_size * 100:.0f}% of raw), "
+                  f"{raw_size / 1e6 / statistics.median(times):.0f}MB/s")
+
+        inline_times = []
+        for i in range(args.frames):
+            start_time = time.perf_counter()
+            write_frame(codec_path(os.path.join(output_dir, f"inline_{i}"), DEFAULT_CODEC), frames[i % len(frames)])
+            inline_times.append(time.perf_counter() - start_time)
+        workers = 2
+        writer = FrameWriter(max_workers=workers)
+        submit_times = []
+        start_time = time.perf_counter()
+        futures = []
+        for i in range(args.frames):
+            submit_start = time.perf_counter()
+            futures.append(writer.submit(os.path.join(output_dir, f"async_{i}"), frames[i % len(frames)]))
+            submit_times.append(time.perf_counter() - submit_start)
+        for future in futures:
+            future.result()
+        drain_time = time.perf_counter() - start_time
+        writer.close()
+        report(f"{DEFAULT_CODEC} in the capture thread", inline_times)
+        report(f"{DEFAULT_CODEC} FrameWriter.submit", submit_times, unit='us', scale=1e6)
+        print(f"FrameWriter wrote {args.frames} frames in {drain_time * 1000:.0f}ms on {workers} threads ({os.cpu_count()} CPUs), "
+              f"{sum(inline_times) * 1000:.0f}ms inline")
+
+@benchmark('change-detection')
+def change_detection(args):
+    # Per-frame cost of ChangeDetector against the frame period, on a noisy static scene at
+    # every sensor size: the whole frame and four regions covering a quarter of it, at each
+    # downsample factor, next to a plain full resolution float64 background difference. Then an
+    # EventRecorder on the camera for --duration; the simulated scene moves every frame, so it
+    # records one long event, the worst case for the writers.
+    import numpy as np
+    from event_capture import ChangeDetector, EventRecorder
+    from metrics import quantile
+
+    frame_rate = args.fps or 60.0
+    print(f"Frame period at {frame_rate:.0f} fps: {1000 / frame_rate:.1f}ms")
+    rng = np.random.default_rng(0)
+    for width, height in SENSOR_SIZES:
+        scene = rng.integers(90, 110, (height, width), dtype=np.uint8)
+        frames = [scene ^ rng.integers(0, 4, (height, width), dtype=np.uint8) for _ in range(4)]
+        event = frames[0].copy()
+        event[height // 16:height // 16 + height // 8, width // 16:width // 16 + width // 8] = 250  # Inside the first region
+        rois = [(x, y, width // 4, height // 4) for x in (0, width // 2) for y in (0, height // 2)]
+        background = frames[0].astype(np.float64)
+        naive_times = []
+        for i in range(args.frames):
+            start_time = time.perf_counter()
+            difference = np.abs(frames[i % len(frames)].astype(np.float64) - background)
+            (difference > 20).mean()
+            background = background * 0.95 + frames[i % len(frames)] * 0.05
+            naive_times.append(time.perf_counter() - start_time)
+        print(f"{width}x{height}: full resolution float64 median {statistics.median(naive_times) * 1000:.2f}ms")
+        for name, regions in (("whole frame", None), ("4 regions", rois)):
+            for downsample in (1, 2, 4, 8):
+                detector = ChangeDetector(regions, downsample=downsample, warmup_frames=1)
+                detector.update(frames[0])
+                times = []
+                false_triggers = 0
+                for i in range(args.frames):
+                    start_time = time.perf_counter()
+                    _, triggered = detector.update(frames[i % len(frames)])
+                    times.append(time.perf_counter() - start_time)
+                    false_triggers += triggered
+                _, detected = detector.update(event)
+                median = statistics.median(times)
+                print(f"  {name}, downsample {downsample}: median {median * 1000:.2f}ms "
+                      f"({median * frame_rate * 100:.1f}% of the frame period), event {'detected' if detected else 'MISSED'}, "
+                      f"{false_triggers} false triggers")
+
+    cam = open_camera(args)
+    try:
+        with tempfile.TemporaryDirectory() as output_dir:
+            recorder = EventRecorder(cam, output_dir, ChangeDetector(), codec="npy")
+            recorder.start()
+            time.sleep(args.duration)
+            recorder.stop()
+            if recorder.error:
+                raise recorder.error
+            stats = recorder.stats()
+    finally:
+        cam.cleanup()
+    detect = recorder.detect_latency.snapshot()
+    print(f"EventRecorder: {stats['frames_grabbed'] / args.duration:.1f} fps grabbed, detection "
+          f"p50 {quantile(detect, 0.5) * 1000:.2f}ms p95 {quantile(detect, 0.95) * 1000:.2f}ms, {stats['frames_saved']} frames saved "
+          f"in {stats['events']} events, dropped {stats['dropped_frames']}, incomplete {stats['incomplete_frames']}")
+
+@benchmark('image-modes')
+def image_modes(args):
+    # Frame rate per image format: full frame in each pixel format, binned, and centred
+    # regions. Exposure is set to 1ms so readout and link bandwidth set the rate, and the camera
+    # runs as fast as it can (AcquisitionFrameRateEnable off). For each mode: the time to switch
+    # to it while acquiring and until frames arrive, the rate the camera reports and the rate grabbed.
+    cam = open_camera(args)
+    try:
+        original = {**cam.get_image_format(), **cam.get_properties(["ExposureTime"])}
+        cam.set_properties({"ExposureTime": 1000.0})
+        try:
+            cam.set_property("AcquisitionFrameRateEnable", False)
+        except Exception as e:
+            print(f"Failed to turn AcquisitionFrameRateEnable off: {e}")
+        cam.set_image_format({"BinningHorizontal": 1, "BinningVertical": 1})
+        full_width, full_height = cam.get_property_max("Width") + cam.get_property("OffsetX"), cam.get_property_max("Height") + cam.get_property("OffsetY")
+        cam.set_image_format({"Width": full_width, "Height": full_height})
+        width_step = max(cam.get_limits("Width")[2] or 1, cam.get_limits("OffsetX")[2] or 1)
+        height_step = max(cam.get_limits("Height")[2] or 1, cam.get_limits("OffsetY")[2] or 1)
+
+        def centred(width, height):
+            width, height = width // width_step * width_step, height // height_step * height_step
+            return {"Width": width, "Height": height, "OffsetX": (full_width - width) // 2 // width_step * width_step,
+                    "OffsetY": (full_height - height) // 2 // height_step * height_step}
+
+        full = {"PixelFormat": "Mono8", "BinningHorizontal": 1, "BinningVertical": 1, **centred(full_width, full_height)}
+        modes = [
+            ("full Mono8", full),
+            ("full Mono12p", {**full, "PixelFormat": "Mono12p"}),
+            ("full Mono16", {**full, "PixelFormat": "Mono16"}),
+            # Binning from the full frame scales the image down with it
+            ("binning 2x2", {"PixelFormat": "Mono8", "BinningHorizontal": 2, "BinningVertical": 2}),
+            ("binning 4x4", {"PixelFormat": "Mono8", "BinningHorizontal": 4, "BinningVertical": 4}),
+            ("half height", {**full, **centred(full_width, full_height // 2)}),
+            ("quarter frame", {**full, **centred(full_width // 2, full_height // 2)}),
+            ("640x480", {**full, **centred(640, 480)}),
+        ]
+        print(f"Sensor {full_width}x{full_height}, ExposureTime 1000us")
+        for name, mode in modes:
+            start_time = time.perf_counter()
+            try:
+                cam.set_image_format(mode)
+            except Exception as e:
+                print(f"{name}: not supported ({e})")
+                continue
+            switch_time = time.perf_counter() - start_time
+            # The first frames after a switch wait for the stream to start, they aren't counted in the
+            # rate; a fresh stream drops the frames queued meanwhile, which would arrive in a burst
+            grab_frames(cam, 2)
+            first_frame_time = time.perf_counter() - start_time
+            cam.stop_acquisition()
+            cam.start_acquisition()
+            try:
+                reported = f"{cam.get_property('AcquisitionResultingFrameRate'):.1f} fps"
+            except Exception:
+                reported = "not reported"
+            latencies, incomplete, restarts, elapsed = grab_frames(cam, args.frames)
+            format_now = cam.get_image_format()
+            frame_bytes = format_now["Width"] * format_now["Height"] * {"Mono8": 1, "Mono12p": 1.5}.get(format_now["PixelFormat"], 2)
+            fps = len(latencies) / elapsed
+            print(f"{name} ({format_now['Width']}x{format_now['Height']} {format_now['PixelFormat']}): switch {switch_time * 1000:.1f}ms, "
+                  f"first frames after {first_frame_time * 1000:.0f}ms, "
+                  f"camera {reported}, grabbed {fps:.1f} fps, {fps * frame_bytes / 1e6:.1f} MB/s, incomplete {incomplete}, restarts {restarts}")
+        cam.set_properties(original)
+    finally:
+        cam.cleanup()
+
+STARTUP_SCRIPT = '''
+import json, sys, time
+start_time = time.perf_counter()
+from camera_interface import CameraInterface, load_backend
+cam = CameraInterface(cam_id=int(sys.argv[2]), config={"ExposureTime": 10000.0, "Gain": 0.0}, backend=load_backend(sys.argv[1]))
+cam.startup_timings["total"] = time.perf_counter() - start_time
+print("TIMINGS " + json.dumps(cam.startup_timings))
+'''
+
+@benchmark('startup')
+def startup(args):
+    # CameraInterface startup phase by phase, each run in a fresh interpreter. The first run has
+    # no camera cache and enumerates every camera, the following ones attach from the cache.
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PYTHONPATH=repo_dir + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    with tempfile.TemporaryDirectory() as work_dir:
+        runs = []
+        for i in range(max(2, args.frames // 4)):
+            output = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT, args.backend, str(args.cam_id)], cwd=work_dir, env=env,
+                                    capture_output=True, text=True, check=True).stdout
+            runs.append(json.loads(next(line for line in output.splitlines() if line.startswith("TIMINGS "))[len("TIMINGS "):]))
+    for phase in runs[0]:
+        print(f"{phase}: cold {runs[0][phase] * 1000:.2f}ms, warm median {statistics.median(run[phase] for run in runs[1:]) * 1000:.2f}ms")
+
+@benchmark('capture-latency')
+def capture_latency(args):
+    # Per-frame latency of spawning ImageCap.py for each frame versus asking a running capture server
+    import capture_server
+    here = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory() as output_dir:
+        subprocess_times = []
+        for i in range(args.frames):
+            start_time = time.perf_counter()
+            subprocess.run([sys.executable, os.path.join(here, 'ImageCap.py'), str(args.cam_id),
+                            os.path.join(output_dir, f'subprocess_{i}.tiff'), '--backend', args.backend],
+                           check=True, capture_output=True, text=True)
+            subprocess_times.append(time.perf_counter() - start_time)
+
+        startup_time = time.perf_counter()
+        client = capture_server.connect(args.cam_id, python=sys.executable, backend=args.backend)
+        startup_time = time.perf_counter() - startup_time
+        server_times = []
+        try:
+            for i in range(args.frames):
+                start_time = time.perf_counter()
+                client.capture(os.path.join(output_dir, f'server_{i}.tiff'))
+                server_times.append(time.perf_counter() - start_time)
+        finally:
+            client.shutdown()
+
+    report("subprocess per frame", subprocess_times)
+    print(f"capture server startup: {startup_time * 1000:.2f}ms")
+    report("capture server per frame", server_times)
+    print(f"speedup: {statistics.median(subprocess_times) / statistics.median(server_times):.1f}x")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks for the camera and capture code')
+    parser.add_argument('name', choices=sorted(BENCHMARKS), help='Benchmark to run')
+    parser.add_argument('--backend', choices=['spinnaker', 'simulated'], default='simulated', help='Camera backend to use')
+    parser.add_argument('--cam-id', type=int, default=0, help='Camera ID to use')
+    parser.add_argument('--frames', type=int, default=20, help='Number of frames to measure')
+    parser.add_argument('--display', action='store_true', help='Show frames on screen where the benchmark displays them')
+    parser.add_argument('--display-delay', type=float, default=30.0, help='Simulated display time per frame in ms (grab-thread)')
+    parser.add_argument('--duration', type=float, default=5.0, help='Run time in seconds for timed benchmarks')
+    parser.add_argument('--writers', type=int, default=4, help='Writer threads (record)')
+    parser.add_argument('--queue-size', type=int, default=64, help='Writer queue size (record)')
+    parser.add_argument('--interval', type=float, default=1.5, help='Capture interval in seconds (interval-schedule)')
+    parser.add_argument('--cameras', type=int, default=4, help='Simulated cameras to open (multi-camera)')
+    parser.add_argument('--trigger', choices=['free-run', 'software', 'hardware'], default='software', help='Synchronization (multi-camera)')
+    parser.add_argument('--boot-time', type=float, default=1.6, help='Fake Arduino reset time in seconds (shutter-broker)')
+    simulated = parser.add_argument_group('simulated camera', 'Override the [SimulatedCamera] settings from config.ini')
+    simulated.add_argument('--width', type=int)
+    simulated.add_argument('--height', type=int)
+    simulated.add_argument('--bit-depth', type=int, choices=[8, 12, 16])
+    simulated.add_argument('--fps', type=float)
+    simulated.add_argument('--incomplete-rate', type=float)
+    simulated.add_argument('--abort-rate', type=float)
+    args = parser.parse_args()
+    BENCHMARKS[args.name](args)
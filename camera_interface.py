@@ -1,72 +1,204 @@
+import time
+_import_start = time.perf_counter()
 import numpy as np
-import cv2
-import PySpin
 import os
 import json
-import time
+from config_store import get_store, write_json_atomic
+from frame_writer import FrameWriter
+from metrics import get_metrics
+
+try:
+    import PySpin
+except ImportError:
+    PySpin = None  # Only the simulated backend is usable without the Spinnaker SDK
 
-CONFIG_FILE = "camera_config.json"
+# Seconds spent importing numpy, PySpin and the modules above, OpenCV among them through
+# frame_writer, the first phase of every startup
+IMPORT_TIME = time.perf_counter() - _import_start
+
+# Serial number and model of every camera by index, as of the last full enumeration
+CAMERA_CACHE_FILE = "camera_cache.json"
 
 def save_config(serial_number, config):
-    all_configs = load_all_configs()
-    all_configs[serial_number] = config
-    with open(CONFIG_FILE, 'w') as f:
-        json.dump(all_configs, f, indent=4)
+    # Written straight away; ConfigStore.update() batches frequent changes instead
+    get_store().save(serial_number, config)
 
 def load_all_configs():
-    if os.path.exists(CONFIG_FILE):
-        with open(CONFIG_FILE, 'r') as f:
-            return json.load(f)
-    return {}
+    return get_store().load_all()
 
 def load_config(serial_number):
-    all_configs = load_all_configs()
-    return all_configs.get(serial_number, {
-        "ExposureTime": 0,
-        "Gain": 0,
-        "BlackLevel": 0
-    })
+    return get_store().load(serial_number)
+
+# Size and pixel format of the frames, in the order they are written: binning sets the largest
+# image, which sets the largest offsets. Cameras only accept most of them while not acquiring.
+IMAGE_FORMAT = ["PixelFormat", "BinningHorizontal", "BinningVertical", "Width", "Height", "OffsetX", "OffsetY"]
+
+# Settings are written in this order: the auto modes release the values they control, and the
+# pixel format and image size set the limits of the timing settings that follow
+PROPERTY_ORDER = [
+    "ExposureAuto", "GainAuto", "GammaEnabled",
+    *IMAGE_FORMAT,
+    "ExposureTime", "AcquisitionFrameRateEnable", "AcquisitionFrameRate", "Gain", "BlackLevel",
+]
+
+# Properties whose limits a write can change. Writes to properties not listed here drop every
+# cached limit.
+LIMIT_DEPENDENCIES = {
+    "ExposureTime": ("AcquisitionFrameRate",),
+    "AcquisitionFrameRate": ("ExposureTime",),
+    "Gain": (),
+    "BlackLevel": (),
+    "GammaEnabled": (),
+}
+
+def image_format(settings):
+    # The image format part of a config or profile, e.g. to preview in another mode than the one recorded in
+    return {prop: value for prop, value in settings.items() if prop in IMAGE_FORMAT}
+
+def load_mode(serial_number, mode):
+    # Image format of the settings profile named mode, or of mode written out as "Prop=value,...",
+    # e.g. "BinningHorizontal=2,BinningVertical=2" for a binned preview
+    if "=" not in mode:
+        settings = image_format(get_store().load_profile(serial_number, mode))
+        if not settings:
+            raise Exception(f"Profile {mode} has no image format settings ({', '.join(IMAGE_FORMAT)})")
+        return settings
+    settings = {}
+    for item in mode.split(","):
+        prop, _, value = (part.strip() for part in item.partition("="))
+        if prop not in IMAGE_FORMAT:
+            raise Exception(f"{prop} is not an image format setting, use {', '.join(IMAGE_FORMAT)}")
+        settings[prop] = int(value) if value.isdigit() else value
+    return settings
+
+def load_camera_cache():
+    if os.path.exists(CAMERA_CACHE_FILE):
+        try:
+            with open(CAMERA_CACHE_FILE, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable camera cache: {e}")
+    return []
+
+def save_camera_cache(cameras):
+    try:
+        write_json_atomic(CAMERA_CACHE_FILE, cameras)
+    except OSError as e:
+        print(f"Failed to save camera cache: {e}")
+
+def load_backend(name):
+    # Return the module providing the PySpin API for the requested backend
+    if name == "spinnaker":
+        if PySpin is None:
+            raise ImportError("PySpin is not installed, the spinnaker backend is unavailable")
+        return PySpin
+    if name == "simulated":
+        import simulated_camera
+        return simulated_camera
+    raise ValueError(f"Unknown camera backend: {name}")
 
 class CameraInterface:
-    def __init__(self, cam_id=0, config=None):
-        self.system = PySpin.System.GetInstance()
-        self.camera_list = self.system.GetCameras()
+    def __init__(self, cam_id=0, config=None, backend=None, camera_list=None, serial_number=None):
+        # backend is a module exposing the PySpin API (PySpin itself or simulated_camera).
+        # serial_number attaches to that camera directly, whatever its index.
+        # startup_timings records how long each startup phase took, in seconds.
+        self.startup_timings = {"import": IMPORT_TIME}
+        phase_start = time.perf_counter()
+        self.spin = backend if backend is not None else load_backend("spinnaker")
+        if camera_list is None:
+            self.system = self.spin.System.GetInstance()
+            phase_start = self.end_phase("system", phase_start)
+            self.camera_list = self.system.GetCameras()
+        else:
+            # Several interfaces sharing one enumeration, the caller releases the list and system
+            self.system = None
+            self.camera_list = camera_list
+        self.owns_camera_list = camera_list is None
         self.num_cameras = self.camera_list.GetSize()
-        
-        # Print list of available cameras
-        self.list_cameras()
-        
-        # Validate the cam_id
-        if cam_id < 0 or cam_id >= self.num_cameras:
-            raise IndexError(f"Camera ID {cam_id} is out of bounds. Available cameras: {self.num_cameras - 1}")
 
-        self.camera = self.camera_list[cam_id]
+        # Reading every camera's device info is slow, the cached list is used while it still
+        # matches the connected cameras
+        cache = load_camera_cache()
+        if serial_number is None:
+            # Validate the cam_id
+            if cam_id < 0 or cam_id >= self.num_cameras:
+                raise IndexError(f"Camera ID {cam_id} is out of bounds. Available cameras: {self.num_cameras - 1}")
+            self.camera = self.camera_list[cam_id]
+        else:
+            self.camera = self.camera_list.GetBySerial(serial_number)
+        self.serial_number = self.read_serial_number(self.camera)
+        metrics = get_metrics()
+        self.frames_counter = metrics.counter("frames_total", self.serial_number)
+        self.incomplete_counter = metrics.counter("incomplete_frames_total", self.serial_number)
+        self.restarts_counter = metrics.counter("stream_restarts_total", self.serial_number)
+        self.grab_latency = metrics.histogram("grab_latency_seconds", self.serial_number)  # Waiting for the next image
+        self.convert_latency = metrics.histogram("convert_latency_seconds", self.serial_number)  # Copying it out of the stream buffer
+        self.write_latency = metrics.histogram("write_latency_seconds", self.serial_number)  # Saving it to disk
+        self.writer = None  # FrameWriter for capture_image, started on the first capture
+        cache_valid = len(cache) == self.num_cameras and any(entry["serial"] == self.serial_number for entry in cache)
+        if serial_number is None and cache_valid:
+            cache_valid = cache[cam_id]["serial"] == self.serial_number
+        if self.owns_camera_list:
+            if cache_valid:
+                self.print_camera_list(cache)
+            else:
+                self.list_cameras()
+        phase_start = self.end_phase("enumerate", phase_start)
+
         self.camera.Init()
         self.node_map = self.camera.GetNodeMap()
-
-        # Get the camera's serial number
-        nodemap_tldevice = self.camera.GetTLDeviceNodeMap()
-        self.serial_number = PySpin.CStringPtr(nodemap_tldevice.GetNode('DeviceSerialNumber')).GetValue()
+        self.pointer_types = {
+            self.spin.intfIFloat: self.spin.CFloatPtr,
+            self.spin.intfIEnumeration: self.spin.CEnumerationPtr,
+            self.spin.intfIInteger: self.spin.CIntegerPtr,
+            self.spin.intfIBoolean: self.spin.CBooleanPtr,
+            self.spin.intfIString: self.spin.CStringPtr,
+            self.spin.intfICommand: self.spin.CCommandPtr,
+        }
+        self.nodes = {}  # Property name -> (typed node pointer, interface type)
+        self.limits = {}  # Property name -> (min, max, increment)
+        phase_start = self.end_phase("init", phase_start)
 
         # Turn off auto settings and gamma
         self.set_auto_settings_off()
         
         # Set camera to continuous mode
-        self.camera.AcquisitionMode.SetValue(PySpin.AcquisitionMode_Continuous)
+        if self.camera.AcquisitionMode.GetValue() != self.spin.AcquisitionMode_Continuous:
+            self.camera.AcquisitionMode.SetValue(self.spin.AcquisitionMode_Continuous)
         
         # Apply the configuration settings
         if config:
             self.apply_config(config)
+        phase_start = self.end_phase("config", phase_start)
         
         self.start_acquisition()
+        self.end_phase("start", phase_start)
+
+    def end_phase(self, name, phase_start):
+        now = time.perf_counter()
+        self.startup_timings[name] = now - phase_start
+        return now
+
+    def read_serial_number(self, cam):
+        nodemap_tldevice = cam.GetTLDeviceNodeMap()
+        return self.spin.CStringPtr(nodemap_tldevice.GetNode('DeviceSerialNumber')).GetValue()
 
     def list_cameras(self):
-        print("Connected Cameras:")
-        for i, cam in enumerate(self.camera_list):
+        # Reads every camera's device info and refreshes the camera cache
+        cameras = []
+        for cam in self.camera_list:
             nodemap_tldevice = cam.GetTLDeviceNodeMap()
-            device_serial_number = PySpin.CStringPtr(nodemap_tldevice.GetNode('DeviceSerialNumber')).GetValue()
-            device_model_name = PySpin.CStringPtr(nodemap_tldevice.GetNode('DeviceModelName')).GetValue()
-            print(f"{i}: {device_model_name} (Serial: {device_serial_number})")
+            device_serial_number = self.spin.CStringPtr(nodemap_tldevice.GetNode('DeviceSerialNumber')).GetValue()
+            device_model_name = self.spin.CStringPtr(nodemap_tldevice.GetNode('DeviceModelName')).GetValue()
+            cameras.append({"serial": device_serial_number, "model": device_model_name})
+        save_camera_cache(cameras)
+        self.print_camera_list(cameras)
+        return cameras
+
+    def print_camera_list(self, cameras):
+        print("Connected Cameras:")
+        for i, entry in enumerate(cameras):
+            print(f"{i}: {entry['model']} (Serial: {entry['serial']})")
 
     def set_auto_settings_off(self):
         settings = {
@@ -77,41 +209,173 @@ class CameraInterface:
 
         for prop, value in settings.items():
             try:
-                self.set_property(prop, value)
-                print(f"Set {prop} to {value}")
+                if self.set_property(prop, value):
+                    print(f"Set {prop} to {value}")
+                else:
+                    print(f"{prop} already {value}")
             except Exception as e:
                 print(f"Failed to set {prop}: {e}")
 
+    def node(self, prop):
+        # Typed pointer and interface type of a node, looked up once per camera
+        cached = self.nodes.get(prop)
+        if cached is None:
+            node = self.node_map.GetNode(prop)
+            if not self.spin.IsAvailable(node):
+                raise Exception(f"Property {prop} is not available")
+            interface_type = node.GetPrincipalInterfaceType()
+            pointer_type = self.pointer_types.get(interface_type)
+            cached = (pointer_type(node) if pointer_type else node, interface_type)
+            self.nodes[prop] = cached
+        return cached
+
+    def ordered_settings(self, settings):
+        # Settings in the order they have to be written, the rest in their original order
+        return sorted(settings.items(), key=lambda item: PROPERTY_ORDER.index(item[0]) if item[0] in PROPERTY_ORDER else len(PROPERTY_ORDER))
+
     def set_property(self, prop, value):
-        node = self.node_map.GetNode(prop)
+        # Returns False without writing when the camera already has the value, which also
+        # lets a matching value through on a node that is read-only at the moment
+        node, interface_type = self.node(prop)
+        if interface_type == self.spin.intfIBoolean:
+            value = value == "True" or value is True
+
+        if self.spin.IsReadable(node):
+            try:
+                if self.get_property(prop) == value:
+                    return False
+            except Exception:
+                pass  # Unsupported type, write it anyway
         
-        if not PySpin.IsAvailable(node) or not PySpin.IsWritable(node):
+        if not self.spin.IsWritable(node):
+            if prop in IMAGE_FORMAT and self.camera.IsStreaming():
+                return self.set_image_format({prop: value})[prop]
             raise Exception(f"Unable to set {prop}")
         
-        if node.GetPrincipalInterfaceType() == PySpin.intfIFloat:
-            value_node = PySpin.CFloatPtr(node)
-            value_node.SetValue(value)
-        elif node.GetPrincipalInterfaceType() == PySpin.intfIEnumeration:
-            value_node = PySpin.CEnumerationPtr(node)
-            node_entry = value_node.GetEntryByName(value)
-            value_node.SetIntValue(node_entry.GetValue())
-        elif node.GetPrincipalInterfaceType() == PySpin.intfIInteger:
-            value_node = PySpin.CIntegerPtr(node)
-            value_node.SetValue(value)
-        elif node.GetPrincipalInterfaceType() == PySpin.intfIBoolean:
-            value_node = PySpin.CBooleanPtr(node)
-            value_node.SetValue(value == "True" or value is True)
+        if interface_type == self.spin.intfIEnumeration:
+            node.SetIntValue(node.GetEntryByName(value).GetValue())
+        elif interface_type in (self.spin.intfIFloat, self.spin.intfIInteger, self.spin.intfIBoolean):
+            node.SetValue(value)
 
-    def get_property_min(self, prop):
-        node = self.node_map.GetNode(prop)
-        if not PySpin.IsAvailable(node):
-            raise Exception(f"Property {prop} is not available")
-        if node.GetPrincipalInterfaceType() == PySpin.intfIFloat:
-            return PySpin.CFloatPtr(node).GetMin()
-        elif node.GetPrincipalInterfaceType() == PySpin.intfIInteger:
-            return PySpin.CIntegerPtr(node).GetMin()
+        # The write may have moved the limits of other properties
+        affected = LIMIT_DEPENDENCIES.get(prop)
+        if affected is None:
+            self.limits.clear()
         else:
-            raise Exception(f"Property {prop} does not have a minimum value")
+            for dependent in affected:
+                self.limits.pop(dependent, None)
+        return True
+
+    def set_properties(self, settings):
+        # Checks every setting before writing any, then writes them in dependency order.
+        # Returns {prop: written}, like set_property for each.
+        problems = []
+        for prop, value in settings.items():
+            try:
+                node, interface_type = self.node(prop)
+                if interface_type == self.spin.intfIEnumeration:
+                    node.GetEntryByName(value)
+                elif interface_type in (self.spin.intfIFloat, self.spin.intfIInteger) and not isinstance(value, (int, float)):
+                    raise Exception(f"expected a number, got {value!r}")
+                elif interface_type not in (self.spin.intfIFloat, self.spin.intfIInteger, self.spin.intfIBoolean, self.spin.intfIEnumeration):
+                    raise Exception("unsupported type")
+            except Exception as e:
+                problems.append(f"{prop}: {e}")
+        if problems:
+            raise Exception(f"Invalid settings: {'; '.join(problems)}")
+        written = self.set_image_format(image_format(settings))
+        written.update({prop: self.set_property(prop, value) for prop, value in self.ordered_settings(settings) if prop not in written})
+        return written
+
+    def set_image_format(self, settings):
+        # Writes the IMAGE_FORMAT properties in settings with acquisition stopped, once for all of
+        # them, and starts it again if it was running. An offset is cleared before its size is
+        # written, so a larger image fits, then set to the value in settings or back to the one
+        # it had, as far as the new size allows. Returns {prop: written}.
+        settings = {prop: settings[prop] for prop in IMAGE_FORMAT if prop in settings}
+        if not settings:
+            return {}
+        current = self.get_image_format()
+        if all(current.get(prop) == value for prop, value in settings.items()):
+            return {prop: False for prop in settings}
+        restart = self.camera.IsStreaming()
+        if restart:
+            self.stop_acquisition()
+        try:
+            written = {}
+            for prop in ("PixelFormat", "BinningHorizontal", "BinningVertical"):
+                if prop in settings:
+                    written[prop] = self.set_property(prop, settings[prop])
+            offsets = {}
+            for size, offset in (("Width", "OffsetX"), ("Height", "OffsetY")):
+                if size in settings:
+                    if offset not in settings and offset in current:
+                        offsets[offset] = self.get_property(offset)
+                    if offset in current and self.get_property(offset) != 0:
+                        self.set_property(offset, 0)
+                    written[size] = self.set_property(size, settings[size])
+            for offset, value in offsets.items():
+                value = min(value, self.get_property_max(offset))
+                if value:
+                    self.set_property(offset, value)
+            for offset in ("OffsetX", "OffsetY"):
+                if offset in settings:
+                    written[offset] = self.set_property(offset, settings[offset])
+        finally:
+            self.limits.clear()
+            if restart:
+                self.start_acquisition()
+        return written
+
+    def get_image_format(self):
+        # {prop: value} of the IMAGE_FORMAT properties the camera has
+        values = {}
+        for prop in IMAGE_FORMAT:
+            try:
+                values[prop] = self.get_property(prop)
+            except Exception:
+                pass  # Not every model bins or has offsets
+        return values
+
+    def get_property(self, prop):
+        node, interface_type = self.node(prop)
+        if not self.spin.IsReadable(node):
+            raise Exception(f"Unable to read {prop}")
+        if interface_type == self.spin.intfIEnumeration:
+            return node.GetCurrentEntry().GetSymbolic()
+        elif interface_type in (self.spin.intfIFloat, self.spin.intfIInteger, self.spin.intfIBoolean, self.spin.intfIString):
+            return node.GetValue()
+        raise Exception(f"Property {prop} has an unsupported type")
+
+    def get_properties(self, props):
+        return {prop: self.get_property(prop) for prop in props}
+
+    def execute_command(self, prop):
+        node, _ = self.node(prop)
+        if not self.spin.IsWritable(node):
+            raise Exception(f"Unable to execute {prop}")
+        node.Execute()
+
+    def get_limits(self, prop):
+        # (min, max, increment) of a numeric property, increment is None if the node has none.
+        # Cached until a write that can move them.
+        limits = self.limits.get(prop)
+        if limits is None:
+            node, interface_type = self.node(prop)
+            if interface_type == self.spin.intfIInteger:
+                limits = (node.GetMin(), node.GetMax(), node.GetInc())
+            elif interface_type == self.spin.intfIFloat:
+                limits = (node.GetMin(), node.GetMax(), node.GetInc() if node.HasInc() else None)
+            else:
+                raise Exception(f"Property {prop} does not have a minimum value")
+            self.limits[prop] = limits
+        return limits
+
+    def get_property_min(self, prop):
+        return self.get_limits(prop)[0]
+
+    def get_property_max(self, prop):
+        return self.get_limits(prop)[1]
 
     def start_acquisition(self):
         self.camera.BeginAcquisition()
@@ -121,23 +385,78 @@ class CameraInterface:
             self.camera.EndAcquisition()
 
     def restart_acquisition(self):
+        self.restarts_counter.increment()
+        self.stop_acquisition()
+        self.camera.AcquisitionMode.SetValue(self.spin.AcquisitionMode_Continuous)
+        self.start_acquisition()
+
+    def set_software_trigger(self, enabled):
+        # With the trigger on, acquisition keeps running and every trigger_frame() exposes one
+        # frame, so a single capture needs no acquisition restart
         self.stop_acquisition()
-        self.camera.AcquisitionMode.SetValue(PySpin.AcquisitionMode_Continuous)
+        self.set_property("TriggerMode", "Off")
+        if enabled:
+            self.set_property("TriggerSelector", "FrameStart")
+            self.set_property("TriggerSource", "Software")
+            self.set_property("TriggerMode", "On")
         self.start_acquisition()
 
-    def get_frame(self):
-        image = self.camera.GetNextImage()
+    def trigger_frame(self, timeout=None):
+        # Exposes and returns one frame, with set_software_trigger(True)
+        self.execute_command("TriggerSoftware")
+        return self.get_frame(timeout)
+
+    def next_image(self, timeout=None):
+        # timeout in milliseconds, None waits for as long as it takes
+        start_time = time.perf_counter()
+        if timeout is None:
+            image = self.camera.GetNextImage()
+        else:
+            image = self.camera.GetNextImage(int(timeout))
+        self.grab_latency.observe(time.perf_counter() - start_time)
+        return image
+
+    def get_frame(self, timeout=None):
+        image = self.next_image(timeout)
         if image.IsIncomplete():
+            self.incomplete_counter.increment()
             print('Image incomplete with image status {0}...'.format(image.GetImageStatus()))
+            image.Release()
             return np.ndarray((0, 0))
-        frame = image.GetNDArray()
+        # GetNDArray shares memory with the stream buffer, which is reused after Release()
+        start_time = time.perf_counter()
+        frame = image.GetNDArray().copy()
         image.Release()
+        self.convert_latency.observe(time.perf_counter() - start_time)
+        self.frames_counter.increment()
         return frame
 
-    def capture_image(self, filename):
-        os.makedirs(os.path.dirname(filename), exist_ok=True)
+    def get_frame_into(self, pool, copy=True, timeout=None):
+        # Like get_frame, but the frame is leased from a FramePool instead of allocated.
+        # With copy=False the lease wraps the stream buffer itself, so the pool must have fewer
+        # slots than the camera has stream buffers. Returns None for incomplete or dropped frames.
+        image = self.next_image(timeout)
+        if image.IsIncomplete():
+            self.incomplete_counter.increment()
+            print('Image incomplete with image status {0}...'.format(image.GetImageStatus()))
+            image.Release()
+            return None
+        self.frames_counter.increment()
+        frame_id = image.GetFrameID()
+        timestamp = image.GetTimeStamp()
+        if not copy:
+            return pool.wrap(image, frame_id, timestamp)
+        start_time = time.perf_counter()
+        try:
+            return pool.put(image.GetNDArray(), frame_id, timestamp)
+        finally:
+            image.Release()
+            self.convert_latency.observe(time.perf_counter() - start_time)
+
+    def grab_single_frame(self):
+        # Grab one frame in SingleFrame mode, then return the camera to continuous acquisition
         self.stop_acquisition()
-        self.camera.AcquisitionMode.SetValue(PySpin.AcquisitionMode_SingleFrame)
+        self.camera.AcquisitionMode.SetValue(self.spin.AcquisitionMode_SingleFrame)
         for attempt in range(3):
             try:
                 self.start_acquisition()
@@ -150,22 +469,58 @@ class CameraInterface:
                 else:
                     print(f'Failed to start acquisition (attempt {attempt + 1}/3), trying again in 0.5 seconds...')
                     time.sleep(0.5)
-        frame = self.get_frame()
-        self.stop_acquisition()
-        cv2.imwrite(filename, frame)
-        print(f"Image saved to {filename}")
-        self.camera.AcquisitionMode.SetValue(PySpin.AcquisitionMode_Continuous)
+        try:
+            frame = self.get_frame()
+        finally:
+            self.stop_acquisition()
+            self.camera.AcquisitionMode.SetValue(self.spin.AcquisitionMode_Continuous)
         self.start_acquisition()
+        if frame.size == 0:
+            raise Exception("Captured image was incomplete")
+        return frame
+
+    def frame_writer(self):
+        if self.writer is None:
+            self.writer = FrameWriter(write_latency=self.write_latency)
+        return self.writer
+
+    def capture_image(self, filename, codec=None, level=None):
+        # Grabs a frame and saves it on the frame writer's threads, so the camera is free again
+        # as soon as the frame is in memory. Returns a Future resolved with (path, bytes
+        # written); the path has the codec's extension (see frame_writer.CODECS).
+        frame = self.grab_single_frame()
+        future = self.frame_writer().submit(filename, frame, codec, level)
+        def report(done):
+            if done.exception() is None:
+                print(f"Image saved to {done.result()[0]}")
+        future.add_done_callback(report)
+        return future
 
     def apply_config(self, config):
-        for prop, value in config.items():
+        # Unlike set_properties, a setting that fails is reported and the rest are still applied.
+        # The image format is written in one go, acquisition is stopped once for all of it.
+        settings = image_format(config)
+        if settings:
+            try:
+                for prop, written in self.set_image_format(settings).items():
+                    print(f"Loaded {prop} with value {settings[prop]}" if written else f"{prop} already {settings[prop]}")
+            except Exception as e:
+                print(f"Failed to load the image format {settings}: {e}")
+        for prop, value in self.ordered_settings(config):
+            if prop in settings:
+                continue
             try:
-                self.set_property(prop, value)
-                print(f"Loaded {prop} with value {value}")
+                if self.set_property(prop, value):
+                    print(f"Loaded {prop} with value {value}")
+                else:
+                    print(f"{prop} already {value}")
             except Exception as e:
                 print(f"Failed to load {prop}: {e}")
 
     def cleanup(self):
+        if getattr(self, 'writer', None) is not None:
+            self.writer.close()  # Saves the frames still being written
+            self.writer = None
         try:
             if hasattr(self, 'camera') and self.camera is not None:
                 if self.camera.IsStreaming():
@@ -175,11 +530,11 @@ class CameraInterface:
             print(f"Exception during camera de-initialization: {e}")
         finally:
             try:
-                if hasattr(self, 'camera_list') and self.camera_list is not None:
+                if hasattr(self, 'camera_list') and self.camera_list is not None and getattr(self, 'owns_camera_list', True):
                     self.camera_list.Clear()
                 if hasattr(self, 'system') and self.system is not None:
                     self.system.ReleaseInstance()
-            except PySpin.SpinnakerException as e:
+            except self.spin.SpinnakerException as e:
                 if '[-1004]' in str(e):
                     print("Ignoring known issue with Spinnaker interface clearing.")
                 else:
@@ -0,0 +1,356 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing.connection import Listener, Client
+from camera_interface import CameraInterface, load_backend
+from config_store import load_authkey
+from timelapse_store import TimelapseWriter
+from metrics import start_exporter
+
+# Each camera gets its own server on localhost, listening on BASE_PORT + cam_id. Only clients
+# with the user's key, see config_store.load_authkey, get to send requests.
+BASE_PORT = 6150
+METADATA_TIMEOUT = 10.0  # Seconds a triggered capture waits for the client's metadata before saving without it
+
+class CaptureError(Exception):
+    pass
+
+def server_address(cam_id):
+    return ('localhost', BASE_PORT + cam_id)
+
+class CaptureServer:
+    def __init__(self, cam_id, backend=None):
+        self.cam_id = cam_id
+        self.cam = CameraInterface(cam_id=cam_id, backend=backend)
+        self.camera_lock = threading.Lock()  # Requests from several clients are served one at a time
+        self.containers = {}  # Open TimelapseWriters by path
+        try:
+            # Left on by an earlier server that exited while armed
+            self.armed = self.cam.get_property("TriggerMode") == "On"
+        except Exception:
+            self.armed = False
+        self.running = True
+        self.listener = Listener(server_address(cam_id), authkey=load_authkey())
+        print(f"Capture server for camera {cam_id} (Serial: {self.cam.serial_number}) listening on {self.listener.address}")
+
+    def serve_forever(self):
+        try:
+            while self.running:
+                try:
+                    conn = self.listener.accept()
+                except Exception as e:
+                    print(f"Rejected connection: {e}")
+                    continue
+                if not self.running:
+                    conn.close()
+                    break
+                threading.Thread(target=self.handle_connection, args=(conn,), daemon=True).start()
+        finally:
+            self.listener.close()
+            self.cleanup()
+
+    def handle_connection(self, conn):
+        with conn:
+            while self.running:
+                try:
+                    request = conn.recv()
+                except (EOFError, OSError):
+                    return
+                if isinstance(request, dict):
+                    continue  # Metadata that arrived after its triggered capture stopped waiting for it
+                command = request[0]
+                if command == 'capture':
+                    conn.send(self.capture(request[1], *request[2:]))
+                elif command == 'append':
+                    conn.send(self.append(request[1], request[2]))
+                elif command == 'configure':
+                    conn.send(self.configure(request[1]))
+                elif command == 'arm':
+                    conn.send(self.arm())
+                elif command == 'get':
+                    conn.send(self.get_properties(request[1]))
+                elif command == 'triggered':
+                    conn.send(self.triggered_capture(conn, *request[1:]))
+                elif command == 'ping':
+                    conn.send(('ok', self.cam.serial_number))
+                elif command == 'shutdown':
+                    conn.send(('ok', None))
+                    self.shutdown()
+                    return
+                else:
+                    conn.send(('error', f"Unknown command: {command}"))
+
+    def run_capture(self, description, capture):
+        # Runs capture() with the camera to ourselves, returning the reply for the client. When
+        # capture() returns a Future of a frame being saved, the camera is released for other
+        # clients and the reply waits for the frame to be written.
+        with self.camera_lock:
+            start_time = time.perf_counter()
+            try:
+                self.disarm()  # Single frame captures don't wait for a trigger
+                result = capture()
+            except Exception as e:
+                print(f"Capture of {description} failed: {e}")
+                self.recover()
+                return ('error', str(e))
+        return self.saved(description, result, start_time)
+
+    def saved(self, description, result, start_time):
+        if isinstance(result, Future):
+            try:
+                result = result.result()
+            except Exception as e:
+                print(f"Saving {description} failed: {e}")
+                return ('error', str(e))
+        return ('ok', (result, time.perf_counter() - start_time))
+
+    def recover(self):
+        try:
+            self.cam.restart_acquisition()
+        except Exception as restart_error:
+            print(f"Failed to restart acquisition: {restart_error}")
+
+    def configure(self, settings):
+        # Writes camera settings (ExposureTime, Gain, ...), all or none if one is invalid
+        with self.camera_lock:
+            try:
+                return ('ok', self.cam.set_properties(settings))
+            except Exception as e:
+                print(f"Failed to apply {settings}: {e}")
+                return ('error', str(e))
+
+    def get_properties(self, props):
+        with self.camera_lock:
+            try:
+                return ('ok', self.cam.get_properties(props))
+            except Exception as e:
+                return ('error', str(e))
+
+    def arm(self):
+        # Software trigger mode ahead of triggered captures, replies with the exposure time in seconds
+        with self.camera_lock:
+            try:
+                if not self.armed:
+                    self.cam.set_software_trigger(True)
+                    self.armed = True
+            except Exception as e:
+                print(f"Failed to arm the software trigger: {e}")
+                self.recover()
+                return ('error', str(e))
+            return ('ok', self.read_setting("ExposureTime") / 1e6)
+
+    def disarm(self):
+        # Called with the camera lock held
+        if self.armed:
+            self.cam.set_software_trigger(False)
+            self.armed = False
+
+    def triggered_capture(self, conn, path, container, metadata, codec=None):
+        # Exposes one frame with a software trigger and tells the client the moment it has
+        # arrived, so the client can close the shutter before the frame is written. The client
+        # answers with what it measured meanwhile (the shutter_open_duration), which is stored
+        # with the frame. Times are on time.perf_counter, which is system wide, so they compare
+        # with the client's. The camera is free for other clients while the client answers.
+        with self.camera_lock:
+            start_time = time.perf_counter()
+            try:
+                if not self.armed:
+                    self.cam.set_software_trigger(True)
+                    self.armed = True
+                exposure_time = self.read_setting("ExposureTime")
+                timeout = 1000 + (exposure_time / 1000 if exposure_time == exposure_time else 0)  # ms, NaN if unreadable
+                trigger_time = time.perf_counter()
+                frame = self.cam.trigger_frame(timeout)
+                arrival_time = time.perf_counter()
+                if frame.size == 0:
+                    raise CaptureError("Captured image was incomplete")
+                settings = self.read_settings() if container else None
+            except Exception as e:
+                print(f"Triggered capture of {path} failed: {e}")
+                self.recover()
+                return ('error', str(e))
+        conn.send(('grabbed', (trigger_time, arrival_time)))
+        try:
+            if conn.poll(METADATA_TIMEOUT):
+                metadata = {**metadata, **conn.recv()}
+            else:
+                print(f"No metadata for {path} after {METADATA_TIMEOUT}s, saving it without")
+        except (EOFError, OSError):
+            pass  # The client is gone, the frame is saved all the same
+        try:
+            if container:
+                with self.camera_lock:
+                    return self.saved(path, self.append_frame(path, frame, metadata, settings), start_time)
+            saving = self.cam.frame_writer().submit(path, frame, codec)
+        except Exception as e:
+            print(f"Saving {path} failed: {e}")
+            return ('error', str(e))
+        status, result = self.saved(path, saving, start_time)
+        if status != 'ok':
+            return (status, result)
+        return ('ok', (None, result[1]))  # The frame index is None for image files
+
+    def capture(self, filepath, codec=None):
+        def save():
+            return self.cam.capture_image(filepath, codec)
+        return self.run_capture(filepath, save)
+
+    def append(self, container_path, metadata):
+        # Capture a frame into a time-lapse container, returns the frame's index in it
+        def save():
+            return self.append_frame(container_path, self.cam.grab_single_frame(), metadata)
+        return self.run_capture(container_path, save)
+
+    def append_frame(self, container_path, frame, metadata, settings=None):
+        # Called with the camera lock held. settings are the camera's when the frame was taken,
+        # read now if not given
+        writer = self.containers.get(container_path)
+        if writer is None:
+            writer = self.containers[container_path] = TimelapseWriter(container_path)
+        settings = settings or self.read_settings()
+        with self.cam.write_latency.time():
+            return writer.append(
+                frame, metadata.get('timestamp', time.time()), serial_number=self.cam.serial_number,
+                exposure_time=settings["ExposureTime"], gain=settings["Gain"], black_level=settings["BlackLevel"],
+                shutter_open_duration=metadata.get('shutter_open_duration', 0.0))
+
+    def read_settings(self):
+        return {prop: self.read_setting(prop) for prop in ("ExposureTime", "Gain", "BlackLevel")}
+
+    def read_setting(self, prop):
+        try:
+            return float(self.cam.get_property(prop))
+        except Exception:
+            return float('nan')
+
+    def shutdown(self):
+        self.running = False
+        # Wake up the accept() call in serve_forever so it sees the flag
+        try:
+            Client(server_address(self.cam_id), authkey=load_authkey()).close()
+        except Exception:
+            pass
+
+    def cleanup(self):
+        with self.camera_lock:
+            for writer in self.containers.values():
+                writer.close()
+            self.containers.clear()
+            try:
+                self.cam.stop_acquisition()
+            except Exception as e:
+                print(f"Failed to stop acquisition: {e}")
+            self.cam.cleanup()
+
+class CaptureClient:
+    def __init__(self, cam_id):
+        self.cam_id = cam_id
+        self.conn = Client(server_address(cam_id), authkey=load_authkey())
+
+    def request(self, *message):
+        self.conn.send(message)
+        return self.reply()
+
+    def reply(self):
+        status, result = self.conn.recv()
+        if status != 'ok':
+            raise CaptureError(result)
+        return result
+
+    def ping(self):
+        return self.request('ping')
+
+    def capture(self, filepath, codec=None):
+        # Returns the time the server spent on the capture, in seconds. The image gets the
+        # codec's extension, see frame_writer.codec_path
+        _, elapsed = self.request('capture', filepath, codec)
+        return elapsed
+
+    def append(self, container_path, **metadata):
+        # Capture into a time-lapse container, metadata may hold timestamp and shutter_open_duration.
+        # Returns the frame's index in the container and the time the capture took, in seconds
+        return self.request('append', container_path, metadata)
+
+    def configure(self, settings):
+        # Returns {prop: written}, see CameraInterface.set_properties
+        return self.request('configure', settings)
+
+    def get_properties(self, props):
+        # {prop: value} read from the camera
+        return self.request('get', props)
+
+    def arm(self):
+        # Puts the camera in software trigger mode ahead of triggered(), returns its exposure time in seconds
+        return self.request('arm')
+
+    def triggered(self, path, container=False, on_grabbed=None, codec=None, **metadata):
+        # Captures one frame with a software trigger into an image file, or a time-lapse container.
+        # on_grabbed(trigger_time, arrival_time), times on time.perf_counter, is called as soon as
+        # the frame has arrived and before it is saved; the dict it returns is added to the
+        # frame's metadata. Returns the frame's index in the container (None for an image file)
+        # and the time the capture took, in seconds. An image file gets the codec's extension.
+        self.conn.send(('triggered', path, container, metadata, codec))
+        status, result = self.conn.recv()
+        if status != 'grabbed':
+            raise CaptureError(result)
+        extra = {}
+        try:
+            if on_grabbed:
+                extra = on_grabbed(*result) or {}
+        except BaseException:
+            # The server saves the frame and replies all the same; read the reply so the next
+            # request on this connection gets its own
+            self.conn.send({})
+            try:
+                self.reply()
+            except Exception:
+                pass
+            raise
+        self.conn.send(extra)
+        return self.reply()
+
+    def shutdown(self):
+        try:
+            self.request('shutdown')
+        finally:
+            self.close()
+
+    def close(self):
+        self.conn.close()
+
+def connect(cam_id, python='python3.10', backend='spinnaker', startup_timeout=30):
+    # Connect to the camera's capture server, starting one if none is running
+    try:
+        return CaptureClient(cam_id)
+    except ConnectionRefusedError:
+        pass
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'capture_server.py')
+    proc = subprocess.Popen([python, script, str(cam_id), '--backend', backend])
+    deadline = time.monotonic() + startup_timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise CaptureError(f"Capture server for camera {cam_id} exited with code {proc.returncode}")
+        try:
+            return CaptureClient(cam_id)
+        except ConnectionRefusedError:
+            time.sleep(0.1)
+    proc.terminate()
+    raise CaptureError(f"Capture server for camera {cam_id} did not start within {startup_timeout} seconds")
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Capture Server')
+    parser.add_argument('cam_id', type=int, help='Camera ID to use')
+    parser.add_argument('--backend', choices=['spinnaker', 'simulated'], default='spinnaker', help='Camera backend to use')
+    args = parser.parse_args()
+
+    start_exporter(f"capture_server-cam{args.cam_id}")
+    try:
+        server = CaptureServer(args.cam_id, backend=load_backend(args.backend))
+    except Exception as e:
+        print(f'Failed to start capture server: {e}')
+        sys.exit(1)
+    server.serve_forever()
@@ -0,0 +1,279 @@
+import atexit
+import json
+import os
+import secrets
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+CONFIG_FILE = "camera_config.json"
+PROFILES_FILE = "camera_profiles.json"
+# Secret the capture servers and shutter brokers authenticate their clients with, readable by
+# its owner only. multiprocessing connections unpickle what they receive, so whoever has the key
+# can run code in those processes.
+AUTHKEY_FILE = os.path.join(os.path.expanduser("~"), ".pyspin", "authkey")
+
+# Settings of a camera with no saved configuration. ExposureTime is left to the camera, 0 is
+# below every camera's minimum.
+DEFAULT_CONFIG = {
+    "Gain": 0,
+    "BlackLevel": 0
+}
+
+class FileLock:
+    # Cross-process lock held while a JSON file is read, merged and replaced. It locks a
+    # separate .lock file, as the data file itself is replaced on every write.
+    def __init__(self, path, timeout=10.0):
+        self.path = path + ".lock"
+        self.timeout = timeout
+        self.file = None
+
+    def __enter__(self):
+        self.file = open(self.path, 'a+')
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                if os.name == 'nt':
+                    self.file.seek(0)
+                    msvcrt.locking(self.file.fileno(), msvcrt.LK_NBLCK, 1)
+                else:
+                    fcntl.flock(self.file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return self
+            except OSError:
+                if time.monotonic() > deadline:
+                    self.file.close()
+                    raise TimeoutError(f"Timed out waiting for {self.path}")
+                time.sleep(0.01)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if os.name == 'nt':
+                self.file.seek(0)
+                msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+        finally:
+            self.file.close()
+
+def read_json(path):
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except ValueError as e:
+        # Keep the damaged file for inspection rather than silently losing it
+        backup = path + ".corrupt"
+        os.replace(path, backup)
+        print(f"{path} is not valid JSON ({e}), moved aside to {backup}")
+        return {}
+
+def write_json_atomic(path, data):
+    write_text_atomic(path, json.dumps(data, indent=4))
+
+def write_text_atomic(path, text):
+    # A reader sees either the old file or the new one, never a partial write
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+_authkey = None
+
+def load_authkey(path=AUTHKEY_FILE):
+    # The user's secret, created on first use. A new key is written to a temporary file and
+    # linked into place, so processes starting together all end up with the same complete key.
+    global _authkey
+    if _authkey is not None:
+        return _authkey
+    if not os.path.exists(path):
+        directory = os.path.dirname(path)
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(prefix="authkey.", suffix=".tmp", dir=directory)  # Created with mode 0600
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(secrets.token_hex(32))
+                f.flush()
+                os.fsync(f.fileno())
+            try:
+                os.link(temp_path, path)
+            except FileExistsError:
+                pass  # Another process got there first, use its key
+        finally:
+            os.remove(temp_path)
+    if os.name != 'nt' and os.stat(path).st_mode & 0o077:
+        raise Exception(f"{path} can be read by other users, restrict it with chmod 600")
+    with open(path) as f:
+        key = f.read().strip()
+    if not key:
+        raise Exception(f"{path} is empty, delete it to create a new key")
+    _authkey = key.encode()
+    return _authkey
+
+class ConfigStore:
+    # Per-serial camera settings kept in memory. update() only marks settings dirty; they are
+    # written flush_delay seconds after the last change, so dragging a slider writes the file
+    # once. A flush merges the changed settings into the file as it is on disk, under a file
+    # lock, so processes sharing the file only overwrite the settings they changed.
+    def __init__(self, path=CONFIG_FILE, profiles_path=PROFILES_FILE, flush_delay=0.5, max_versions=20):
+        self.path = path
+        self.profiles_path = profiles_path
+        self.flush_delay = flush_delay
+        self.max_versions = max_versions  # Versions kept per profile, oldest are dropped
+        self.lock = threading.RLock()
+        self.flush_lock = threading.Lock()  # One flush at a time, so batches reach the file in the order they were taken
+        self.configs = {}
+        self.mtime = None
+        self.dirty = {}  # serial -> {prop: value} changed since the last flush
+        self.flush_deadline = None
+        self.changed = threading.Condition(self.lock)
+        self.flusher = None
+        self.flushes = 0
+        self.refresh()
+        atexit.register(self.flush)
+
+    def refresh(self):
+        # Reload from disk if another process changed the file, keeping unflushed changes
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            mtime = None
+        with self.lock:
+            if mtime == self.mtime and self.configs:
+                return
+            configs = read_json(self.path)
+            for serial_number, changes in self.dirty.items():
+                configs.setdefault(serial_number, {}).update(changes)
+            self.configs = configs
+            self.mtime = mtime
+
+    def load_all(self):
+        self.refresh()
+        with self.lock:
+            return {serial_number: dict(config) for serial_number, config in self.configs.items()}
+
+    def load(self, serial_number):
+        self.refresh()
+        with self.lock:
+            return dict(self.configs.get(serial_number, DEFAULT_CONFIG))
+
+    def update(self, serial_number, settings):
+        # Debounced: the file is written flush_delay seconds after the last update
+        with self.lock:
+            self.configs.setdefault(serial_number, {}).update(settings)
+            self.dirty.setdefault(serial_number, {}).update(settings)
+            self.flush_deadline = time.monotonic() + self.flush_delay
+            if self.flusher is None:
+                self.flusher = threading.Thread(target=self.flush_when_idle, daemon=True)
+                self.flusher.start()
+            self.changed.notify()
+
+    def flush_when_idle(self):
+        # Background thread writing the changes once no update has come for flush_delay.
+        # The write happens outside the lock, so update() never waits for the disk.
+        while True:
+            with self.lock:
+                while self.flush_deadline is None or self.flush_deadline > time.monotonic():
+                    if self.flush_deadline is None:
+                        self.changed.wait()
+                    else:
+                        self.changed.wait(self.flush_deadline - time.monotonic())
+            self.flush()
+
+    def save(self, serial_number, settings):
+        # Immediate write
+        self.update(serial_number, settings)
+        self.flush()
+
+    def flush(self):
+        # Serialized, an older batch written after a newer one would overwrite it on disk
+        with self.flush_lock:
+            with self.lock:
+                self.flush_deadline = None
+                if not self.dirty:
+                    return
+                dirty, self.dirty = self.dirty, {}
+            try:
+                with FileLock(self.path):
+                    configs = read_json(self.path)
+                    for serial_number, changes in dirty.items():
+                        configs.setdefault(serial_number, {}).update(changes)
+                    write_json_atomic(self.path, configs)
+            except Exception as e:
+                print(f"Failed to save {self.path}: {e}")
+                with self.lock:
+                    # Keep the changes for the next flush, newer ones win
+                    for serial_number, changes in dirty.items():
+                        self.dirty[serial_number] = {**changes, **self.dirty.get(serial_number, {})}
+                return
+            with self.lock:
+                self.configs = configs
+                for serial_number, changes in self.dirty.items():
+                    self.configs.setdefault(serial_number, {}).update(changes)
+                self.mtime = os.path.getmtime(self.path)
+                self.flushes += 1
+
+    # Named profiles, each a list of saved versions per camera
+
+    def list_profiles(self, serial_number):
+        # {name: [{"version", "saved_at"}, ...]}
+        profiles = read_json(self.profiles_path).get(serial_number, {})
+        return {name: [{"version": entry["version"], "saved_at": entry["saved_at"]} for entry in versions]
+                for name, versions in profiles.items()}
+
+    def save_profile(self, serial_number, name, settings=None):
+        # Saves settings, or the camera's current ones, as a new version of the profile
+        if settings is None:
+            settings = self.load(serial_number)
+        with FileLock(self.profiles_path):
+            profiles = read_json(self.profiles_path)
+            versions = profiles.setdefault(serial_number, {}).setdefault(name, [])
+            version = versions[-1]["version"] + 1 if versions else 1
+            versions.append({"version": version, "saved_at": datetime.now().isoformat(timespec='seconds'), "settings": dict(settings)})
+            del versions[:-self.max_versions]
+            write_json_atomic(self.profiles_path, profiles)
+        return version
+
+    def load_profile(self, serial_number, name, version=None):
+        # Settings of a profile version, the latest by default
+        versions = read_json(self.profiles_path).get(serial_number, {}).get(name)
+        if not versions:
+            raise KeyError(f"No profile {name} for camera {serial_number}")
+        if version is None:
+            return dict(versions[-1]["settings"])
+        for entry in versions:
+            if entry["version"] == version:
+                return dict(entry["settings"])
+        raise KeyError(f"Profile {name} of camera {serial_number} has no version {version}")
+
+    def activate_profile(self, serial_number, name, version=None):
+        # Make a profile the camera's current settings, returns them
+        settings = self.load_profile(serial_number, name, version)
+        self.save(serial_number, settings)
+        return settings
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_store(path=CONFIG_FILE):
+    # One store per file and process, so every caller shares the cache and the pending changes
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = ConfigStore(path)
+        return _stores[path]
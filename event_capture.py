@@ -0,0 +1,300 @@
+import configparser
+import json
+import os
+import threading
+import time
+from collections import deque
+import numpy as np
+from camera_interface import CameraInterface, load_config, load_backend
+from frame_pool import FramePool
+from frame_writer import CODECS, DEFAULT_CODEC, FrameWriter, codec_path
+from metrics import get_metrics, start_exporter
+from preview import PIXEL_FORMAT_BITS
+
+# Detection and recording settings, change them in the [EventCapture] section of config.ini
+SETTINGS = {
+    "downsample": 4,  # Every downsample-th pixel of every downsample-th row is compared
+    "alpha": 0.05,  # Weight of each new frame in the running background
+    "pixel_threshold": 0.08,  # A pixel has changed when it differs from the background by this fraction of full scale
+    "threshold": 0.01,  # An event starts when this fraction of a region's pixels has changed
+    "warmup_frames": 10,  # Frames the background is built from before anything can trigger
+    "pre_trigger": 10,  # Frames saved from before the trigger
+    "post_trigger": 20,  # Frames saved after the last frame over the threshold
+    "rois": "",  # Regions to watch, "x,y,width,height" separated by ";", empty for the whole frame
+}
+
+def parse_rois(text):
+    # "x,y,width,height;..." to a list of (x, y, width, height), None for the whole frame
+    rois = [tuple(int(value) for value in part.split(",")) for part in text.split(";") if part.strip()]
+    for roi in rois:
+        if len(roi) != 4 or roi[2] <= 0 or roi[3] <= 0:
+            raise ValueError(f"Invalid region {roi}, use x,y,width,height")
+    return rois or None
+
+class ChangeDetector:
+    # Finds changes against a running background, kept per region of interest on a decimated
+    # grid. Every frame costs a strided view (no copy), one subtraction, one comparison and one
+    # in-place background update per region, all vectorized over preallocated float32 buffers,
+    # so the cost scales with the watched pixels divided by downsample squared.
+    def __init__(self, rois=None, downsample=None, alpha=None, pixel_threshold=None, threshold=None, warmup_frames=None, bit_depth=None):
+        self.rois = rois  # (x, y, width, height) in full resolution pixels, None for the whole frame
+        self.downsample = downsample or SETTINGS["downsample"]
+        self.alpha = alpha if alpha is not None else SETTINGS["alpha"]
+        self.pixel_threshold = pixel_threshold if pixel_threshold is not None else SETTINGS["pixel_threshold"]
+        self.threshold = threshold if threshold is not None else SETTINGS["threshold"]
+        self.warmup_frames = warmup_frames if warmup_frames is not None else SETTINGS["warmup_frames"]
+        self.bit_depth = bit_depth  # None to take it from the frame's dtype
+        self.shape = None
+        self.regions = []  # Per region: slices, background, difference and mask buffers
+        self.frames = 0
+
+    def reset(self):
+        self.shape = None
+        self.regions = []
+        self.frames = 0
+
+    def setup(self, frame):
+        height, width = frame.shape[:2]
+        step = self.downsample
+        self.regions = []
+        for x, y, roi_width, roi_height in self.rois or [(0, 0, width, height)]:
+            x0, y0 = max(0, x), max(0, y)
+            x1, y1 = min(width, x + roi_width), min(height, y + roi_height)
+            if x1 <= x0 or y1 <= y0:
+                raise ValueError(f"Region {(x, y, roi_width, roi_height)} is outside the {width}x{height} frame")
+            index = (slice(y0, y1, step), slice(x0, x1, step))
+            small = frame[index]
+            self.regions.append({
+                "index": index,
+                "background": small.astype(np.float32),
+                "difference": np.empty(small.shape, np.float32),
+                "mask": np.empty(small.shape, bool),
+            })
+        self.shape = frame.shape
+        max_value = (1 << (self.bit_depth or frame.dtype.itemsize * 8)) - 1
+        self.pixel_limit = self.pixel_threshold * max_value
+
+    def update(self, frame):
+        # Returns the fraction of changed pixels in every region, and whether any is over the threshold
+        if frame.shape != self.shape:
+            self.setup(frame)
+            self.frames = 1
+            return [0.0] * len(self.regions), False
+        scores = []
+        for region in self.regions:
+            small = frame[region["index"]]
+            background = region["background"]
+            difference = region["difference"]
+            np.subtract(small, background, out=difference)
+            np.abs(difference, out=difference)
+            np.greater(difference, self.pixel_limit, out=region["mask"])
+            scores.append(float(np.count_nonzero(region["mask"])) / difference.size)
+            # background += alpha * (small - background), reusing the difference buffer
+            np.subtract(small, background, out=difference)
+            difference *= self.alpha
+            background += difference
+        self.frames += 1
+        return scores, self.frames > self.warmup_frames and max(scores) > self.threshold
+
+class EventRecorder:
+    # Streams a continuously acquiring camera through a ChangeDetector. The last pre_trigger
+    # frames are held in a ring of FramePool leases; when a frame goes over the threshold they
+    # are saved with it and the next post_trigger frames (extended while the change goes on) at
+    # full resolution on a FrameWriter. Frames are dropped and counted rather than stalling
+    # the camera when the writer falls behind. Every event gets a line in
+    # <base name>_events.jsonl with its frames and peak score.
+    def __init__(self, cam, output_dir, detector, base_name="event", pre_trigger=None, post_trigger=None, codec=DEFAULT_CODEC,
+                 num_writers=2, backlog=64):
+        self.cam = cam
+        self.output_dir = output_dir
+        self.detector = detector
+        if detector.bit_depth is None:
+            # The frames' dtype is 16 bits for Mono12, which would put pixel_threshold out of reach
+            try:
+                detector.bit_depth = PIXEL_FORMAT_BITS.get(cam.get_property("PixelFormat"))
+            except Exception as e:
+                print(f"Failed to read PixelFormat, change detection takes full scale from the frames' data type: {e}")
+        self.base_name = base_name
+        self.pre_trigger = pre_trigger if pre_trigger is not None else SETTINGS["pre_trigger"]
+        self.post_trigger = post_trigger if post_trigger is not None else SETTINGS["post_trigger"]
+        self.codec = codec
+        self.writer = FrameWriter(codec=codec, max_workers=num_writers, write_latency=cam.write_latency)
+        # The ring, frames waiting for the writer and the one being grabbed hold a slot
+        self.pool = FramePool(num_slots=self.pre_trigger + backlog + 1)
+        self.ring = deque()
+        self.events_path = os.path.join(output_dir, f"{base_name}_events.jsonl")
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.error = None
+        self.event = None  # The event being recorded
+        self.event_start_drops = 0  # The pool's dropped frames when the event started
+        self.events = 0
+        self.frames_grabbed = 0
+        self.frames_saved = 0
+        self.incomplete_frames = 0
+        self.detect_latency = get_metrics().histogram("detect_latency_seconds", cam.serial_number)
+        self.events_counter = get_metrics().counter("events_total", cam.serial_number)
+
+    def start(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        # Stops grabbing, closes the event in progress and waits for its frames to be written
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+        if self.event is not None:
+            self.finish_event()
+        while self.ring:
+            self.ring.popleft().release()
+        self.writer.close()
+
+    def run(self):
+        frame_id = 0
+        while not self.stop_event.is_set():
+            pool_drops = self.pool.dropped_frames
+            try:
+                lease = self.cam.get_frame_into(self.pool, timeout=1000)
+            except self.cam.spin.SpinnakerException as e:
+                if "Stream has been aborted" in str(e):
+                    print("Stream aborted, restarting acquisition...")
+                    self.cam.restart_acquisition()
+                    continue
+                if "Failed waiting" in str(e):
+                    continue
+                self.error = e
+                break
+            except Exception as e:
+                self.error = e
+                break
+            if lease is None:
+                if self.pool.dropped_frames == pool_drops:
+                    self.incomplete_frames += 1  # Not a frame the pool had no room for, those are in dropped_frames
+                continue
+            lease.frame_id = frame_id
+            lease.timestamp = time.time()
+            frame_id += 1
+            self.frames_grabbed += 1
+            start_time = time.perf_counter()
+            scores, triggered = self.detector.update(lease.frame)
+            self.detect_latency.observe(time.perf_counter() - start_time)
+            self.handle(lease, scores, triggered)
+
+    def handle(self, lease, scores, triggered):
+        if triggered and self.event is None:
+            self.events += 1
+            self.events_counter.increment()
+            self.event = {"event": self.events, "start_time": lease.timestamp, "trigger_frame": lease.frame_id,
+                          "peak_score": 0.0, "frames": [], "dropped_frames": 0}
+            self.event_start_drops = self.pool.dropped_frames
+            print(f"Event {self.events} at frame {lease.frame_id}, {max(scores) * 100:.1f}% changed")
+            while self.ring:
+                self.save(self.ring.popleft())
+        if self.event is None:
+            self.ring.append(lease)
+            if len(self.ring) > self.pre_trigger:
+                self.ring.popleft().release()
+            return
+        event = self.event
+        event["peak_score"] = max(event["peak_score"], max(scores))
+        if triggered:
+            event["last_trigger"] = lease.frame_id
+        self.save(lease)
+        if lease.frame_id - event["last_trigger"] >= self.post_trigger:
+            self.finish_event()
+
+    def save(self, lease):
+        path = codec_path(os.path.join(self.output_dir, f"{self.base_name}{self.event['event']:04d}_{lease.frame_id:08d}"), self.codec)
+        try:
+            future = self.writer.submit(path, lease.frame)
+        except Exception as e:
+            print(f"Failed to save frame {lease.frame_id}: {e}")
+            lease.release()
+            return
+        future.add_done_callback(lambda done: lease.release())
+        self.event["frames"].append(os.path.basename(path))
+        self.frames_saved += 1
+
+    def finish_event(self):
+        event, self.event = self.event, None
+        event["end_time"] = time.time()
+        event["dropped_frames"] = self.pool.dropped_frames - self.event_start_drops
+        try:
+            with open(self.events_path, 'a') as f:
+                f.write(json.dumps(event) + "\n")
+        except Exception as e:
+            print(f"Failed to write to {self.events_path}: {e}")
+        print(f"Event {event['event']}: {len(event['frames'])} frames, peak {event['peak_score'] * 100:.1f}% changed")
+
+    def stats(self):
+        return {
+            "frames_grabbed": self.frames_grabbed,
+            "frames_saved": self.frames_saved,
+            "events": self.events,
+            "dropped_frames": self.pool.dropped_frames,
+            "incomplete_frames": self.incomplete_frames,
+        }
+
+def load_settings(path='config.ini'):
+    config = configparser.ConfigParser()
+    config.read(path)
+    if not config.has_section('EventCapture'):
+        return
+    for key, default in SETTINGS.items():
+        if config.has_option('EventCapture', key):
+            SETTINGS[key] = type(default)(config.get('EventCapture', key))
+
+load_settings()
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Event-triggered capture: saves frames only when the scene changes')
+    parser.add_argument('cam_id', type=int, help='Camera ID to use')
+    parser.add_argument('output_dir', type=str, help='Folder to write the events to')
+    parser.add_argument('--duration', type=float, default=60.0, help='Run time in seconds')
+    parser.add_argument('--roi', action='append', help='Region to watch as x,y,width,height, repeat for several (default: [EventCapture] rois, or the whole frame)')
+    parser.add_argument('--threshold', type=float, help='Fraction of changed pixels in a region that starts an event')
+    parser.add_argument('--pixel-threshold', type=float, help='Change of a pixel, as a fraction of full scale, that counts')
+    parser.add_argument('--downsample', type=int, help='Compare every n-th pixel of every n-th row')
+    parser.add_argument('--pre-trigger', type=int, help='Frames saved from before an event')
+    parser.add_argument('--post-trigger', type=int, help='Frames saved after an event')
+    parser.add_argument('--codec', choices=list(CODECS), default=DEFAULT_CODEC, help='File format and compression of the frames')
+    parser.add_argument('--base-name', type=str, default='event', help='Base file name for the frames')
+    parser.add_argument('--backend', choices=['spinnaker', 'simulated'], default='spinnaker', help='Camera backend to use')
+    args = parser.parse_args()
+
+    cam = None
+    start_exporter(f"event_capture-cam{args.cam_id}")
+    try:
+        rois = parse_rois(";".join(args.roi)) if args.roi else parse_rois(SETTINGS["rois"])
+        cam = CameraInterface(cam_id=args.cam_id, backend=load_backend(args.backend))
+        cam.apply_config(load_config(cam.serial_number))
+        detector = ChangeDetector(rois, downsample=args.downsample, pixel_threshold=args.pixel_threshold, threshold=args.threshold)
+        recorder = EventRecorder(cam, args.output_dir, detector, base_name=args.base_name, pre_trigger=args.pre_trigger,
+                                 post_trigger=args.post_trigger, codec=args.codec)
+        recorder.start()
+        try:
+            end_time = time.monotonic() + args.duration
+            while time.monotonic() < end_time and recorder.thread.is_alive():
+                time.sleep(0.1)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            recorder.stop()
+        if recorder.error:
+            raise recorder.error
+        stats = recorder.stats()
+        print(f"{stats['events']} events, {stats['frames_saved']} of {stats['frames_grabbed']} frames saved, "
+              f"dropped {stats['dropped_frames']}, incomplete {stats['incomplete_frames']}")
+    except Exception as e:
+        print(f'Event capture failed: {e}')
+    finally:
+        if cam:
+            try:
+                cam.stop_acquisition()
+            except Exception as e:
+                print(f'Failed to stop acquisition: {e}')
+            del cam
@@ -0,0 +1,60 @@
+# Emulates ServoControl.ino on a pseudo-terminal so the shutter code can be tested without an
+# Arduino. POSIX only. Connect to FakeArduino().port like to the board's serial port.
+import os
+import pty
+import threading
+import time
+import tty
+
+class FakeArduino:
+    def __init__(self, boot_time=0.1, step_delay=0.005):
+        self.boot_time = boot_time  # Time from reset to "Shutter Control Ready"
+        self.step_delay = step_delay  # delay(5) per servo step in the sketch
+        self.is_open = False
+        self.commands = []
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def println(self, message):
+        os.write(self.master, (message + "\r\n").encode())
+
+    def reset(self):
+        # The Uno resets whenever the port is opened; call this before connecting to emulate it
+        self.is_open = False
+        threading.Timer(self.boot_time, self.println, args=("Shutter Control Ready",)).start()
+
+    def sweep(self):
+        time.sleep(91 * self.step_delay)  # 91 servo positions, 0 to 90 degrees
+
+    def run(self):
+        time.sleep(self.boot_time)
+        self.println("Shutter Control Ready")
+        buffer = b""
+        while self.running:
+            try:
+                buffer += os.read(self.master, 64)
+            except OSError:
+                return
+            while b"\n" in buffer:
+                line, buffer = buffer.split(b"\n", 1)
+                command = line.decode(errors="replace")
+                self.commands.append(command)
+                if command == "OPEN" and not self.is_open:
+                    self.sweep()
+                    self.is_open = True
+                    self.println("Shutter Opened")
+                elif command == "CLOSE" and self.is_open:
+                    self.sweep()
+                    self.is_open = False
+                    self.println("Shutter Closed")
+                else:
+                    self.println("Shutter already open" if self.is_open else "Shutter already closed")
+
+    def stop(self):
+        self.running = False
+        os.close(self.master)
+        os.close(self.slave)
@@ -0,0 +1,131 @@
+import threading
+import time
+from collections import deque
+from frame_pool import FramePool
+
+class RateMeter:
+    # Events per second over a sliding window
+    def __init__(self, window=2.0):
+        self.window = window
+        self.times = deque()
+        self.lock = threading.Lock()
+
+    def tick(self):
+        with self.lock:
+            now = time.monotonic()
+            self.times.append(now)
+            self.trim(now)
+
+    def trim(self, now):
+        while self.times and now - self.times[0] > self.window:
+            self.times.popleft()
+
+    def rate(self):
+        with self.lock:
+            self.trim(time.monotonic())
+            if len(self.times) < 2:
+                return 0.0
+            return (len(self.times) - 1) / (self.times[-1] - self.times[0])
+
+class FrameGrabber:
+    # Grabs frames on a dedicated thread so slow consumers never hold up the camera stream.
+    # Frames go into a bounded queue; when it is full the oldest frame is dropped, so
+    # get_latest() always hands out the newest frame available.
+    def __init__(self, cam, queue_size=1, pool=None):
+        self.cam = cam
+        self.queue_size = queue_size
+        # One slot per queued frame, plus the one being grabbed and one held by the consumer
+        self.pool = pool if pool is not None else FramePool(num_slots=queue_size + 2)
+        self.queue = deque()
+        self.condition = threading.Condition()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.finished = False
+        self.error = None
+        self.frames_grabbed = 0
+        self.frames_replaced = 0
+        self.incomplete_frames = 0
+        self.pool_drops = 0  # Frames lost because every pool slot was taken
+        self.stream_restarts = 0
+        self.acquisition_rate = RateMeter()
+
+    def start(self):
+        self.stop_event.clear()
+        self.finished = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+        with self.condition:
+            while self.queue:
+                self.queue.popleft().release()
+
+    def is_alive(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def run(self):
+        pool_drops = self.pool.dropped_frames
+        while not self.stop_event.is_set():
+            try:
+                lease = self.cam.get_frame_into(self.pool)
+            except self.cam.spin.SpinnakerException as e:
+                if "Stream has been aborted" in str(e):
+                    self.stream_restarts += 1
+                    print(f"Stream aborted, restarting acquisition ({self.stream_restarts} restarts so far)...")
+                    time.sleep(0.5)
+                    try:
+                        self.cam.restart_acquisition()
+                    except Exception as restart_error:
+                        print(f"Failed to restart acquisition: {restart_error}")
+                    continue
+                self.error = e
+                break
+            except Exception as e:
+                self.error = e
+                break
+            if lease is None:
+                # No lease either for an incomplete frame or for one the pool had no slot for
+                if self.pool.dropped_frames == pool_drops:
+                    self.incomplete_frames += 1
+                else:
+                    self.pool_drops += self.pool.dropped_frames - pool_drops
+                pool_drops = self.pool.dropped_frames
+                continue
+            self.frames_grabbed += 1
+            self.acquisition_rate.tick()
+            with self.condition:
+                if len(self.queue) >= self.queue_size:
+                    self.queue.popleft().release()
+                    self.frames_replaced += 1
+                self.queue.append(lease)
+                self.condition.notify()
+        with self.condition:
+            self.finished = True
+            self.condition.notify_all()
+
+    def get_latest(self, timeout=None):
+        # Newest queued frame as a FrameLease the caller must release, or None on timeout
+        with self.condition:
+            if not self.queue:
+                self.condition.wait_for(lambda: self.queue or self.finished, timeout)
+            if not self.queue:
+                return None
+            lease = self.queue.pop()
+            while self.queue:
+                self.queue.popleft().release()
+                self.frames_replaced += 1
+            return lease
+
+    def stats(self):
+        return {
+            "frames_grabbed": self.frames_grabbed,
+            "frames_replaced": self.frames_replaced,
+            "incomplete_frames": self.incomplete_frames,
+            "pool_drops": self.pool_drops,
+            "stream_restarts": self.stream_restarts,
+            "acquisition_fps": self.acquisition_rate.rate(),
+            "pool": self.pool.stats(),
+        }
@@ -0,0 +1,104 @@
+import threading
+from collections import deque
+import numpy as np
+
+class FrameLease:
+    # A frame borrowed from a FramePool, call release() (or use it as a context manager) when done
+    def __init__(self, pool, slot, frame, frame_id=None, timestamp=None, image=None):
+        self.pool = pool
+        self.slot = slot
+        self.frame = frame
+        self.frame_id = frame_id
+        self.timestamp = timestamp
+        self.image = image  # Camera image backing a zero-copy lease, released with the lease
+        self.released = False
+
+    def release(self):
+        if self.released:
+            return
+        self.released = True
+        if self.image is not None:
+            self.image.Release()
+            self.image = None
+        self.frame = None
+        self.pool.return_slot(self.slot)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+class FramePool:
+    # A fixed ring of preallocated frame buffers. Frames are copied into a free slot once, or
+    # wrapped without copying, in which case the slot holds the camera buffer until released.
+    # When every slot is leased new frames are dropped instead of allocating more memory.
+    def __init__(self, num_slots=8, shape=None, dtype=np.uint8):
+        self.num_slots = num_slots
+        self.lock = threading.Lock()
+        self.free_slots = deque(range(num_slots))
+        self.buffers = None
+        self.shape = None
+        self.dtype = None
+        self.frames = 0
+        self.dropped_frames = 0
+        self.zero_copy_frames = 0
+        self.peak_in_use = 0
+        if shape is not None:
+            self.allocate(shape, dtype)
+
+    def allocate(self, shape, dtype):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.buffers = [np.empty(self.shape, self.dtype) for _ in range(self.num_slots)]
+
+    def take_slot(self):
+        with self.lock:
+            if not self.free_slots:
+                self.dropped_frames += 1
+                return None
+            slot = self.free_slots.popleft()
+            self.frames += 1
+            self.peak_in_use = max(self.peak_in_use, self.num_slots - len(self.free_slots))
+            return slot
+
+    def return_slot(self, slot):
+        with self.lock:
+            self.free_slots.append(slot)
+
+    def put(self, array, frame_id=None, timestamp=None):
+        # Copy a frame into a free slot, returns None (and counts a dropped frame) if the pool is exhausted
+        if array.shape != self.shape or array.dtype != self.dtype:
+            with self.lock:
+                if len(self.free_slots) != self.num_slots:
+                    self.dropped_frames += 1
+                    print(f"Frame shape {array.shape} {array.dtype} does not match the pool while frames are leased, dropping it")
+                    return None
+                self.allocate(array.shape, array.dtype)
+        slot = self.take_slot()
+        if slot is None:
+            return None
+        np.copyto(self.buffers[slot], array)
+        return FrameLease(self, slot, self.buffers[slot], frame_id, timestamp)
+
+    def wrap(self, image, frame_id=None, timestamp=None):
+        # Lease the camera image's own buffer without copying; the image is released with the lease
+        slot = self.take_slot()
+        if slot is None:
+            image.Release()
+            return None
+        with self.lock:
+            self.zero_copy_frames += 1
+        return FrameLease(self, slot, image.GetNDArray(), frame_id, timestamp, image=image)
+
+    def stats(self):
+        with self.lock:
+            in_use = self.num_slots - len(self.free_slots)
+            return {
+                "slots": self.num_slots,
+                "in_use": in_use,
+                "peak_in_use": self.peak_in_use,
+                "frames": self.frames,
+                "zero_copy_frames": self.zero_copy_frames,
+                "dropped_frames": self.dropped_frames,
+            }
@@ -0,0 +1,164 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import cv2
+from timelapse_store import TimelapseReader
+
+# Anomalies a frame can be flagged with
+UNREADABLE = "unreadable"  # The file is missing or can't be decoded
+INCOMPLETE = "incomplete"  # Rows at the end of the frame were never filled
+BLACK = "black"  # Next to no signal, the shutter or the light source failed
+SATURATED = "saturated"  # Too many pixels at full scale
+DIM = "dim"  # Much darker than the run so far, the shutter may not have been fully open
+BLURRED = "blurred"  # Much less detail than the run so far
+JUMP = "jump"  # Very different from the previous good frame
+
+# Anomalies worth another try within the same interval, the others won't go away by themselves
+RECAPTURE_FLAGS = (UNREADABLE, INCOMPLETE, BLACK, DIM)
+
+DEFAULT_THRESHOLDS = {
+    "black_mean": 0.01,  # Mean level below this fraction of full scale
+    "saturated_fraction": 0.01,
+    "incomplete_rows": 0.02,  # Fraction of all-zero rows at the end of the frame
+    "dim_ratio": 0.5,  # Mean below this fraction of the run's median
+    "blur_ratio": 0.3,  # Laplacian variance below this fraction of the run's median
+    "jump_difference": 0.25,  # Mean absolute difference from the previous good frame, fraction of full scale
+}
+BASELINE_FRAMES = 10  # Recent good frames the run's medians are taken over
+DIFFERENCE_STRIDE = 4  # The previous frame is kept decimated by this much for the difference
+
+class QCResult:
+    def __init__(self, capture, attempt, path, frame_index, stats, flags, metadata=None):
+        self.capture = capture  # Index of the capture in the run
+        self.attempt = attempt  # 0 for the scheduled capture, 1 and up for re-captures
+        self.path = path
+        self.frame_index = frame_index  # Position in an HDF5 container, None for image files
+        self.stats = stats
+        self.flags = flags
+        self.metadata = metadata or {}  # Recorded with the result, like the shutter timing
+
+    @property
+    def needs_recapture(self):
+        return any(flag in RECAPTURE_FLAGS for flag in self.flags)
+
+    def to_json(self):
+        return {"capture": self.capture, "attempt": self.attempt, "path": self.path, "frame_index": self.frame_index,
+                "time": time.time(), "flags": self.flags, **self.stats, **self.metadata}
+
+def load_frame(path, frame_index=None):
+    if frame_index is None and path.endswith(".npy"):
+        return np.load(path, allow_pickle=False)
+    if frame_index is None:
+        frame = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+        if frame is None:
+            raise Exception(f"Could not read {path}")
+        return frame
+    with TimelapseReader(path) as reader:
+        return reader[frame_index]
+
+def full_scale(frame, bit_depth=None):
+    return (1 << (bit_depth or frame.dtype.itemsize * 8)) - 1
+
+def frame_statistics(frame, bit_depth=None):
+    # Whole-frame statistics, levels as fractions of full scale. Each is one OpenCV or numpy
+    # pass over the frame; the Laplacian variance measures focus and motion blur.
+    max_value = full_scale(frame, bit_depth)
+    filled_rows = np.flatnonzero(frame.max(axis=1))
+    empty_tail = frame.shape[0] - (filled_rows[-1] + 1 if filled_rows.size else 0)
+    _, deviation = cv2.meanStdDev(cv2.Laplacian(frame, cv2.CV_32F))
+    return {
+        "mean": cv2.mean(frame)[0] / max_value,
+        "saturated_fraction": cv2.countNonZero(cv2.compare(frame, max_value, cv2.CMP_GE)) / frame.size,
+        "sharpness": float(deviation[0][0] / max_value) ** 2,
+        "incomplete_rows": empty_tail / frame.shape[0],
+    }
+
+class FrameQC:
+    # Checks captured frames on a pool of worker threads, so the capture thread only pays for
+    # submit(). Every capture attempt gets a line in the run index (JSON lines next to the
+    # frames) with its statistics and flags. Frames are compared with the run's recent good
+    # frames, so a slowly changing sample isn't flagged, a sudden failure is.
+    def __init__(self, index_path, bit_depth=None, thresholds=None, max_workers=2, on_anomaly=None):
+        self.index_path = index_path
+        self.bit_depth = bit_depth  # None to take it from the frame's dtype
+        self.thresholds = {**DEFAULT_THRESHOLDS, **(thresholds or {})}
+        self.on_anomaly = on_anomaly  # Called with the QCResult of every flagged frame, on a worker thread
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="frame-qc")
+        self.lock = threading.Lock()  # Baselines and previous frame
+        self.index_lock = threading.Lock()
+        self.means = deque(maxlen=BASELINE_FRAMES)
+        self.sharpness = deque(maxlen=BASELINE_FRAMES)
+        self.previous = None
+        self.checked = 0
+        self.flagged = 0
+
+    def submit(self, capture, path, frame_index=None, attempt=0, metadata=None):
+        # Returns a Future resolved with the QCResult
+        return self.executor.submit(self.check, capture, attempt, path, frame_index, metadata)
+
+    def check(self, capture, attempt, path, frame_index, metadata=None):
+        start_time = time.perf_counter()
+        try:
+            frame = load_frame(path, frame_index)
+            if frame.ndim == 3:
+                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            stats = frame_statistics(frame, self.bit_depth)
+        except Exception as e:
+            return self.finish(QCResult(capture, attempt, path, frame_index, {"error": str(e)}, [UNREADABLE], metadata))
+
+        thresholds = self.thresholds
+        flags = []
+        if stats["incomplete_rows"] > thresholds["incomplete_rows"]:
+            flags.append(INCOMPLETE)
+        if stats["mean"] < thresholds["black_mean"]:
+            flags.append(BLACK)
+        if stats["saturated_fraction"] > thresholds["saturated_fraction"]:
+            flags.append(SATURATED)
+        small = frame[::DIFFERENCE_STRIDE, ::DIFFERENCE_STRIDE].copy()
+        stats["difference"] = None
+        with self.lock:
+            if self.previous is not None and self.previous.shape == small.shape:
+                stats["difference"] = cv2.mean(cv2.absdiff(small, self.previous))[0] / full_scale(frame, self.bit_depth)
+            # A black frame has no detail and differs from everything, only the black flag says something
+            if BLACK not in flags:
+                if self.means and stats["mean"] < thresholds["dim_ratio"] * float(np.median(self.means)):
+                    flags.append(DIM)
+                if self.sharpness and stats["sharpness"] < thresholds["blur_ratio"] * float(np.median(self.sharpness)):
+                    flags.append(BLURRED)
+                if stats["difference"] is not None and stats["difference"] > thresholds["jump_difference"]:
+                    flags.append(JUMP)
+            if set(flags) <= {JUMP}:
+                # Good frames set the baseline; a jump too, as the scene may really have changed
+                self.means.append(stats["mean"])
+                self.sharpness.append(stats["sharpness"])
+                self.previous = small
+        stats["seconds"] = time.perf_counter() - start_time
+        return self.finish(QCResult(capture, attempt, path, frame_index, stats, flags, metadata))
+
+    def finish(self, result):
+        with self.index_lock:
+            self.checked += 1
+            try:
+                directory = os.path.dirname(self.index_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(self.index_path, 'a') as f:
+                    f.write(json.dumps(result.to_json()) + "\n")
+            except Exception as e:
+                print(f"Failed to write to the run index {self.index_path}: {e}")
+            if result.flags:
+                self.flagged += 1
+        if result.flags and self.on_anomaly:
+            try:
+                self.on_anomaly(result)
+            except Exception as e:
+                print(f"Anomaly handler failed: {e}")
+        return result
+
+    def close(self):
+        # Waits for the frames already submitted
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,87 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import cv2
+
+# Lossless formats a frame can be saved in: extension and OpenCV parameters. cv2.imwrite's
+# own default for TIFF is LZW, so tiff-lzw writes the same files as before.
+CODECS = {
+    "tiff": (".tiff", [cv2.IMWRITE_TIFF_COMPRESSION, 1]),  # Uncompressed, the fastest to write and read
+    "tiff-lzw": (".tiff", [cv2.IMWRITE_TIFF_COMPRESSION, 5]),
+    "tiff-deflate": (".tiff", [cv2.IMWRITE_TIFF_COMPRESSION, 8]),
+    "png": (".png", [cv2.IMWRITE_PNG_COMPRESSION]),  # Followed by the level, 0 to 9
+    "npy": (".npy", None),  # Raw numpy array, no encoding at all
+}
+DEFAULT_CODEC = "tiff-lzw"
+DEFAULT_PNG_LEVEL = 1  # Most of the size reduction of higher levels at a fraction of the time
+
+def codec_path(path, codec):
+    # path with the codec's extension
+    extension = CODECS[codec][0]
+    root, current = os.path.splitext(path)
+    return path if current.lower() in (extension, ".tif" if extension == ".tiff" else extension) else root + extension
+
+def write_frame(path, frame, codec=DEFAULT_CODEC, level=None):
+    # Writes the frame to path as given, returns the size of the file
+    if codec not in CODECS:
+        raise Exception(f"Unknown codec {codec}, use one of {list(CODECS)}")
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    _, params = CODECS[codec]
+    if params is None:
+        with open(path, 'wb') as f:
+            np.save(f, frame, allow_pickle=False)
+    else:
+        if codec == "png":
+            params = params + [DEFAULT_PNG_LEVEL if level is None else level]
+        if not cv2.imwrite(path, frame, params):
+            raise Exception(f"cv2.imwrite could not write {path}")
+    return os.path.getsize(path)
+
+class FrameWriter:
+    # Encodes and saves frames on a pool of worker threads, so the camera is free for the next
+    # frame while the last one is compressed and flushed. OpenCV and file writes release the
+    # GIL, so threads encode in parallel without copying frames to other processes.
+    # submit() returns a Future resolved with (path, bytes written); the frame must not be
+    # changed until it is done. write_latency, a metrics Histogram, gets the encode and write
+    # time of every frame.
+    def __init__(self, codec=DEFAULT_CODEC, level=None, max_workers=2, write_latency=None):
+        if codec not in CODECS:
+            raise Exception(f"Unknown codec {codec}, use one of {list(CODECS)}")
+        self.codec = codec
+        self.level = level
+        self.write_latency = write_latency
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="frame-writer")
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.frames_written = 0
+        self.bytes_written = 0
+
+    def submit(self, path, frame, codec=None, level=None):
+        # path gets the codec's extension if it has another one
+        codec = codec or self.codec
+        path = codec_path(path, codec)
+        with self.lock:
+            self.pending += 1
+        return self.executor.submit(self.write, path, frame, codec, self.level if level is None else level)
+
+    def write(self, path, frame, codec, level):
+        start_time = time.perf_counter()
+        try:
+            size = write_frame(path, frame, codec, level)
+        finally:
+            with self.lock:
+                self.pending -= 1
+        if self.write_latency is not None:
+            self.write_latency.observe(time.perf_counter() - start_time)
+        with self.lock:
+            self.frames_written += 1
+            self.bytes_written += size
+        return path, size
+
+    def close(self, wait=True):
+        # Waits for the frames already submitted unless wait is False
+        self.executor.shutdown(wait=wait)
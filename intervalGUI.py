@@ -1,32 +1,26 @@
-import gc
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-import subprocess
-import time
 import threading
-import os
-import psutil
-from datetime import datetime
-import serial
-import configparser
 import argparse
+from interval_scheduler import OVERRUN_POLICIES
+from interval_engine import IntervalRun, IntervalEngine, DEFAULT_SETTINGS, OUTPUT_FORMATS, connect_arduino, journal_path, unfinished_run
+from frame_writer import CODECS
+from metrics import start_exporter
+from run_journal import read_journal
 
 class IntervalCaptureApp:
-    def __init__(self, root, cam_id):
-        # Initialization code (unchanged)
-        self.max_retries = 5
-        self.initial_retry_sleep_time = 1  # Initial sleep time before the first retry (in seconds)
-        self.max_retry_sleep_time = 30  # Maximum sleep time between retries (in seconds)
-
-
+    def __init__(self, root, cam_id, backend='spinnaker'):
+        # The captures themselves run in an IntervalEngine, this window only edits the settings
+        # and shows the progress, which it polls on the Tk thread
         self.root = root
         self.root.title(f"Interval Capture - Camera {cam_id}")
 
         self.cam_id = cam_id
+        self.backend = backend
+        self.run = None  # IntervalRun of the experiment in progress or last run
+        self.engine = None
+        self.engine_thread = None
         self.is_running = False
-        self.image_count = 0
-        self.total_images = 0
-        self.captured_images = 0
         self.manual_shutter_control = False
 
         self.interval_var = tk.DoubleVar(value=1.0)
@@ -34,13 +28,13 @@ class IntervalCaptureApp:
         self.laser_shutter_var = tk.DoubleVar(value=1.0)
         self.output_dir = tk.StringVar(value='./output')
         self.base_name = tk.StringVar(value='image_')
-
-        # Load config
-        self.config = configparser.ConfigParser()
-        self.config.read('config.ini')
+        self.output_format = tk.StringVar(value=OUTPUT_FORMATS[0])
+        self.codec = tk.StringVar(value=DEFAULT_SETTINGS["codec"])
+        self.overrun_policy = tk.StringVar(value=OVERRUN_POLICIES[0])
+        self.recapture_var = tk.BooleanVar(value=True)
 
         # Initialize Arduino
-        self.serial_conn = self.initialize_arduino()
+        self.serial_conn = connect_arduino(cam_id)
         if not self.serial_conn:
             messagebox.showerror("Arduino Error", "Failed to initialize Arduino. Please check the connection.")
 
@@ -72,13 +66,30 @@ class IntervalCaptureApp:
         self.base_name_entry = ttk.Entry(root, textvariable=self.base_name, width=40)
         self.base_name_entry.grid(row=4, column=1, pady=5, padx=5, sticky=tk.W)
 
+        # Output format
+        ttk.Label(root, text="Output Format:").grid(row=5, column=0, sticky=tk.W)
+        self.output_format_box = ttk.Combobox(root, textvariable=self.output_format, values=OUTPUT_FORMATS, state="readonly", width=37)
+        self.output_format_box.grid(row=5, column=1, pady=5, padx=5, sticky=tk.W)
+        # How TIFF files are compressed, or PNG or raw numpy files instead
+        self.codec_box = ttk.Combobox(root, textvariable=self.codec, values=list(CODECS), state="readonly", width=12)
+        self.codec_box.grid(row=5, column=2, pady=5, padx=5, sticky=tk.W)
+
+        # What to do when a capture runs into the next interval
+        ttk.Label(root, text="When a Capture Overruns:").grid(row=6, column=0, sticky=tk.W)
+        self.overrun_policy_box = ttk.Combobox(root, textvariable=self.overrun_policy, values=OVERRUN_POLICIES, state="readonly", width=37)
+        self.overrun_policy_box.grid(row=6, column=1, pady=5, padx=5, sticky=tk.W)
+
+        # Frames are checked in the background; black, dim or incomplete ones can be taken again
+        self.recapture_check = ttk.Checkbutton(root, text="Re-capture frames that fail the quality check", variable=self.recapture_var)
+        self.recapture_check.grid(row=7, column=0, columnspan=2, pady=5, padx=5, sticky=tk.W)
+
         # Progress indicator
         self.progress_label = ttk.Label(root, text="Captured 0 of 0 images")
-        self.progress_label.grid(row=5, column=0, columnspan=3, pady=5, padx=5)
+        self.progress_label.grid(row=8, column=0, columnspan=3, pady=5, padx=5)
 
         # Button frame
         self.button_frame = ttk.Frame(root)
-        self.button_frame.grid(row=6, column=0, columnspan=3, pady=5, padx=5)
+        self.button_frame.grid(row=9, column=0, columnspan=3, pady=5, padx=5)
 
         # Start and stop buttons
         self.start_button = ttk.Button(self.button_frame, text="Start", command=self.start_capture)
@@ -106,152 +117,121 @@ class IntervalCaptureApp:
         if directory:
             self.output_dir.set(directory)
 
-    def initialize_arduino(self):
-        try:
-            port = self.config.get('Arduino', 'PORT_ARDUINO_ONE') if self.cam_id == 0 else self.config.get('Arduino', 'PORT_ARDUINO_TWO')
-            baudrate = self.config.getint('Arduino', 'BAUDRATE')
-            ser = serial.Serial(port, baudrate, timeout=1)
-            time.sleep(2)  # Wait for the serial connection to initialize
-            print('Arduino initialized')
-            return ser
-        except Exception as e:
-            print(f"Arduino initialization failed: {e}")
-            return None
-
     def send_command(self, command):
-        try:
-            self.serial_conn.write((command + '\n').encode())
-            time.sleep(1)  # Give Arduino time to process the command
-            response = self.serial_conn.readline().decode().strip()
-            return response
-        except Exception as e:
-            print(f"Failed to send command to Arduino: {e}")
-            return None
+        # Returns as soon as the Arduino acknowledges the command, None if it doesn't
+        return self.serial_conn.command(command)
+
+    def run_settings(self):
+        return {
+            "cam_id": self.cam_id,
+            "interval": self.interval_var.get(),
+            "duration": self.duration_var.get(),
+            "laser_shutter_time": self.laser_shutter_var.get(),
+            "output_dir": self.output_dir.get(),
+            "base_name": self.base_name.get(),
+            "output_format": self.output_format.get(),
+            "codec": self.codec.get(),
+            "overrun_policy": self.overrun_policy.get(),
+            "recapture": self.recapture_var.get(),
+        }
+
+    def show_settings(self, settings):
+        self.interval_var.set(settings["interval"])
+        self.duration_var.set(settings["duration"])
+        self.laser_shutter_var.set(settings["laser_shutter_time"])
+        self.output_dir.set(settings["output_dir"])
+        self.base_name.set(settings["base_name"])
+        self.output_format.set(settings["output_format"])
+        self.codec.set(settings["codec"])
+        self.overrun_policy.set(settings["overrun_policy"])
+        self.recapture_var.set(settings["recapture"])
 
     def start_capture(self):
+        if self.run is not None and not self.run.finished:
+            messagebox.showinfo("Busy", "The stopped run is still finishing its last capture, try again in a moment.")
+            return
         try:
-            interval = self.interval_var.get()
-            duration = self.duration_var.get()
-            self.laser_shutter_time = self.laser_shutter_var.get()  # Set initial laser shutter time
-            if interval <= 0 or duration <= 0 or self.laser_shutter_time <= 0:
-                raise ValueError("Interval, duration, and laser shutter exposure must be greater than zero.")
-
-            self.is_running = True
-            self.image_count = 0
-            self.total_images = int(duration * 60 / interval)
-            self.captured_images = 0
-
-            self.start_button.state(["disabled"])
-            self.stop_button.state(["!disabled"])
-
-            self.progress_label.config(text=f"Captured {self.captured_images} of {self.total_images} images")
-            self.set_indicator("green")
-
-            # Start the interval capture
-            self.capture_thread = threading.Thread(target=self.interval_capture, args=(interval,))
-            self.capture_thread.start()
-
-        except ValueError as e:
+            settings = self.run_settings()
+            state = unfinished_run(settings)
+            if state is not None:
+                answer = messagebox.askyesnocancel(
+                    "Resume Run", f"An earlier run into {journal_path(settings)} was not finished, {state.captured} of {state.total} "
+                    "images captured.\n\nResume it with its own settings? No starts a new run.")
+                if answer is None:
+                    return
+                if answer:
+                    self.start_run(IntervalRun.resume(state, self.backend, self.serial_conn))
+                    return
+            self.start_run(IntervalRun(settings, self.backend, self.serial_conn))
+        except (ValueError, tk.TclError) as e:
             messagebox.showerror("Invalid Input", str(e))
 
+    def resume_from_journal(self, path):
+        # For --resume, picks up a run without any input, e.g. when started again after a reboot
+        try:
+            state = read_journal(path)
+        except Exception as e:
+            print(f"Failed to read the run journal {path}: {e}")
+            return
+        if state is None or not state.resumable:
+            print(f"Nothing to resume in {path}")
+            return
+        self.start_run(IntervalRun.resume(state, self.backend, self.serial_conn))
+
+    def start_run(self, run):
+        if self.run is not None:
+            run.capture_client, self.run.capture_client = self.run.capture_client, None  # Keep the capture server connection
+        self.run = run
+        self.show_settings(run.settings)
+        self.engine = IntervalEngine([run])
+        self.is_running = True
+        self.start_button.state(["disabled"])
+        self.stop_button.state(["!disabled"])
+        self.set_indicator("green")
+        self.update_progress()
+        self.engine_thread = threading.Thread(target=self.engine.run)
+        self.engine_thread.start()
+        self.root.after(500, self.poll_progress, run)
+
     def stop_capture(self):
         self.is_running = False
+        if self.engine:
+            self.engine.stop()  # Wakes the engine immediately instead of at the next deadline
         self.start_button.state(["!disabled"])
         self.stop_button.state(["disabled"])
         self.set_indicator("red")
-        self.progress_label.config(text=f"Capture stopped, {self.captured_images} pictures captured")
+        captured = self.run.captured_images if self.run else 0
+        self.progress_label.config(text=f"Capture stopped, {captured} pictures captured")
         print("Capture stopped by user.")
 
-    def interval_capture(self, interval):
-        while self.is_running and self.captured_images < self.total_images:
-            start_time = time.time()
-            self.manage_shutter_and_capture()
-            self.captured_images += 1
-            self.progress_label.config(text=f"Captured {self.captured_images} of {self.total_images} images")
-            elapsed_time = time.time() - start_time
-            sleep_time = max(0, interval * 60 - elapsed_time)
-            # Adjust for interval in minutes
-            for _ in range(int(sleep_time)):
-                if self.is_running:
-                    time.sleep(1)
-                else:
-                    print("Capture process interrupted by stop request.")
-                    break
-        if self.captured_images >= self.total_images:
-            self.progress_label.config(text=f"Experiment Complete, {self.captured_images} pictures captured")
-        if not self.is_running:
-            self.progress_label.config(text=f"Capture stopped, {self.captured_images} pictures captured")
-
-    def manage_shutter_and_capture(self):
-        delay_before_capture = self.laser_shutter_time - 1
-
-        if delay_before_capture <= 0:
-            delay_before_capture = 0
-
-        if self.serial_conn:
-            # Open the laser shutter
-            self.send_command("OPEN")
-            # Delay to let the laser expose
-            time.sleep(delay_before_capture)
-        else:
-            print("Arduino connection not available, skipping the shutter control.")
-    
-        # Capture image with retry logic
-        self.capture_single_image()
-
-        if self.serial_conn:
-            # Close the laser shutter
-            self.send_command("CLOSE")
+    def poll_progress(self, run):
+        if run is not self.run:
+            return  # A new run has its own polling
+        if not run.finished:
+            if self.is_running:
+                self.update_progress()
+            self.root.after(500, self.poll_progress, run)
+            return
+        if self.is_running:
+            self.is_running = False
+            self.progress_label.config(text=f"Experiment Complete, {run.captured_images} pictures captured")
+            self.start_button.state(["!disabled"])
+            self.stop_button.state(["disabled"])
+            self.set_indicator("red")
 
-    def capture_single_image(self):
-        timestamp = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
-        file_name = f"{self.base_name.get()}_{timestamp}.tiff"
-        filepath = os.path.join(self.output_dir.get(), file_name)
-
-        retry_sleep_time = self.initial_retry_sleep_time
-        for attempt in range(1, self.max_retries + 1):
-            # Check available memory
-            memory_info = psutil.virtual_memory()
-            if memory_info.available < 100 * 1024 * 1024:  # Less than 100MB available
-                print(f"Memory low, waiting {retry_sleep_time} seconds before retrying...")
-                time.sleep(retry_sleep_time)
-                retry_sleep_time = min(retry_sleep_time * 2, self.max_retry_sleep_time)
-                continue
-
-            try:
-                result = subprocess.run(
-                    ['python3.10', 'imageCap.py', str(self.cam_id), filepath],
-                    check=True,  # This ensures that an exception is raised for non-zero exit codes.
-                    capture_output=True,  # This captures stdout and stderr if needed.
-                    text=True
-                )
-                print("Image captured successfully.")
-                if os.path.isfile(filepath):
-                    print(f'Image {filepath} captured successfully.')
-                    break  # Break the loop if the capture was successful
-            except subprocess.CalledProcessError as e:  # Specific error handling
-                if "Spinnaker::Exception" in e.stderr:
-                    print(f"Ignoring known issue on attempt {attempt}: {e.stderr.splitlines()[0]}")
-                    if os.path.isfile(filepath):
-                        print(f'Image {filepath} captured successfully despite the error.')
-                        break  # Break the loop if the image file exists
-                    else:
-                        print('Capture failed, but ignoring as per request.')
-                        break
-            except Exception as e:  # Other exceptions
-                print(f"Attempt {attempt} failed: {str(e)}")
-                if attempt >= self.max_retries:
-                    print(f"Capture failed after {attempt} attempts. Moving to next capture or stopping if this is the last one.")
-                else:
-                    print(f"Retrying capture ({attempt}/{self.max_retries}) after error: {str(e)}")
-                gc.collect()
-                print(f"Waiting {retry_sleep_time} seconds before retrying...")
-                time.sleep(retry_sleep_time)  # Wait briefly before retrying
-                retry_sleep_time = min(retry_sleep_time * 2, self.max_retry_sleep_time)  # Exponential backoff, capped at max_retry_sleep_time
+    def update_progress(self):
+        run = self.run
+        flagged = f", {run.flagged_images} flagged" if run.flagged_images else ""
+        self.progress_label.config(text=f"Captured {run.captured_images} of {run.total_images} images{flagged}")
 
     def update_laser_shutter_time(self, *args):
-        # Update the laser shutter time
-        self.laser_shutter_time = self.laser_shutter_var.get()
+        # Changes to the laser shutter time apply to the run in progress from its next capture
+        try:
+            laser_shutter_time = self.laser_shutter_var.get()
+        except tk.TclError:
+            return  # Not a number while it is being typed
+        if self.run is not None and self.is_running and laser_shutter_time > 0:
+            self.run.laser_shutter_time = laser_shutter_time
 
     def manual_open_shutter(self):
         if self.serial_conn and not self.is_running:
@@ -268,17 +248,30 @@ class IntervalCaptureApp:
 
     def on_closing(self):
         if self.is_running:
-            if messagebox.askokcancel("Quit", "Interval capture is running. Are you sure you want to quit?"):
-                self.stop_capture()
-                self.root.destroy()
-        else:
-            self.root.destroy()
+            if not messagebox.askokcancel("Quit", "Interval capture is running. Are you sure you want to quit?"):
+                return
+            self.stop_capture()
+        if self.run is not None:
+            # The capture in progress finishes and the run is journaled as stopped before the
+            # capture server is shut down; the process waits for this thread after the window is gone
+            threading.Thread(target=self.close_when_finished).start()
+        self.root.destroy()
+
+    def close_when_finished(self):
+        if self.engine_thread is not None:
+            self.engine_thread.join()
+        self.run.close_capture_client(shutdown_server=True)
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Interval Capture GUI')
     parser.add_argument('cam_id', type=int, help='Camera ID to use')
+    parser.add_argument('--backend', choices=['spinnaker', 'simulated'], default='spinnaker', help='Camera backend to use')
+    parser.add_argument('--resume', metavar='JOURNAL', help='Resume the unfinished run in this run journal')
     args = parser.parse_args()
 
+    start_exporter(f"intervalGUI-cam{args.cam_id}")
     root = tk.Tk()
-    app = IntervalCaptureApp(root, args.cam_id)
+    app = IntervalCaptureApp(root, args.cam_id, backend=args.backend)
+    if args.resume:
+        root.after(0, app.resume_from_journal, args.resume)
     root.mainloop()
\ No newline at end of file
@@ -0,0 +1,447 @@
+import concurrent.futures
+import configparser
+import gc
+import json
+import os
+import signal
+import threading
+import time
+from datetime import datetime
+import psutil
+import capture_server
+from capture_server import CaptureError
+from frame_qc import FrameQC
+from frame_writer import CODECS, DEFAULT_CODEC, codec_path
+from interval_scheduler import IntervalScheduler, MultiScheduler, OVERRUN_POLICIES, SKIP
+from metrics import get_metrics, start_exporter
+from preview import PIXEL_FORMAT_BITS
+import run_journal
+from run_journal import RunJournal, read_journal
+from shutter_broker import connect_shutter
+
+# TIFF writes one file per capture, HDF5 appends every capture of a run to one container
+OUTPUT_FORMATS = ["TIFF files", "HDF5 container"]
+
+# An experiment spec is a JSON object with these settings, and a "cameras" list of objects
+# with a cam_id each and any of the settings to override for that camera, plus
+# "camera_settings" ({"ExposureTime": 20000.0, ...}) written to the camera before the run and
+# "shutter": false for a camera without one, or "shutter_port" for the serial port of its
+# Arduino. "{cam_id}" in output_dir or base_name is replaced with the camera's ID.
+DEFAULT_SETTINGS = {
+    "interval": 1.0,  # Minutes between captures
+    "duration": 1.0,  # Hours
+    "laser_shutter_time": 1.0,  # Seconds the sample is exposed to the laser per capture
+    "output_dir": "./output",
+    "base_name": "image_",
+    "output_format": OUTPUT_FORMATS[0],
+    "codec": DEFAULT_CODEC,  # How image files are saved, see frame_writer.CODECS
+    "overrun_policy": OVERRUN_POLICIES[0],
+    "recapture": True,  # Re-capture frames that fail the quality check
+}
+
+def load_spec(path):
+    # Returns the settings of every camera in the experiment spec
+    # Not read_json, which returns {} for a missing file and moves an invalid one aside: a
+    # mistyped spec must stop the run rather than start the default experiment
+    if not os.path.exists(path):
+        raise Exception(f"Experiment spec {path} does not exist")
+    try:
+        with open(path) as f:
+            spec = json.load(f)
+    except ValueError as e:
+        raise Exception(f"Experiment spec {path} is not valid JSON: {e}")
+    if not spec:
+        raise Exception(f"Experiment spec {path} is empty")
+    shared = {**DEFAULT_SETTINGS, **{key: value for key, value in spec.items() if key != "cameras"}}
+    cameras = spec.get("cameras") or [{"cam_id": 0}]
+    runs = []
+    for camera in cameras:
+        settings = {**shared, **camera}
+        settings["output_dir"] = settings["output_dir"].replace("{cam_id}", str(settings["cam_id"]))
+        settings["base_name"] = settings["base_name"].replace("{cam_id}", str(settings["cam_id"]))
+        runs.append(settings)
+    paths = [(settings["output_dir"], settings["base_name"]) for settings in runs]
+    if len(set(paths)) < len(paths):
+        raise Exception("Cameras share an output folder and base name, use {cam_id} in output_dir or base_name")
+    return runs
+
+def validate(settings):
+    if settings["interval"] <= 0 or settings["duration"] <= 0 or settings["laser_shutter_time"] <= 0:
+        raise ValueError("Interval, duration, and laser shutter exposure must be greater than zero.")
+    if settings["output_format"] not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format {settings['output_format']}, use one of {OUTPUT_FORMATS}")
+    if settings["codec"] not in CODECS:
+        raise ValueError(f"Unknown codec {settings['codec']}, use one of {list(CODECS)}")
+    if settings["overrun_policy"] not in OVERRUN_POLICIES:
+        raise ValueError(f"Unknown overrun policy {settings['overrun_policy']}, use one of {OVERRUN_POLICIES}")
+
+def journal_path(settings):
+    return os.path.join(settings["output_dir"], f"{settings['base_name']}_journal.jsonl")
+
+def unfinished_run(settings, log=print):
+    # RunState of the last run in the settings' output folder and base name, if it can be resumed
+    path = journal_path(settings)
+    if not os.path.isfile(path):
+        return None
+    try:
+        state = read_journal(path)
+    except Exception as e:
+        log(f"Failed to read the run journal {path}: {e}")
+        return None
+    if state is None or not state.resumable:
+        return None
+    return state
+
+# Options of the [Arduino] section with the shutter ports of cameras 0 and 1, as in main.py
+ARDUINO_PORT_OPTIONS = {0: 'PORT_ARDUINO_ONE', 1: 'PORT_ARDUINO_TWO'}
+
+def connect_arduino(cam_id, config_path='config.ini', log=print, port=None):
+    # The shutter is on port if given, else on PORT_CAM<ID> of the [Arduino] section, else on
+    # camera 0 and 1's own ports. Other cameras don't share a port by default.
+    try:
+        config = configparser.ConfigParser()
+        config.read(config_path)
+        if port is None:
+            option = f'PORT_CAM{cam_id}' if config.has_option('Arduino', f'PORT_CAM{cam_id}') else ARDUINO_PORT_OPTIONS.get(cam_id)
+            if option is None:
+                raise Exception(f'No shutter port for camera {cam_id}, set "shutter_port" in the spec or PORT_CAM{cam_id} in the [Arduino] section of {config_path}')
+            port = config.get('Arduino', option)
+        baudrate = config.getint('Arduino', 'BAUDRATE')
+        # Shares the Arduino connection with the main GUI through the port's shutter broker
+        shutter = connect_shutter(port, baudrate)
+        log('Arduino initialized')
+        return shutter
+    except Exception as e:
+        log(f"Arduino initialization failed: {e}")
+        return None
+
+class IntervalRun:
+    # One camera's interval experiment, without any GUI: the shutter-timed captures with their
+    # retries, the background quality check with re-captures, and the run journal. The
+    # schedule itself is run by an IntervalEngine, together with the other cameras'.
+    # Progress is in captured_images, flagged_images and total_images, for a GUI to poll.
+    def __init__(self, settings, backend='spinnaker', shutter=None, log=print):
+        self.settings = {**DEFAULT_SETTINGS, **settings}
+        validate(self.settings)
+        self.cam_id = self.settings["cam_id"]
+        self.backend = backend
+        self.serial_conn = shutter  # ShutterController or broker client, None without a shutter
+        self.log = log
+        self.max_retries = 5
+        self.initial_retry_sleep_time = 1  # Initial sleep time before the first retry (in seconds)
+        self.max_retry_sleep_time = 30  # Maximum sleep time between retries (in seconds)
+        self.laser_shutter_time = self.settings["laser_shutter_time"]
+        self.capture_client = None  # Connection to the long-lived capture server for this camera
+        self.total_images = int(self.settings["duration"] * 60 / self.settings["interval"])
+        self.captured_images = 0
+        self.flagged_images = 0
+        self.last_capture_duration = 0.0
+        self.is_running = False
+        self.finished = False
+        self.resume_state = None  # RunState of the run being resumed, None for a new run
+        self.qc = None
+        self.journal = None
+        self.anomaly_counter = get_metrics().counter("qc_anomalies_total", f"cam{self.cam_id}")
+        jitter_histogram = get_metrics().histogram("capture_jitter_seconds", f"cam{self.cam_id}")
+        self.scheduler = IntervalScheduler(self.settings["interval"] * 60, self.total_images, self.scheduled_capture,
+                                           policy=self.settings["overrun_policy"], log=log, jitter_histogram=jitter_histogram)
+
+    @classmethod
+    def resume(cls, state, backend='spinnaker', shutter=None, log=print):
+        # Continues a run from its journal with the settings it was started with. Progress comes
+        # from the journal, the output folder isn't looked at.
+        run = cls(state.settings, backend, shutter, log)
+        run.resume_state = state
+        run.total_images = run.scheduler.total = state.total
+        run.captured_images = state.captured
+        return run
+
+    def send_command(self, command):
+        # Returns as soon as the Arduino acknowledges the command, None if it doesn't
+        return self.serial_conn.command(command)
+
+    def begin(self):
+        # Opens the quality check and journal, returns the scheduler's (start time, first index).
+        # The journal keeps the schedule on the wall clock, the scheduler runs on the monotonic one.
+        settings = self.settings
+        self.is_running = True
+        camera_settings = settings.get("camera_settings")
+        if camera_settings:
+            try:
+                self.connect()
+                self.capture_client.configure(camera_settings)
+                self.log(f"Applied {camera_settings}")
+            except Exception as e:
+                self.log(f"Failed to apply the camera settings: {e}")
+        self.qc = FrameQC(os.path.join(settings["output_dir"], f"{settings['base_name']}_qc.jsonl"), bit_depth=self.read_bit_depth(),
+                          on_anomaly=self.report_anomaly)
+        self.journal = RunJournal(journal_path(settings))
+        state = self.resume_state
+        if state is None:
+            self.journal.start(settings, time.time(), self.scheduler.interval, self.total_images)
+            return None, 0
+        first_index = state.first_due(skip_missed=settings["overrun_policy"] == SKIP)
+        self.log(f"Resuming the run in {self.journal.path}: {state.captured} of {state.total} images captured")
+        self.journal.write(run_journal.RESUME, index=first_index)
+        if first_index > state.next_index():
+            self.log(f"Captures {state.next_index() + 1} to {first_index} were due while the run was down, skipping them")
+            self.journal.write(run_journal.MISSED, first=state.next_index(), last=first_index - 1)
+        return time.monotonic() - (time.time() - state.start_time), first_index
+
+    def read_bit_depth(self):
+        # Full scale for the quality check. Without it FrameQC takes the frames' dtype, 16 bits
+        # for Mono12 frames, and would flag normal frames as black and never as saturated.
+        try:
+            self.connect()
+            pixel_format = self.capture_client.get_properties(["PixelFormat"])["PixelFormat"]
+        except Exception as e:
+            self.log(f"Failed to read the pixel format, the quality check takes full scale from the frames' data type: {e}")
+            return None
+        return PIXEL_FORMAT_BITS.get(pixel_format)
+
+    def end(self):
+        # Marks the run finished however it ended, a GUI polls finished before it lets a new run start
+        try:
+            if self.journal is None:
+                # begin() failed before the run started
+                if self.qc is not None:
+                    self.qc.close()
+                return
+            self.journal.write(run_journal.STOPPED if self.scheduler.stopped() else run_journal.FINISHED, captured=self.captured_images)
+            self.journal.close()
+            self.qc.close()
+            self.log(f"Quality check: {self.qc.flagged} of {self.qc.checked} frames flagged, see {self.qc.index_path}")
+            stats = self.scheduler.stats()
+            self.log(f"Start time jitter: mean {stats['mean_jitter'] * 1000:.2f}ms, max {stats['max_jitter'] * 1000:.2f}ms, {stats['skipped']} capture(s) skipped")
+            self.log(f"{'Capture stopped' if self.scheduler.stopped() else 'Experiment Complete'}, {self.captured_images} pictures captured")
+        finally:
+            self.is_running = False
+            self.finished = True
+
+    def stop(self):
+        self.is_running = False
+        self.scheduler.stop()  # Wakes the engine at once instead of at the next deadline
+
+    def scheduled_capture(self, index):
+        self.journal.write(run_journal.PLANNED, index=index)
+        start_time = time.monotonic()
+        captured = self.manage_shutter_and_capture()
+        self.last_capture_duration = time.monotonic() - start_time
+        if captured is None:
+            self.journal.write(run_journal.FAILED, index=index)
+            return
+        self.captured_images += 1
+        path, frame_index, timing = captured
+        self.journal.write(run_journal.COMPLETED, index=index, attempt=0, path=path, frame_index=frame_index, timing=timing)
+        future = self.qc.submit(index, path, frame_index, metadata=timing)
+        if self.settings["recapture"]:
+            self.recapture_if_flagged(index, future)
+
+    def recapture_if_flagged(self, index, future):
+        # Waits for the quality check only in the time left before the next capture, and takes
+        # the frame again if it failed in a way another try can fix and a capture still fits.
+        # The scheduler's deadlines are absolute, so this never delays the next capture.
+        next_deadline = self.scheduler.deadline(index + 1)
+        def time_left():
+            return next_deadline - time.monotonic() - 1.5 * self.last_capture_duration
+        while not future.done():
+            if time_left() <= 0 or not self.is_running:
+                return
+            concurrent.futures.wait([future], timeout=min(time_left(), 0.5))
+        result = future.result()
+        if not result.needs_recapture or time_left() <= 0 or not self.is_running:
+            return
+        self.log(f"Capture {index + 1} flagged as {', '.join(result.flags)}, capturing it again")
+        captured = self.manage_shutter_and_capture(suffix="_retake")
+        if captured is not None:
+            path, frame_index, timing = captured
+            self.journal.write(run_journal.COMPLETED, index=index, attempt=1, path=path, frame_index=frame_index, timing=timing)
+            self.qc.submit(index, path, frame_index, attempt=1, metadata=timing)
+
+    def report_anomaly(self, result):
+        # Called on a QC worker thread
+        self.flagged_images += 1
+        self.anomaly_counter.increment()
+        details = result.stats.get("error") or f"mean {result.stats['mean'] * 100:.1f}%, saturated {result.stats['saturated_fraction'] * 100:.2f}%"
+        self.log(f"Quality check flagged capture {result.capture + 1} (attempt {result.attempt + 1}) as {', '.join(result.flags)}: {details}")
+
+    def manage_shutter_and_capture(self, suffix=""):
+        # Returns where the frame went and how long the sample was lit, (path, frame index in
+        # the container or None, shutter timing), or None if the capture failed
+        if not self.serial_conn:
+            self.log("Arduino connection not available, skipping the shutter control.")
+        # Capture image with retry logic, the shutter is opened and closed around each attempt
+        return self.capture_single_image(suffix)
+
+    def timed_capture(self, filepath, use_container):
+        # The camera is armed for a software trigger first, so the shutter is only open for
+        # the frame itself: OPEN returns once the servo has finished its sweep, the trigger
+        # fires so the exposure ends laser_shutter_time after the shutter is fully open, and
+        # CLOSE goes out the moment the frame has arrived, before it is written.
+        # Returns (frame index or None, capture time, shutter timing), times in seconds.
+        exposure_time = self.capture_client.arm()
+        if not self.serial_conn:
+            frame_index, capture_time = self.capture_client.triggered(filepath, use_container, codec=self.settings["codec"], timestamp=time.time())
+            return frame_index, capture_time, {}
+
+        timing = {}
+
+        def close_shutter(trigger_time, arrival_time):
+            close_sent = time.perf_counter()
+            self.send_command("CLOSE")
+            closed = time.perf_counter()
+            timing.update({
+                "open_latency": opened - open_sent,  # OPEN sent to fully open
+                "trigger_offset": trigger_time - opened,  # Fully open to the trigger
+                "frame_latency": arrival_time - trigger_time,  # Trigger to the frame's arrival
+                "close_latency": closed - close_sent,  # CLOSE sent to fully closed
+                "fully_open": close_sent - opened,
+                # Light passes for about half of each sweep, so count from the middle of the
+                # opening sweep to the middle of the closing one
+                "illumination": (close_sent + closed) / 2 - (open_sent + opened) / 2,
+            })
+            return {"shutter_open_duration": timing["illumination"]}
+
+        try:
+            open_sent = time.perf_counter()
+            if self.send_command("OPEN") is None:
+                # The shutter may have moved and only the acknowledgement got lost, so it is closed below
+                raise CaptureError("The shutter did not acknowledge OPEN")
+            opened = time.perf_counter()
+            time.sleep(max(0.0, opened + self.laser_shutter_time - exposure_time - time.perf_counter()))
+            frame_index, capture_time = self.capture_client.triggered(filepath, use_container, on_grabbed=close_shutter, codec=self.settings["codec"],
+                                                                      timestamp=time.time())
+        finally:
+            if not timing:
+                self.send_command("CLOSE")  # The capture failed before the frame arrived, or OPEN went unacknowledged
+        return frame_index, capture_time, timing
+
+    def connect(self):
+        if self.capture_client is None:
+            self.capture_client = capture_server.connect(self.cam_id, backend=self.backend)
+
+    def capture_single_image(self, suffix=""):
+        settings = self.settings
+        timestamp = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
+        use_container = settings["output_format"] == "HDF5 container"
+        if use_container:
+            filepath = os.path.join(settings["output_dir"], f"{settings['base_name']}.h5")
+        else:
+            file_name = f"{settings['base_name']}_{timestamp}{suffix}"
+            filepath = codec_path(os.path.join(settings["output_dir"], file_name), settings["codec"])
+
+        retry_sleep_time = self.initial_retry_sleep_time
+        for attempt in range(1, self.max_retries + 1):
+            # Check available memory
+            memory_info = psutil.virtual_memory()
+            if memory_info.available < 100 * 1024 * 1024:  # Less than 100MB available
+                self.log(f"Memory low, waiting {retry_sleep_time} seconds before retrying...")
+                time.sleep(retry_sleep_time)
+                retry_sleep_time = min(retry_sleep_time * 2, self.max_retry_sleep_time)
+                continue
+
+            try:
+                self.connect()
+                frame_index, capture_time, timing = self.timed_capture(filepath, use_container)
+                lit = f", sample lit for {timing['illumination']:.3f} seconds" if timing else ""
+                if use_container:
+                    self.log(f'Frame {frame_index} of {filepath} captured successfully in {capture_time:.3f} seconds{lit}.')
+                    return filepath, frame_index, timing
+                if not os.path.isfile(filepath):
+                    # The server reported it saved, retry like any other failed capture
+                    raise CaptureError(f"The capture server reported success but {filepath} does not exist")
+                self.log(f'Image {filepath} captured successfully in {capture_time:.3f} seconds{lit}.')
+                return filepath, None, timing
+            except Exception as e:
+                if not isinstance(e, CaptureError):
+                    # Lost the capture server, reconnect (restarting it if needed) on the next attempt
+                    self.close_capture_client()
+                self.log(f"Attempt {attempt} failed: {str(e)}")
+                if attempt >= self.max_retries:
+                    self.log(f"Capture failed after {attempt} attempts. Moving to next capture or stopping if this is the last one.")
+                else:
+                    self.log(f"Retrying capture ({attempt}/{self.max_retries}) after error: {str(e)}")
+                gc.collect()
+                self.log(f"Waiting {retry_sleep_time} seconds before retrying...")
+                time.sleep(retry_sleep_time)  # Wait briefly before retrying
+                retry_sleep_time = min(retry_sleep_time * 2, self.max_retry_sleep_time)  # Exponential backoff, capped at max_retry_sleep_time
+
+    def close_capture_client(self, shutdown_server=False):
+        if self.capture_client is None:
+            return
+        try:
+            if shutdown_server:
+                self.capture_client.shutdown()
+            else:
+                self.capture_client.close()
+        except Exception as e:
+            self.log(f"Failed to close capture server connection: {e}")
+        self.capture_client = None
+
+class IntervalEngine:
+    # Runs the schedules of several IntervalRuns concurrently from one process: one thread
+    # waits for the next deadline of every camera and captures run on a thread pool, one
+    # worker per camera, see MultiScheduler.
+    def __init__(self, runs, log=print):
+        self.runs = runs
+        self.log = log
+        self.multi_scheduler = MultiScheduler([run.scheduler for run in runs], log=log)
+
+    def run(self):
+        # Blocks until every run has finished or was stopped
+        try:
+            starts = [run.begin() for run in self.runs]
+            self.multi_scheduler.run(starts)
+        except Exception:
+            self.stop()  # The runs that began are journalled as stopped, so they can be resumed
+            raise
+        finally:
+            for run in self.runs:
+                run.end()
+
+    def stop(self):
+        for run in self.runs:
+            run.is_running = False
+        self.multi_scheduler.stop()
+
+    def close(self, shutdown_servers=True):
+        for run in self.runs:
+            run.close_capture_client(shutdown_server=shutdown_servers)
+
+def camera_log(cam_id):
+    def log(message):
+        print(f"[cam{cam_id}] {message}")
+    return log
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Headless interval capture for one or more cameras')
+    parser.add_argument('spec', help='Experiment spec, a JSON file')
+    parser.add_argument('--backend', choices=['spinnaker', 'simulated'], default='spinnaker', help='Camera backend to use')
+    parser.add_argument('--resume', action='store_true', help="Resume the cameras' unfinished runs instead of starting new ones")
+    parser.add_argument('--no-shutter', action='store_true', help='Capture without opening and closing the shutters')
+    args = parser.parse_args()
+
+    start_exporter("interval_engine")
+    runs = []
+    for settings in load_spec(args.spec):
+        log = camera_log(settings["cam_id"])
+        shutter = None
+        if not args.no_shutter and settings.get("shutter", True):
+            shutter = connect_arduino(settings["cam_id"], log=log, port=settings.get("shutter_port"))
+        state = unfinished_run(settings, log) if args.resume else None
+        if args.resume and state is None:
+            log(f"Nothing to resume in {journal_path(settings)}, starting a new run")
+        runs.append(IntervalRun.resume(state, args.backend, shutter, log) if state else IntervalRun(settings, args.backend, shutter, log))
+
+    engine = IntervalEngine(runs)
+    def handle_signal(signum, frame):
+        print("Stopping, finishing the captures in progress...")
+        engine.stop()
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+    runner = threading.Thread(target=engine.run)
+    runner.start()
+    while runner.is_alive():
+        runner.join(0.5)  # Signals are handled on the main thread, between joins
+    engine.close()
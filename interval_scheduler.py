@@ -0,0 +1,207 @@
+import heapq
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# What to do when a capture runs past the next deadline
+SKIP = "skip"  # Drop the deadlines that already passed and continue with the next one on the grid
+CATCH_UP = "catch-up"  # Run the missed captures back to back until the schedule is caught up
+OVERRUN_POLICIES = [SKIP, CATCH_UP]
+
+STOP_POLL = 0.25  # Longest MultiScheduler wait, in seconds
+
+class ScheduleRecord:
+    def __init__(self, index, deadline, started, finished, skipped=False):
+        self.index = index
+        self.deadline = deadline
+        self.started = started
+        self.finished = finished
+        self.skipped = skipped
+
+    @property
+    def jitter(self):
+        # Seconds the capture started after its deadline
+        return self.started - self.deadline
+
+class IntervalScheduler:
+    # Runs task(index) at start + index * interval for index in range(total). Deadlines are
+    # absolute on a monotonic clock, so time spent in the task never shifts later captures.
+    # Waits happen on stop_event, so stop() interrupts them at once; the last spin_threshold
+    # seconds before a deadline are spun for sub-millisecond wake-up precision.
+    # clock and wait (wait(timeout) returning True when stopped, like Event.wait) can be
+    # replaced to drive the scheduler from a fake clock, with spin_threshold=0.
+    # jitter_histogram, a metrics Histogram, gets the start jitter of every capture.
+    def __init__(self, interval, total, task, policy=SKIP, clock=time.monotonic, wait=None, spin_threshold=0.002, log=print,
+                 jitter_histogram=None):
+        if interval <= 0:
+            raise ValueError("Interval must be greater than zero")
+        if policy not in OVERRUN_POLICIES:
+            raise ValueError(f"Unknown overrun policy {policy}, use one of {OVERRUN_POLICIES}")
+        self.interval = interval
+        self.total = total
+        self.task = task
+        self.policy = policy
+        self.clock = clock
+        self.stop_event = threading.Event()
+        self.wait = wait or self.stop_event.wait
+        self.spin_threshold = spin_threshold
+        self.log = log
+        self.jitter_histogram = jitter_histogram
+        self.records = []
+        self.start_time = None
+
+    def stop(self):
+        self.stop_event.set()
+
+    def stopped(self):
+        return self.stop_event.is_set()
+
+    def deadline(self, index):
+        # When capture index is due, on the scheduler's clock
+        return self.start_time + index * self.interval
+
+    def wait_until(self, deadline):
+        # Returns False if the scheduler was stopped before the deadline
+        while True:
+            remaining = deadline - self.clock()
+            if remaining <= 0:
+                return not self.stopped()
+            if remaining > self.spin_threshold:
+                if self.wait(remaining - self.spin_threshold):
+                    return False
+            elif self.stopped():
+                return False
+
+    def run(self, start_time=None, first_index=0):
+        # A resumed run passes the original start time and the first capture still to take
+        self.start_time = self.clock() if start_time is None else start_time
+        index = first_index
+        while index < self.total and not self.stopped():
+            deadline = self.deadline(index)
+            if not self.wait_until(deadline):
+                break
+            started = self.clock()
+            self.task(index)
+            finished = self.clock()
+            self.record(index, deadline, started, finished)
+            index = self.next_index(index, finished)
+        return self.records
+
+    def record(self, index, deadline, started, finished):
+        record = ScheduleRecord(index, deadline, started, finished)
+        self.records.append(record)
+        if self.jitter_histogram is not None:
+            self.jitter_histogram.observe(abs(record.jitter))
+        if self.log:
+            self.log(f"Capture {index + 1}/{self.total}: started {record.jitter * 1000:+.2f}ms from its deadline, took {finished - started:.3f}s")
+
+    def next_index(self, index, finished):
+        # The capture to run after index, which finished at finished; with the SKIP policy the
+        # deadlines that passed meanwhile are recorded as skipped
+        index += 1
+        overrun = finished - self.deadline(index)
+        if overrun > 0 and self.policy == SKIP and index < self.total:
+            next_index = min(self.total, math.ceil((finished - self.start_time) / self.interval))
+            for skipped in range(index, next_index):
+                skipped_deadline = self.deadline(skipped)
+                self.records.append(ScheduleRecord(skipped, skipped_deadline, skipped_deadline, skipped_deadline, skipped=True))
+            if self.log and next_index > index:
+                self.log(f"Capture overran by {overrun:.3f}s, skipping {next_index - index} capture(s)")
+            index = next_index
+        return index
+
+    def stats(self):
+        jitters = [abs(record.jitter) for record in self.records if not record.skipped]
+        return {
+            "captures": len(jitters),
+            "skipped": sum(1 for record in self.records if record.skipped),
+            "mean_jitter": sum(jitters) / len(jitters) if jitters else 0.0,
+            "max_jitter": max(jitters) if jitters else 0.0,
+        }
+
+class MultiScheduler:
+    # Runs the tasks of several IntervalSchedulers from one thread, which waits for the
+    # earliest deadline of them all and hands the task to a thread pool, so dozens of cameras
+    # need one waiting thread instead of one each. A schedule's next capture is queued when
+    # its current one has finished, so a camera never runs two captures at once, and each
+    # schedule handles its overruns with its own policy. stop() on a scheduler ends just that
+    # schedule, stop() here all of them.
+    def __init__(self, schedulers, max_workers=None, clock=time.monotonic, spin_threshold=0.002, log=print):
+        self.schedulers = schedulers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers or len(schedulers) or 1, thread_name_prefix="capture")
+        self.clock = clock
+        self.spin_threshold = spin_threshold
+        self.log = log
+        self.condition = threading.Condition()
+        self.queue = []  # (deadline, order, scheduler, index), earliest first
+        self.order = 0  # Tie breaker, schedulers don't compare
+        self.running = 0  # Tasks handed to the pool and not finished yet
+        self.stop_event = threading.Event()
+
+    def stop(self):
+        self.stop_event.set()
+        for scheduler in self.schedulers:
+            scheduler.stop()
+        with self.condition:
+            self.condition.notify()
+
+    def stopped(self):
+        return self.stop_event.is_set()
+
+    def push(self, scheduler, index):
+        # Called with the condition held
+        if index < scheduler.total and not scheduler.stopped():
+            heapq.heappush(self.queue, (scheduler.deadline(index), self.order, scheduler, index))
+            self.order += 1
+            self.condition.notify()
+
+    def run(self, starts=None):
+        # starts holds (start time, first index) per scheduler, like IntervalScheduler.run();
+        # None starts every schedule now from its first capture
+        now = self.clock()
+        with self.condition:
+            for scheduler, (start_time, first_index) in zip(self.schedulers, starts or [(None, 0)] * len(self.schedulers)):
+                scheduler.start_time = now if start_time is None else start_time
+                self.push(scheduler, first_index)
+        try:
+            while True:
+                with self.condition:
+                    while not self.stopped():
+                        if not self.queue:
+                            if not self.running:
+                                break
+                            self.condition.wait()
+                            continue
+                        if self.queue[0][2].stopped():
+                            heapq.heappop(self.queue)  # That schedule was stopped on its own
+                            continue
+                        remaining = self.queue[0][0] - self.clock()
+                        if remaining <= self.spin_threshold:
+                            break
+                        # Woken by new deadlines and stop(), a schedule stopped on its own is noticed within STOP_POLL
+                        self.condition.wait(min(remaining - self.spin_threshold, STOP_POLL))
+                    if self.stopped() or not self.queue:
+                        break
+                    deadline, _, scheduler, index = heapq.heappop(self.queue)
+                    self.running += 1
+                while self.clock() < deadline:
+                    pass  # Spin the last moments for a precise start
+                self.executor.submit(self.run_task, scheduler, index, deadline)
+        finally:
+            self.executor.shutdown(wait=True)
+        return {scheduler: scheduler.records for scheduler in self.schedulers}
+
+    def run_task(self, scheduler, index, deadline):
+        started = self.clock()
+        try:
+            scheduler.task(index)
+        except Exception as e:
+            if self.log:
+                self.log(f"Capture {index + 1}/{scheduler.total} failed: {e}")
+        finished = self.clock()
+        scheduler.record(index, deadline, started, finished)
+        with self.condition:
+            self.running -= 1
+            self.push(scheduler, scheduler.next_index(index, finished))
+            self.condition.notify()
@@ -2,72 +2,177 @@ import numpy as np
 import cv2
 import time
 import argparse
-from camera_interface import CameraInterface, save_config, load_config
+from camera_interface import CameraInterface, load_backend, load_mode
+from config_store import get_store
+from frame_grabber import FrameGrabber, RateMeter
+from raw_stream import RawStreamReader, ReplaySource
+from preview import PreviewPipeline, PIXEL_FORMAT_BITS, DECIMATION_MODES, DISPLAY_GAMMA
+from auto_exposure import AutoExposure
+from metrics import start_exporter
+
+REPORT_INTERVAL = 5  # Seconds between frame rate reports
+
+# Trackbar moves are saved once the slider has been still for a moment, not on every tick
+store = get_store()
+syncing_trackbars = False  # Set while the trackbars are moved to match settings made elsewhere
 
 def update_exposure(val):
+    if syncing_trackbars:
+        return
     try:
         cam.set_property("ExposureTime", max(val, cam.get_property_min("ExposureTime")))
         config["ExposureTime"] = val
-        save_config(cam.serial_number, config)
+        store.update(cam.serial_number, {"ExposureTime": val})
     except Exception as e:
         print(e)
 
 def update_gain(val):
+    if syncing_trackbars:
+        return
     try:
         cam.set_property("Gain", val)
         config["Gain"] = val
-        save_config(cam.serial_number, config)
+        store.update(cam.serial_number, {"Gain": val})
     except Exception as e:
         print(e)
 
 def update_black_level(val):
+    if syncing_trackbars:
+        return
     try:
         cam.set_property("BlackLevel", val)
         config["BlackLevel"] = val
-        save_config(cam.serial_number, config)
+        store.update(cam.serial_number, {"BlackLevel": val})
     except Exception as e:
         print(e)
 
+def latest_frame(source):
+    lease = source.get_latest(timeout=1.0)
+    if lease is None:
+        return None
+    with lease:
+        return lease.frame.copy()
+
+def run_auto_exposure(source, target_mean):
+    # Tune on the grabber's frames, then move the trackbars without writing the settings back
+    global syncing_trackbars
+    auto_exposure = AutoExposure(cam, target_mean=target_mean, settle_frames=2, frame_source=lambda: latest_frame(source))
+    try:
+        result = auto_exposure.run()
+    except Exception as e:
+        print(f"Auto exposure failed: {e}")
+        return
+    print(f"Auto exposure {result['status']} after {result['frames']} frames: ExposureTime {result['ExposureTime']:.1f}, Gain {result['Gain']:.2f}")
+    config["ExposureTime"] = result["ExposureTime"]
+    config["Gain"] = result["Gain"]
+    store.update(cam.serial_number, {"ExposureTime": result["ExposureTime"], "Gain": result["Gain"]})
+    syncing_trackbars = True
+    try:
+        cv2.setTrackbarPos("Exposure", "Camera Feed", int(result["ExposureTime"]))
+        cv2.setTrackbarPos("Gain", "Camera Feed", int(round(result["Gain"])))
+    finally:
+        syncing_trackbars = False
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Camera Control Script')
-    parser.add_argument('cam_id', type=int, help='Camera ID to use')
+    parser.add_argument('cam_id', type=int, nargs='?', default=0, help='Camera ID to use')
+    parser.add_argument('--backend', choices=['spinnaker', 'simulated'], default='spinnaker', help='Camera backend to use')
+    parser.add_argument('--display-fps', type=float, default=30.0, help='Maximum preview refresh rate')
+    parser.add_argument('--replay', type=str, help='Show a raw stream recording instead of the camera')
+    parser.add_argument('--speed', type=float, default=1.0, help='Replay speed relative to the recording')
+    parser.add_argument('--loop', action='store_true', help='Replay the recording in a loop')
+    parser.add_argument('--preview-size', type=int, nargs=2, default=[640, 480], metavar=('WIDTH', 'HEIGHT'), help='Largest preview size, the aspect ratio is kept')
+    parser.add_argument('--preview-mode', choices=DECIMATION_MODES, default='stride', help='How frames are downsampled for the preview')
+    parser.add_argument('--no-overlay', action='store_true', help='Hide the histogram and saturation overlay')
+    parser.add_argument('--gamma', type=float, default=DISPLAY_GAMMA, help='Display gamma of the preview, 1 shows the linear pixel values')
+    parser.add_argument('--target-mean', type=float, default=0.45, help='Mean level auto exposure aims for, press A to run it')
+    parser.add_argument('--profile', type=str, help='Start from the latest version of this settings profile, press S to save a new version')
+    parser.add_argument('--mode', type=str, help='Preview in the image format of this profile, or e.g. "BinningHorizontal=2,BinningVertical=2"; the camera goes back to its own format on exit')
     args = parser.parse_args()
 
+    cam = None
+    recording_format = None  # The camera's image format before the preview mode, restored on exit
+    pipeline = PreviewPipeline(max_size=tuple(args.preview_size), mode=args.preview_mode, overlay=not args.no_overlay, gamma=args.gamma)
     try:
-        cam = CameraInterface(cam_id=args.cam_id)
-        config = load_config(cam.serial_number)
+        if args.replay:
+            # Play a raw stream recording back instead of showing a camera
+            source = ReplaySource(RawStreamReader(args.replay), speed=args.speed, loop=args.loop)
+            cv2.namedWindow("Camera Feed")
+        else:
+            start_exporter(f"liveView-cam{args.cam_id}")
+            cam = CameraInterface(cam_id=args.cam_id, backend=load_backend(args.backend))
+            if args.profile and args.profile in store.list_profiles(cam.serial_number):
+                cam.apply_config(store.activate_profile(cam.serial_number, args.profile))
+                print(f"Loaded profile {args.profile}")
+            config = store.load(cam.serial_number)
+            if args.mode:
+                recording_format = cam.get_image_format()
+                cam.set_image_format(load_mode(cam.serial_number, args.mode))
+                print(f"Preview mode: {cam.get_image_format()}")
+            try:
+                pipeline.set_bit_depth(PIXEL_FORMAT_BITS.get(cam.get_property("PixelFormat")))
+            except Exception as e:
+                print(f"Failed to read PixelFormat, scaling the preview by the frame's data type: {e}")
+
+            cv2.namedWindow("Camera Feed")
+            # Adding trackbars for adjusting camera settings with initial values from config
+            # Auto exposure saves the camera's float values, trackbars only take ints
+            cv2.createTrackbar("Exposure", "Camera Feed", int(round(config.get("ExposureTime", cam.get_property_min("ExposureTime")))), 13181, update_exposure)
+            cv2.createTrackbar("Gain", "Camera Feed", int(round(config.get("Gain", 0))), 47, update_gain)
+            cv2.createTrackbar("Black Level", "Camera Feed", int(round(config.get("BlackLevel", 0))), 12, update_black_level)
 
-        cv2.namedWindow("Camera Feed")
-        # Adding trackbars for adjusting camera settings with initial values from config
-        cv2.createTrackbar("Exposure", "Camera Feed", config.get("ExposureTime", int(cam.get_property_min("ExposureTime"))), 13181, update_exposure)
-        cv2.createTrackbar("Gain", "Camera Feed", config.get("Gain", 0), 47, update_gain)
-        cv2.createTrackbar("Black Level", "Camera Feed", config.get("BlackLevel", 0), 12, update_black_level)
+            # Frames are grabbed on their own thread, the display only ever shows the newest one
+            source = FrameGrabber(cam)
+        source.start()
+        display_period = 1.0 / args.display_fps
+        display_rate = RateMeter()
+        next_report = time.monotonic() + REPORT_INTERVAL
 
         try:
             while True:
-                for attempt in range(3):
-                    try:
-                        frame = cam.get_frame()
-                        if frame.size == 0:
-                            continue
-                        
-                        # Resize the frame to a smaller size
-                        resized_frame = cv2.resize(frame, (640, 480))
-                        
-                        cv2.imshow("Camera Feed", resized_frame)
-                        if cv2.waitKey(1) & 0xFF == 27:  # Press ESC to exit
-                            break
-                        break  # Exit the for loop if successful
-                    except PySpin.SpinnakerException as e:
-                        if "Stream has been aborted" in str(e):
-                            print(f"Attempt {attempt + 1}/3: Stream aborted, retrying...")
-                            time.sleep(0.5)
-                            cam.restart_acquisition()
-                        else:
-                            raise e
+                next_display = time.monotonic() + display_period
+                lease = source.get_latest(timeout=display_period)
+                if lease is None and source.finished:
+                    if args.replay:
+                        print("Replay finished.")
+                        break
+                    raise source.error or Exception("Frame grabber stopped unexpectedly")
+                if lease is not None:
+                    # The preview has its own buffers, the pool slot is free again afterwards
+                    with lease:
+                        preview_frame = pipeline.render(lease.frame)
+                    cv2.imshow("Camera Feed", preview_frame)
+                    display_rate.tick()
+
+                # Handle window events until the next display deadline, capping the display rate
+                wait_ms = max(1, int((next_display - time.monotonic()) * 1000))
+                key = cv2.waitKey(wait_ms) & 0xFF
+                if key == 27:  # Press ESC to exit
+                    break
+                if key in (ord('a'), ord('A')) and cam:
+                    run_auto_exposure(source, args.target_mean)
+                if key in (ord('s'), ord('S')) and cam and args.profile:
+                    version = store.save_profile(cam.serial_number, args.profile, config)
+                    print(f"Saved profile {args.profile} version {version}")
+
+                if time.monotonic() >= next_report:
+                    stats = source.stats()
+                    print(f"Acquisition: {stats['acquisition_fps']:.1f} fps, display: {display_rate.rate():.1f} fps, "
+                          f"frames not displayed: {stats['frames_replaced']}, incomplete: {stats['incomplete_frames']}, "
+                          f"no free buffer: {stats['pool_drops']}, "
+                          f"stream restarts: {stats['stream_restarts']}")
+                    next_report += REPORT_INTERVAL
         finally:
-            cam.stop_acquisition()
-            del cam
+            source.stop()
+            store.flush()
+            if cam:
+                if recording_format:
+                    try:
+                        cam.set_image_format(recording_format)
+                    except Exception as e:
+                        print(f"Failed to restore the image format {recording_format}: {e}")
+                cam.stop_acquisition()
+                del cam
             cv2.destroyAllWindows()
     except Exception as e:
         print(f"An error occurred: {e}")
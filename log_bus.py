@@ -0,0 +1,145 @@
+import configparser
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+# Where the log files go and how much is kept, change them in the [Logging] section of config.ini
+SETTINGS = {
+    "directory": "logs",
+    "max_bytes": 5000000,  # A camera's log file is rotated past this size
+    "backup_count": 5,  # Rotated files kept per camera
+    "max_pending": 20000,  # Records waiting for the GUI before the oldest are dropped
+    "max_lines": 2000,  # Lines kept in the on-screen log
+}
+
+INFO = logging.INFO
+WARNING = logging.WARNING
+ERROR = logging.ERROR
+
+class LogRecord:
+    def __init__(self, source, message, level=INFO, created=None):
+        self.source = source  # Camera or component the line is about, one log file each
+        self.message = message
+        self.level = level
+        self.created = created if created is not None else time.time()
+
+class LogBus:
+    # Thread-safe log for the GUI. Any thread posts records; they are written to a rotating
+    # file per source on a writer thread, and held for the GUI, which drains them on its own
+    # thread. The GUI buffer is bounded, so a stalled GUI drops the oldest records (and says
+    # so) instead of growing without limit.
+    def __init__(self, directory=None, max_bytes=None, backup_count=None, max_pending=None):
+        self.directory = directory or SETTINGS["directory"]
+        self.max_bytes = max_bytes or SETTINGS["max_bytes"]
+        self.backup_count = backup_count if backup_count is not None else SETTINGS["backup_count"]
+        self.pending = deque()
+        self.max_pending = max_pending or SETTINGS["max_pending"]
+        self.lock = threading.Lock()
+        self.dropped = 0
+        self.file_queue = queue.SimpleQueue()
+        self.handlers = {}  # Source -> RotatingFileHandler, only touched by the writer thread
+        self.formatter = logging.Formatter("%(asctime)s %(levelname)s %(message)s")
+        self.writer = threading.Thread(target=self.write_files, daemon=True)
+        self.writer.start()
+
+    def post(self, source, message, level=INFO):
+        record = LogRecord(source, message, level)
+        with self.lock:
+            if len(self.pending) >= self.max_pending:
+                self.pending.popleft()
+                self.dropped += 1
+            self.pending.append(record)
+        self.file_queue.put(record)
+
+    def drain(self, limit):
+        # Up to limit of the oldest records, and how many were dropped since the last drain
+        with self.lock:
+            records = [self.pending.popleft() for _ in range(min(limit, len(self.pending)))]
+            dropped, self.dropped = self.dropped, 0
+        return records, dropped
+
+    def write_files(self):
+        while True:
+            record = self.file_queue.get()
+            if record is None:
+                break
+            try:
+                handler = self.handlers.get(record.source)
+                if handler is None:
+                    os.makedirs(self.directory, exist_ok=True)
+                    handler = logging.handlers.RotatingFileHandler(os.path.join(self.directory, f"{record.source}.log"),
+                                                                   maxBytes=self.max_bytes, backupCount=self.backup_count)
+                    handler.setFormatter(self.formatter)
+                    self.handlers[record.source] = handler
+                handler.emit(logging.makeLogRecord({
+                    "name": record.source, "msg": record.message, "levelno": record.level,
+                    "levelname": logging.getLevelName(record.level), "created": record.created,
+                    "msecs": (record.created % 1) * 1000,
+                }))
+            except Exception as e:
+                print(f"Failed to write the log of {record.source}: {e}")
+        for handler in self.handlers.values():
+            handler.close()
+
+    def close(self):
+        # Writes out the queued records and closes the files
+        self.file_queue.put(None)
+        self.writer.join()
+
+class LogView:
+    # Shows a LogBus in a Tk Text widget. Every interval_ms the Tk thread inserts up to
+    # batch_size records, one insert per run of records with the same level, and trims the
+    # widget to max_lines. A backlog is drained in further batches a millisecond apart, so
+    # input and redraws are handled in between.
+    def __init__(self, text_widget, bus, max_lines=None, interval_ms=100, batch_size=500):
+        self.text_widget = text_widget
+        self.bus = bus
+        self.max_lines = max_lines or SETTINGS["max_lines"]
+        self.interval_ms = interval_ms
+        self.batch_size = batch_size
+        self.text_widget.tag_configure("WARNING", foreground="darkorange")
+        self.text_widget.tag_configure("ERROR", foreground="red")
+        self.text_widget.after(self.interval_ms, self.update)
+
+    def update(self):
+        records, dropped = self.bus.drain(self.batch_size)
+        if records or dropped:
+            self.show(records, dropped)
+        backlog = len(self.bus.pending) > 0
+        self.text_widget.after(1 if backlog else self.interval_ms, self.update)
+
+    def show(self, records, dropped):
+        widget = self.text_widget
+        following = widget.yview()[1] >= 1.0  # Only scroll along if the user was at the end
+        runs = []
+        if dropped:
+            runs.append(("WARNING", [f"... {dropped} log lines dropped, see the log files ...\n"]))
+        for record in records:
+            tag = logging.getLevelName(record.level) if record.level >= WARNING else ""
+            line = f"{time.strftime('%H:%M:%S', time.localtime(record.created))} [{record.source}] {record.message}\n"
+            if runs and runs[-1][0] == tag:
+                runs[-1][1].append(line)
+            else:
+                runs.append((tag, [line]))
+        for tag, run in runs:
+            widget.insert("end", "".join(run), tag)
+        lines = int(widget.index("end-1c").split(".")[0]) - 1  # The text ends with a newline
+        if lines > self.max_lines:
+            widget.delete("1.0", f"{lines - self.max_lines + 1}.0")
+        if following:
+            widget.see("end")
+
+def load_settings(path='config.ini'):
+    config = configparser.ConfigParser()
+    config.read(path)
+    if not config.has_section('Logging'):
+        return
+    for key, default in SETTINGS.items():
+        if config.has_option('Logging', key):
+            SETTINGS[key] = type(default)(config.get('Logging', key))
+
+load_settings()
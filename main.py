@@ -4,8 +4,10 @@ from tkinter import ttk, filedialog
 import threading
 import multiprocessing as mp
 import time
-import serial
 import configparser
+from shutter_broker import connect_shutter
+from metrics import read_latest, quantile
+from log_bus import LogBus, LogView, INFO, WARNING, ERROR
 
 # Read configuration from config.ini
 config = configparser.ConfigParser()
@@ -18,6 +20,16 @@ BAUDRATE = int(config['Arduino']['BAUDRATE'])
 # Dictionary to keep track of subprocesses and their status by camera ID
 camera_processes = {}
 
+# Worker threads never touch Tk: they post to the log bus, which the Tk thread drains
+log_bus = LogBus()
+
+# The metrics panel rereads the files every process exports this often
+METRICS_REFRESH_MS = 2000
+METRICS_COLUMNS = ("Process", "Device", "FPS", "Frames", "Incomplete", "Restarts", "Grab p50/p99 ms", "Convert p50 ms",
+                   "Write p50 ms", "Shutter p50/max ms", "Jitter max ms")
+# Exporter name -> {"snapshot", "fps"}, the snapshot frame rates are measured from
+metrics_state = {}
+
 # Arduino ports dictionary
 PORTS_ARDUINO = {
     0: PORT_ARDUINO_ONE,  # Port for Arduino controlling shutter for Camera 0
@@ -26,24 +38,20 @@ PORTS_ARDUINO = {
 
 def initialize_arduino(port):
     try:
-        ser = serial.Serial(port, BAUDRATE, timeout=1)
-        time.sleep(2)  # Wait for the serial connection to initialize
-        return ser
+        # The port's shutter broker keeps the Arduino connected between live views
+        return connect_shutter(port, BAUDRATE)
     except Exception as e:
         print(f"Arduino initialization failed for port {port}: {e}")
         return None
 
-def send_command(ser, command):
-    try:
-        ser.write((command + '\n').encode())
-        time.sleep(1)  # Give Arduino time to process the command
-        response = ser.readline().decode().strip()
-        return response
-    except Exception as e:
-        print(f"Failed to send command to Arduino: {e}")
-        return None
+def send_command(shutter, command):
+    # Returns the Arduino's acknowledgement, or None if there was none
+    return shutter.command(command)
 
-def run_camera_control(cam_id, text_widget, event):
+def log(cam_id, message, level=INFO):
+    log_bus.post(f"camera{cam_id}", message, level)
+
+def run_camera_control(cam_id, event):
     try:
         # Initialize Arduino for the corresponding camera ID
         arduino_conn = initialize_arduino(PORTS_ARDUINO[cam_id])
@@ -53,11 +61,11 @@ def run_camera_control(cam_id, text_widget, event):
 
         proc = subprocess.Popen(['python3.10', 'liveView.py', str(cam_id)], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
         camera_processes[cam_id] = (proc, arduino_conn, False)  # Store the process, Arduino connection and stopped flag
-        text_widget.insert(tk.END, f"Camera {cam_id}: Started successfully, going to open live view.\n")
+        log(cam_id, f"Camera {cam_id}: Started successfully, going to open live view.")
 
         # Read the output in real-time
         for line in proc.stdout:
-            text_widget.insert(tk.END, line)
+            log(cam_id, line.rstrip("\n"))
             if "Camera is disconnected" in line:
                 event.set()
 
@@ -65,68 +73,127 @@ def run_camera_control(cam_id, text_widget, event):
         if proc.returncode != 0:
             _, _, stopped = camera_processes.get(cam_id, (None, None, False))
             if not stopped:  # Ensure it's not an expected stopped process
-                text_widget.insert(tk.END, f"Camera {cam_id} failed to start.\n")
-                text_widget.insert(tk.END, proc.stderr.read())
-                text_widget.insert(tk.END, f"Camera {cam_id} will not open, please close any open cameras and try again.\n")
+                log(cam_id, f"Camera {cam_id} failed to start.", ERROR)
+                for line in proc.stderr.read().splitlines():
+                    log(cam_id, line, ERROR)
+                log(cam_id, f"Camera {cam_id} will not open, please close any open cameras and try again.", ERROR)
     except Exception as e:
         _, _, stopped = camera_processes.get(cam_id, (None, None, False))
         if not stopped:  # Ensure it's not an expected stopped process
-            text_widget.insert(tk.END, f"Camera {cam_id} failed with error: {str(e)}\n")
+            log(cam_id, f"Camera {cam_id} failed with error: {str(e)}", ERROR)
 
-def stop_camera_control(cam_id, text_widget):
+def stop_camera_control(cam_id):
     if cam_id in camera_processes:
         proc, arduino_conn, _ = camera_processes[cam_id]
         try:
             camera_processes[cam_id] = (proc, arduino_conn, True)  # Set stopped flag to True
             proc.terminate()
             proc.wait(timeout=5)  # Wait for the process to terminate
-            text_widget.insert(tk.END, f"Camera {cam_id}: Stopped successfully.\n")
+            log(cam_id, f"Camera {cam_id}: Stopped successfully.")
         except Exception as e:
-            text_widget.insert(tk.END, f"Failed to stop Camera {cam_id}: {str(e)}\n")
+            log(cam_id, f"Failed to stop Camera {cam_id}: {str(e)}", ERROR)
         finally:
             if arduino_conn:
                 send_command(arduino_conn, 'CLOSE')  # Close the laser shutter
-                arduino_conn.close()
+                arduino_conn.disconnect()
             del camera_processes[cam_id]
 
-def delayed_start_camera(cam_id, text_widget):
+def delayed_start_camera(cam_id):
     time.sleep(0.1)  # Add a small delay
     event = mp.Event()
-    p = threading.Thread(target=run_camera_control, args=(cam_id, text_widget, event))
+    p = threading.Thread(target=run_camera_control, args=(cam_id, event))
     p.start()
     return p, event
 
-def delayed_stop_camera(cam_id, text_widget):
-    threading.Thread(target=stop_camera_control, args=(cam_id, text_widget)).start()
+def delayed_stop_camera(cam_id):
+    threading.Thread(target=stop_camera_control, args=(cam_id,)).start()
 
-def on_camera_button_click(cam_id, text_widget):
-    text_widget.insert(tk.END, f"Trying to start camera {cam_id}...\n")
+def on_camera_button_click(cam_id):
+    log(cam_id, f"Trying to start camera {cam_id}...")
     # Run the subprocess in a separate thread to avoid blocking the GUI
-    p, event = delayed_start_camera(cam_id, text_widget)
+    p, event = delayed_start_camera(cam_id)
     # Ensure to handle the disconnection event properly
     def monitor_event():
         event.wait()
-        text_widget.insert(tk.END, f"Camera {cam_id} disconnected.\n")
-        stop_camera_control(cam_id, text_widget)
+        log(cam_id, f"Camera {cam_id} disconnected.", WARNING)
+        stop_camera_control(cam_id)
     
     threading.Thread(target=monitor_event).start()
 
-def on_stop_camera_button_click(cam_id, text_widget):
-    text_widget.insert(tk.END, f"Stopping camera {cam_id}...\n")
+def on_stop_camera_button_click(cam_id):
+    log(cam_id, f"Stopping camera {cam_id}...")
     # Stop the subprocess in a separate thread to avoid blocking the GUI
-    delayed_stop_camera(cam_id, text_widget)
+    delayed_stop_camera(cam_id)
 
-def launch_interval_capture(cam_id, text_widget):
-    text_widget.insert(tk.END, f"Camera {cam_id}: Stopped live capture in order to start interval capture.\n")
+def launch_interval_capture(cam_id):
+    log(cam_id, f"Camera {cam_id}: Stopped live capture in order to start interval capture.")
     # Stop the camera first
-    stop_camera_control(cam_id, text_widget)
+    stop_camera_control(cam_id)
     # Launch interval capture
-    text_widget.insert(tk.END, f"Launching interval capture for camera {cam_id}...\n")
+    log(cam_id, f"Launching interval capture for camera {cam_id}...")
     threading.Thread(target=lambda: subprocess.Popen(['python3.10', 'intervalGUI.py', str(cam_id)])).start()
 
+def format_ms(*values):
+    return "/".join("-" if value is None else f"{value * 1000:.1f}" for value in values)
+
+def device_quantile(histograms, metric, device, q):
+    values = histograms.get(metric, {}).get(device)
+    return quantile(values, q) if values else None
+
+def metrics_rows(snapshots):
+    # One row per process and device, with frame rates from the frame counts of successive exports
+    rows = []
+    now = time.time()
+    for name, snapshot in sorted(snapshots.items()):
+        counters, histograms = snapshot["counters"], snapshot["histograms"]
+        frames = counters.get("frames_total", {})
+        state = metrics_state.get(name)
+        if state is None or state["snapshot"]["pid"] != snapshot["pid"]:
+            state = metrics_state[name] = {"snapshot": snapshot, "fps": {}}
+        elif snapshot["time"] > state["snapshot"]["time"]:
+            elapsed = snapshot["time"] - state["snapshot"]["time"]
+            previous = state["snapshot"]["counters"].get("frames_total", {})
+            fps = {device: (count - previous.get(device, 0)) / elapsed for device, count in frames.items()}
+            state = metrics_state[name] = {"snapshot": snapshot, "fps": fps}
+        stale = now - snapshot["time"] > 3 * snapshot.get("interval", 5.0)
+
+        devices = set()
+        for values in list(counters.values()) + list(histograms.values()):
+            devices.update(values)
+        for device in sorted(devices):
+            grabbed = frames.get(device, 0)
+            incomplete = counters.get("incomplete_frames_total", {}).get(device, 0)
+            shutter = histograms.get("shutter_latency_seconds", {}).get(device)
+            jitter = histograms.get("capture_jitter_seconds", {}).get(device)
+            rows.append(((name, device,
+                          "-" if stale or device not in state["fps"] else f"{state['fps'][device]:.1f}",
+                          grabbed if device in frames else "-",
+                          f"{incomplete / (grabbed + incomplete) * 100:.2f}%" if grabbed + incomplete else "-",
+                          counters.get("stream_restarts_total", {}).get(device, "-"),
+                          format_ms(device_quantile(histograms, "grab_latency_seconds", device, 0.5),
+                                    device_quantile(histograms, "grab_latency_seconds", device, 0.99)),
+                          format_ms(device_quantile(histograms, "convert_latency_seconds", device, 0.5)),
+                          format_ms(device_quantile(histograms, "write_latency_seconds", device, 0.5)),
+                          format_ms(quantile(shutter, 0.5), shutter["max"]) if shutter and shutter["count"] else "-",
+                          format_ms(jitter["max"]) if jitter and jitter["count"] else "-"),
+                         "stale" if stale else ""))
+    return rows
+
+def refresh_metrics_panel(tree):
+    try:
+        rows = metrics_rows(read_latest())
+    except Exception as e:
+        print(f"Failed to read metrics: {e}")
+        rows = []
+    tree.delete(*tree.get_children())
+    for values, tag in rows:
+        tree.insert("", tk.END, values=values, tags=(tag,))
+    tree.after(METRICS_REFRESH_MS, refresh_metrics_panel, tree)
+
 def on_closing():
     for cam_id in list(camera_processes.keys()):  # Use list to avoid RuntimeError: dictionary changed size during iteration
-        stop_camera_control(cam_id, text_widget)
+        stop_camera_control(cam_id)
+    log_bus.close()
     root.destroy()
 
 if __name__ == '__main__':
@@ -139,26 +206,36 @@ if __name__ == '__main__':
     # Add the text widget below the buttons
     text_widget = tk.Text(frame, width=60, height=20)
     text_widget.grid(row=3, column=0, columnspan=3, pady=10)
+    LogView(text_widget, log_bus)
 
     # Create buttons for starting and stopping camera IDs 0 and 1 in a 3x2 format
-    button0_start = ttk.Button(frame, text="Start Camera 0", command=lambda: on_camera_button_click(0, text_widget))
+    button0_start = ttk.Button(frame, text="Start Camera 0", command=lambda: on_camera_button_click(0))
     button0_start.grid(row=0, column=0, padx=5, pady=5)
 
-    button0_stop = ttk.Button(frame, text="Stop Camera 0", command=lambda: on_stop_camera_button_click(0, text_widget))
+    button0_stop = ttk.Button(frame, text="Stop Camera 0", command=lambda: on_stop_camera_button_click(0))
     button0_stop.grid(row=0, column=1, padx=5, pady=5)
 
-    button0_interval = ttk.Button(frame, text="Launch Interval Capture for Camera 0", command=lambda: threading.Thread(target=launch_interval_capture, args=(0, text_widget)).start())
+    button0_interval = ttk.Button(frame, text="Launch Interval Capture for Camera 0", command=lambda: threading.Thread(target=launch_interval_capture, args=(0,)).start())
     button0_interval.grid(row=0, column=2, padx=5, pady=5)
 
-    button1_start = ttk.Button(frame, text="Start Camera 1", command=lambda: on_camera_button_click(1, text_widget))
+    button1_start = ttk.Button(frame, text="Start Camera 1", command=lambda: on_camera_button_click(1))
     button1_start.grid(row=1, column=0, padx=5, pady=5)
 
-    button1_stop = ttk.Button(frame, text="Stop Camera 1", command=lambda: on_stop_camera_button_click(1, text_widget))
+    button1_stop = ttk.Button(frame, text="Stop Camera 1", command=lambda: on_stop_camera_button_click(1))
     button1_stop.grid(row=1, column=1, padx=5, pady=5)
 
-    button1_interval = ttk.Button(frame, text="Launch Interval Capture for Camera 1", command=lambda: threading.Thread(target=launch_interval_capture, args=(1, text_widget)).start())
+    button1_interval = ttk.Button(frame, text="Launch Interval Capture for Camera 1", command=lambda: threading.Thread(target=launch_interval_capture, args=(1,)).start())
     button1_interval.grid(row=1, column=2, padx=5, pady=5)
 
+    # Acquisition metrics of every running camera process; processes that stopped exporting are greyed out
+    metrics_tree = ttk.Treeview(frame, columns=METRICS_COLUMNS, show="headings", height=4)
+    for column in METRICS_COLUMNS:
+        metrics_tree.heading(column, text=column)
+        metrics_tree.column(column, width=140 if column == "Process" else 90, anchor=tk.W if column in ("Process", "Device") else tk.E)
+    metrics_tree.tag_configure("stale", foreground="grey")
+    metrics_tree.grid(row=4, column=0, columnspan=3, pady=5, sticky=(tk.W, tk.E))
+    refresh_metrics_panel(metrics_tree)
+
     # Bind the close event to the on_closing function
     root.protocol("WM_DELETE_WINDOW", on_closing)
 
@@ -0,0 +1,229 @@
+import atexit
+import bisect
+import configparser
+import glob
+import json
+import os
+import threading
+import time
+from config_store import write_text_atomic
+
+# Where and how often every process writes its metrics, change them in the [Metrics] section of config.ini
+SETTINGS = {
+    "directory": "metrics",
+    "interval": 5.0,  # Seconds between exports
+    "max_bytes": 10000000,  # The JSON lines history is rotated to .jsonl.1 past this size
+}
+
+# Upper bounds in seconds, from a fast buffer copy to a slow disk write
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PREFIX = "pyspin_"  # Prepended to every metric name in the Prometheus file
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def increment(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+class Timer:
+    # with histogram.time(): ... observes the seconds spent in the block
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+class Histogram:
+    # Counts per bucket like a Prometheus histogram, the last count is for values above every
+    # bound. Observing is a bisect and a few additions, cheap enough for every frame.
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+
+    def time(self):
+        return Timer(self)
+
+    def snapshot(self):
+        with self.lock:
+            return {"buckets": list(self.buckets), "counts": list(self.counts), "count": self.count, "sum": self.sum, "max": self.max}
+
+def quantile(histogram, q):
+    # Estimate from a histogram snapshot, linear within the bucket like Prometheus'
+    # histogram_quantile. None when nothing was observed.
+    if not histogram["count"]:
+        return None
+    rank = q * histogram["count"]
+    cumulative = 0
+    lower = 0.0
+    for bound, count in zip(histogram["buckets"], histogram["counts"]):
+        if count and cumulative + count >= rank:
+            return min(lower + (bound - lower) * (rank - cumulative) / count, histogram["max"])
+        cumulative += count
+        lower = bound
+    return histogram["max"]
+
+class Metrics:
+    # Counters and histograms of one process, by metric name and device (a camera's serial
+    # number or a shutter's serial port). Callers keep the Counter or Histogram they get, so
+    # recording a value never looks anything up.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def counter(self, name, device=""):
+        with self.lock:
+            return self.counters.setdefault((name, str(device)), Counter())
+
+    def histogram(self, name, device="", buckets=LATENCY_BUCKETS):
+        with self.lock:
+            return self.histograms.setdefault((name, str(device)), Histogram(buckets))
+
+    def snapshot(self):
+        with self.lock:
+            counters = list(self.counters.items())
+            histograms = list(self.histograms.items())
+        snapshot = {"time": time.time(), "pid": os.getpid(), "counters": {}, "histograms": {}}
+        for (name, device), counter in counters:
+            snapshot["counters"].setdefault(name, {})[device] = counter.value
+        for (name, device), histogram in histograms:
+            snapshot["histograms"].setdefault(name, {})[device] = histogram.snapshot()
+        return snapshot
+
+def escape_label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def format_prometheus(snapshot, process):
+    # Text exposition format, for node_exporter's textfile collector
+    lines = []
+    for name, devices in sorted(snapshot["counters"].items()):
+        lines.append(f"# TYPE {PREFIX}{name} counter")
+        for device, value in sorted(devices.items()):
+            lines.append(f'{PREFIX}{name}{{process="{escape_label(process)}",device="{escape_label(device)}"}} {value}')
+    for name, devices in sorted(snapshot["histograms"].items()):
+        lines.append(f"# TYPE {PREFIX}{name} histogram")
+        for device, histogram in sorted(devices.items()):
+            labels = f'process="{escape_label(process)}",device="{escape_label(device)}"'
+            cumulative = 0
+            for bound, count in zip(histogram["buckets"] + ["+Inf"], histogram["counts"]):
+                cumulative += count
+                lines.append(f'{PREFIX}{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"{PREFIX}{name}_sum{{{labels}}} {histogram['sum']}")
+            lines.append(f"{PREFIX}{name}_count{{{labels}}} {histogram['count']}")
+    return "\n".join(lines) + "\n"
+
+class MetricsExporter:
+    # Writes a process's metrics every interval seconds, as <name>.prom (replaced atomically)
+    # and as a line appended to <name>.jsonl, which keeps the history and is what the main
+    # GUI reads. The last export happens at exit.
+    def __init__(self, metrics, name, directory=None, interval=None, max_bytes=None):
+        self.metrics = metrics
+        self.name = name
+        self.directory = directory or SETTINGS["directory"]
+        self.interval = interval or SETTINGS["interval"]
+        self.max_bytes = max_bytes or SETTINGS["max_bytes"]
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.failed = False
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        atexit.register(self.export)
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.export()
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.export()
+
+    def export(self):
+        snapshot = self.metrics.snapshot()
+        snapshot["name"] = self.name
+        snapshot["interval"] = self.interval
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            write_text_atomic(os.path.join(self.directory, f"{self.name}.prom"), format_prometheus(snapshot, self.name))
+            history = os.path.join(self.directory, f"{self.name}.jsonl")
+            if os.path.exists(history) and os.path.getsize(history) > self.max_bytes:
+                os.replace(history, history + ".1")
+            with open(history, 'a') as f:
+                f.write(json.dumps(snapshot) + "\n")
+            self.failed = False
+        except Exception as e:
+            # Metrics never stop a capture, the failure is reported once until an export works again
+            if not self.failed:
+                print(f"Failed to export metrics to {self.directory}: {e}")
+            self.failed = True
+
+def read_last_line(path, max_bytes=65536):
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - max_bytes))
+        lines = f.read().splitlines()
+    return lines[-1] if lines else None
+
+def read_latest(directory=None):
+    # Latest snapshot exported by every process, by exporter name
+    snapshots = {}
+    for path in glob.glob(os.path.join(directory or SETTINGS["directory"], "*.jsonl")):
+        try:
+            line = read_last_line(path)
+            if line:
+                snapshot = json.loads(line)
+                snapshots[snapshot.get("name", os.path.basename(path)[:-len(".jsonl")])] = snapshot
+        except (OSError, ValueError):
+            continue  # Being rotated, or a line cut short by a crash
+    return snapshots
+
+_metrics = Metrics()
+_exporters = {}
+_exporters_lock = threading.Lock()
+
+def get_metrics():
+    # The process's registry, shared by every module
+    return _metrics
+
+def start_exporter(name):
+    # Export this process's metrics under name, once per name
+    with _exporters_lock:
+        if name not in _exporters:
+            _exporters[name] = MetricsExporter(_metrics, name)
+            _exporters[name].start()
+        return _exporters[name]
+
+def load_settings(path='config.ini'):
+    config = configparser.ConfigParser()
+    config.read(path)
+    if not config.has_section('Metrics'):
+        return
+    for key, default in SETTINGS.items():
+        if config.has_option('Metrics', key):
+            SETTINGS[key] = type(default)(config.get('Metrics', key))
+
+load_settings()
@@ -0,0 +1,150 @@
+import numpy as np
+import cv2
+
+# Bits per pixel of the pixel formats the preview understands
+PIXEL_FORMAT_BITS = {
+    "Mono8": 8,
+    "Mono10": 10,
+    "Mono10p": 10,
+    "Mono12": 12,
+    "Mono12p": 12,
+    "Mono12Packed": 12,
+    "Mono16": 16,
+}
+
+STRIDE = "stride"  # Every n-th pixel, the cheapest
+AREA = "area"  # Mean of each n x n block, smoother but reads every pixel
+DECIMATION_MODES = [STRIDE, AREA]
+
+HISTOGRAM_BINS = 256
+HISTOGRAM_HEIGHT = 80
+
+# The camera's own gamma is turned off at startup, so frames are linear in the light and their
+# shadows look black on a monitor. The preview brightens them with a display gamma; exposure
+# feedback (histogram, mean level, saturation) stays on the linear values.
+DISPLAY_GAMMA = 2.2
+
+class PreviewPipeline:
+    # Turns camera frames into a display image: decimate by an integer factor to fit max_size
+    # keeping the aspect ratio, scale the pixel values to 256 levels by the bit depth, map them
+    # to display values through a gamma lookup table, mark
+    # saturated pixels and draw a running histogram. Every buffer is allocated once and reused,
+    # so render() returns the same array each call; copy it to keep a frame.
+    def __init__(self, max_size=(640, 480), bit_depth=None, mode=STRIDE, overlay=True, histogram_decay=0.2, gamma=DISPLAY_GAMMA):
+        if mode not in DECIMATION_MODES:
+            raise ValueError(f"Unknown decimation mode {mode}, use one of {DECIMATION_MODES}")
+        self.max_width, self.max_height = max_size
+        self.bit_depth = bit_depth  # None to take it from the frame's dtype
+        self.mode = mode
+        self.overlay = overlay
+        self.histogram_decay = histogram_decay  # Weight of the newest frame in the running histogram
+        self.gamma = gamma  # 1 shows the linear values
+        self.histogram = np.zeros(HISTOGRAM_BINS, dtype=np.float64)
+        self.saturated_fraction = 0.0
+        self.mean_level = 0.0  # Mean pixel value as a fraction of full scale
+        self.layout = None
+        self.lut = None
+
+    def set_bit_depth(self, bit_depth):
+        self.bit_depth = bit_depth
+
+    def build_lut(self):
+        # Display value for each of the 256 levels the frame is reduced to, None for gamma 1,
+        # which needs no table
+        if self.lut is None and self.gamma != 1:
+            levels = np.arange(256) / 255.0
+            self.lut = np.round(255 * levels ** (1 / self.gamma)).astype(np.uint8)
+        return self.lut
+
+    def allocate(self, shape, dtype):
+        # Output size and buffers for one input shape
+        height, width = shape
+        factor = max(1, int(np.ceil(max(width / self.max_width, height / self.max_height))))
+        if self.mode == AREA:
+            out_height, out_width = height // factor, width // factor
+        else:
+            out_height, out_width = -(-height // factor), -(-width // factor)
+        self.layout = {
+            "shape": shape,
+            "dtype": np.dtype(dtype),
+            "factor": factor,
+            "small": np.empty((out_height, out_width), dtype=dtype),
+            "levels": np.empty((out_height, out_width), dtype=np.uint8),
+            "gray": np.empty((out_height, out_width), dtype=np.uint8),
+            "saturated": np.empty((out_height, out_width), dtype=np.uint8),
+            "unsaturated": np.empty((out_height, out_width), dtype=np.uint8),
+            "marked": np.empty((out_height, out_width), dtype=np.uint8),
+            "display": np.empty((out_height, out_width, 3), dtype=np.uint8),
+            "bars": np.arange(HISTOGRAM_HEIGHT)[:, np.newaxis],
+        }
+
+    def decimate(self, frame):
+        # Into the contiguous small buffer, which every later step reads
+        layout = self.layout
+        factor = layout["factor"]
+        small = layout["small"]
+        if factor == 1:
+            np.copyto(small, frame)
+        elif self.mode == STRIDE:
+            np.copyto(small, frame[::factor, ::factor])
+        else:
+            cv2.resize(frame[:small.shape[0] * factor, :small.shape[1] * factor], (small.shape[1], small.shape[0]),
+                       dst=small, interpolation=cv2.INTER_AREA)
+        return small
+
+    def render(self, frame):
+        if self.layout is None or self.layout["shape"] != frame.shape or self.layout["dtype"] != frame.dtype:
+            self.allocate(frame.shape, frame.dtype)
+        layout = self.layout
+        bits = self.bit_depth or frame.dtype.itemsize * 8
+        max_value = (1 << bits) - 1
+        small = self.decimate(frame)
+
+        # Reduce to 256 levels, then map them through the display table
+        if small.dtype == np.uint8 and bits == 8:
+            levels = small
+        else:
+            levels = layout["levels"]
+            cv2.convertScaleAbs(small, levels, 256.0 / (max_value + 1))
+        lut = self.build_lut()
+        if lut is None:
+            gray = levels
+        else:
+            gray = layout["gray"]
+            cv2.LUT(levels, lut, dst=gray)
+
+        # Exposure feedback from the decimated frame, which is plenty for a histogram.
+        # Saturation is judged on decimated pixels too, area averaging can hide single ones.
+        counts = cv2.calcHist([levels], [0], None, [HISTOGRAM_BINS], [0, 256]).ravel()
+        total = small.size
+        self.histogram *= 1.0 - self.histogram_decay
+        self.histogram += counts * (self.histogram_decay / total)
+        saturated = layout["saturated"]
+        cv2.compare(small, max_value, cv2.CMP_GE, dst=saturated)
+        self.saturated_fraction = cv2.countNonZero(saturated) / total
+        self.mean_level = cv2.mean(small)[0] / max_value
+
+        display = layout["display"]
+        if self.overlay:
+            # Saturated pixels are red: blue and green drop to 0 there, red goes to 255
+            cv2.subtract(gray, saturated, dst=layout["unsaturated"])
+            cv2.max(gray, saturated, dst=layout["marked"])
+            cv2.merge([layout["unsaturated"], layout["unsaturated"], layout["marked"]], dst=display)
+            self.draw_histogram(display)
+            cv2.putText(display, f"mean {self.mean_level * 100:.0f}%  saturated {self.saturated_fraction * 100:.2f}%",
+                        (8, 18), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (0, 255, 0), 1, cv2.LINE_AA)
+        else:
+            cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR, dst=display)
+        return display
+
+    def draw_histogram(self, display):
+        # Bars in the bottom-left corner, log scaled so the tails stay visible
+        height = min(HISTOGRAM_HEIGHT, display.shape[0])
+        width = min(HISTOGRAM_BINS, display.shape[1])
+        levels = np.log1p(self.histogram[:width] * 1000)
+        peak = levels.max()
+        bar_heights = (levels / peak * height).astype(np.int32) if peak > 0 else np.zeros(width, dtype=np.int32)
+        bars = (self.layout["bars"][:height] >= height - bar_heights).astype(np.uint8) * 255
+        region = display[-height:, :width]
+        region //= 2  # Darken the background behind the plot
+        cv2.max(region, cv2.cvtColor(bars, cv2.COLOR_GRAY2BGR), dst=region)
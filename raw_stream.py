@@ -0,0 +1,254 @@
+import json
+import os
+import time
+import numpy as np
+from camera_interface import CameraInterface, load_backend
+from frame_pool import FramePool
+
+# Sidecar index, one row per frame slot. valid is set once the frame's pixels are in the file,
+# so a recording cut short by a crash still opens with every completed frame.
+INDEX_DTYPE = np.dtype([
+    ("valid", "u1"),
+    ("timestamp", "f8"),  # Host time in seconds since the epoch
+    ("camera_timestamp", "u8"),  # Camera clock in nanoseconds
+    ("frame_id", "i8"),
+    ("exposure_time", "f8"),
+    ("gain", "f8"),
+    ("black_level", "f8"),
+])
+
+def stream_paths(path):
+    # The frame data, its index and the JSON header describing the layout
+    return path, path + ".idx", path + ".json"
+
+class RawStreamWriter:
+    # Fixed-stride raw recording: the frame file is preallocated for capacity frames and written
+    # through np.memmap, so appending a frame is a single copy with no encoding.
+    def __init__(self, path, shape, dtype, capacity):
+        data_path, index_path, header_path = stream_paths(path)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.capacity = capacity
+        with open(header_path, 'w') as f:
+            json.dump({"shape": list(self.shape), "dtype": self.dtype.str, "capacity": capacity}, f, indent=4)
+        self.frames = np.memmap(data_path, dtype=self.dtype, mode='w+', shape=(capacity,) + self.shape)
+        self.index = np.memmap(index_path, dtype=INDEX_DTYPE, mode='w+', shape=(capacity,))
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, frame, timestamp=None, camera_timestamp=0, frame_id=-1, exposure_time=np.nan, gain=np.nan, black_level=np.nan):
+        if self.count >= self.capacity:
+            raise IndexError(f"Raw stream is full ({self.capacity} frames)")
+        if frame.shape != self.shape:
+            raise ValueError(f"Frame shape {frame.shape} does not match the stream's {self.shape}")
+        position = self.count
+        np.copyto(self.frames[position], frame, casting='same_kind')
+        row = self.index[position]
+        row["timestamp"] = time.time() if timestamp is None else timestamp
+        row["camera_timestamp"] = camera_timestamp
+        row["frame_id"] = frame_id
+        row["exposure_time"] = exposure_time
+        row["gain"] = gain
+        row["black_level"] = black_level
+        row["valid"] = 1
+        self.count += 1
+        return position
+
+    def flush(self):
+        self.frames.flush()
+        self.index.flush()
+
+    def close(self):
+        self.flush()
+        del self.frames
+        del self.index
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+class RawStreamReader:
+    # Frames come back as read-only views into the memory-mapped file, nothing is read until used
+    def __init__(self, path):
+        data_path, index_path, header_path = stream_paths(path)
+        with open(header_path, 'r') as f:
+            header = json.load(f)
+        shape = (header["capacity"],) + tuple(header["shape"])
+        self.all_frames = np.memmap(data_path, dtype=np.dtype(header["dtype"]), mode='r', shape=shape)
+        self.all_index = np.memmap(index_path, dtype=INDEX_DTYPE, mode='r', shape=(header["capacity"],))
+        invalid = np.flatnonzero(self.all_index["valid"] == 0)
+        self.count = int(invalid[0]) if invalid.size else header["capacity"]
+        self.frames = self.all_frames[:self.count]
+        self.index = self.all_index[:self.count]
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, item):
+        return self.frames[item]
+
+    def metadata(self, frame_index):
+        row = self.index[frame_index]
+        return {name: row[name].item() for name in INDEX_DTYPE.names if name != "valid"}
+
+    def frame_range(self, start_time, end_time):
+        # Indices of the frames with start_time <= timestamp < end_time
+        timestamps = self.index["timestamp"]
+        return int(np.searchsorted(timestamps, start_time, side="left")), int(np.searchsorted(timestamps, end_time, side="left"))
+
+    def frames_between(self, start_time, end_time):
+        start, stop = self.frame_range(start_time, end_time)
+        return self.frames[start:stop]
+
+class ReplayFrame:
+    # Matches the FrameLease interface used by the live view
+    def __init__(self, frame, frame_id, timestamp):
+        self.frame = frame
+        self.frame_id = frame_id
+        self.timestamp = timestamp
+
+    def release(self):
+        self.frame = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+class ReplaySource:
+    # Plays a raw stream back with its recorded timing scaled by speed. It has the same
+    # start/stop/get_latest/stats interface as FrameGrabber, so the live view can show it.
+    # Frames are picked by playback time, a slow display skips frames rather than falling behind.
+    def __init__(self, reader, speed=1.0, loop=False):
+        self.reader = reader
+        self.speed = speed
+        self.loop = loop
+        # The camera clock gives the true frame spacing, host timestamps are the fallback
+        camera_timestamps = reader.index["camera_timestamp"]
+        if len(reader) and np.all(camera_timestamps > 0):
+            timestamps = camera_timestamps.astype(np.float64) / 1e9
+        else:
+            timestamps = reader.index["timestamp"]
+        self.offsets = timestamps - timestamps[0] if len(reader) else timestamps
+        self.finished = len(reader) == 0
+        self.error = None
+        self.last_position = -1
+        self.frames_shown = 0
+        self.frames_replaced = 0
+        self.start_time = None
+
+    def start(self):
+        self.start_time = time.monotonic()
+        self.last_position = -1
+
+    def stop(self):
+        self.finished = True
+
+    def playback_time(self, now):
+        # Position in the recording, in seconds from its first frame
+        playback_time = (now - self.start_time) * self.speed
+        duration = self.offsets[-1]
+        if self.loop and duration > 0:
+            playback_time %= duration
+        return playback_time
+
+    def get_latest(self, timeout=None):
+        if self.finished:
+            return None
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            now = time.monotonic()
+            playback_time = self.playback_time(now)
+            position = int(np.searchsorted(self.offsets, playback_time, side="right")) - 1
+            if self.loop and position < self.last_position:
+                self.last_position = -1  # Wrapped around to the start
+            if position > self.last_position:
+                break
+            if position >= len(self.offsets) - 1 and not self.loop:
+                self.finished = True
+                return None
+            if deadline is not None and now >= deadline:
+                return None
+            # Sleep until the next frame is due, or the timeout
+            if position + 1 < len(self.offsets):
+                wait = (self.offsets[position + 1] - playback_time) / self.speed
+            else:
+                wait = (self.offsets[-1] - playback_time) / self.speed + 0.001  # Looping back to the start
+            if deadline is not None:
+                wait = min(wait, deadline - now)
+            time.sleep(max(0.0, wait))
+        if self.last_position >= 0:
+            self.frames_replaced += position - self.last_position - 1
+        self.last_position = position
+        self.frames_shown += 1
+        return ReplayFrame(self.reader[position], int(self.reader.index[position]["frame_id"]), float(self.reader.index[position]["timestamp"]))
+
+    def stats(self):
+        elapsed = time.monotonic() - self.start_time if self.start_time else 0.0
+        return {
+            "frames_grabbed": self.frames_shown,
+            "frames_replaced": self.frames_replaced,
+            "incomplete_frames": 0,
+            "pool_drops": 0,
+            "stream_restarts": 0,
+            "acquisition_fps": self.frames_shown / elapsed if elapsed else 0.0,
+        }
+
+def record_stream(cam, path, num_frames):
+    # Record num_frames frames from a streaming camera. Frames are wrapped without copying and
+    # copied once, straight from the camera buffer into the file.
+    pool = FramePool(num_slots=2)
+    settings = {}
+    for prop, field in (("ExposureTime", "exposure_time"), ("Gain", "gain"), ("BlackLevel", "black_level")):
+        try:
+            settings[field] = float(cam.get_property(prop))
+        except Exception as e:
+            print(f"Failed to read {prop}: {e}")
+    writer = None
+    try:
+        while writer is None or len(writer) < num_frames:
+            lease = cam.get_frame_into(pool, copy=False)
+            if lease is None:
+                continue
+            with lease:
+                if writer is None:
+                    writer = RawStreamWriter(path, lease.frame.shape, lease.frame.dtype, num_frames)
+                writer.append(lease.frame, camera_timestamp=lease.timestamp, frame_id=lease.frame_id, **settings)
+    finally:
+        if writer is not None:
+            writer.close()
+    return num_frames
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Raw Stream Recording Script')
+    parser.add_argument('cam_id', type=int, help='Camera ID to use')
+    parser.add_argument('path', type=str, help='Raw stream file to write')
+    parser.add_argument('--frames', type=int, default=1000, help='Number of frames to record')
+    parser.add_argument('--backend', choices=['spinnaker', 'simulated'], default='spinnaker', help='Camera backend to use')
+    args = parser.parse_args()
+
+    cam = None
+    try:
+        cam = CameraInterface(cam_id=args.cam_id, backend=load_backend(args.backend))
+        start_time = time.perf_counter()
+        record_stream(cam, args.path, args.frames)
+        elapsed = time.perf_counter() - start_time
+        print(f"Recorded {args.frames} frames to {args.path} in {elapsed:.1f} seconds ({args.frames / elapsed:.1f} fps)")
+    except Exception as e:
+        print(f'Recording failed: {e}')
+    finally:
+        if cam:
+            try:
+                cam.stop_acquisition()
+            except Exception as e:
+                print(f'Failed to stop acquisition: {e}')
+            del cam
@@ -0,0 +1,185 @@
+import os
+import queue
+import threading
+import time
+from camera_interface import CameraInterface, load_config, load_backend, load_mode
+from frame_pool import FramePool
+from frame_writer import CODECS, DEFAULT_CODEC, codec_path, write_frame
+from metrics import start_exporter
+
+class Recorder:
+    # Records every frame of a continuously acquiring camera. A grab thread copies frames into a
+    # FramePool and hands them to a pool of writer threads through a bounded queue; when the
+    # writers can't keep up the queue fills and new frames are dropped and counted, so the
+    # camera is never stalled by the disk.
+    def __init__(self, cam, output_dir, base_name='frame', codec=DEFAULT_CODEC, level=None, num_writers=4, queue_size=64):
+        self.cam = cam
+        self.output_dir = output_dir
+        self.base_name = base_name
+        self.codec = codec  # See frame_writer.CODECS
+        self.level = level
+        self.num_writers = num_writers
+        self.queue = queue.Queue(maxsize=queue_size)
+        # Every queued frame, one per writer and the one being grabbed hold a slot
+        self.pool = FramePool(num_slots=queue_size + num_writers + 1)
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+        self.threads = []
+        self.error = None
+        self.frames_grabbed = 0
+        self.frames_written = 0
+        self.bytes_written = 0
+        self.queue_full_drops = 0
+        self.incomplete_frames = 0
+        self.stream_restarts = 0
+        self.write_errors = 0
+        self.peak_queue_depth = 0
+        self.start_time = None
+        self.grab_stop_time = None
+        self.stop_time = None
+
+    def start(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.stop_event.clear()
+        self.start_time = time.perf_counter()
+        self.grab_stop_time = None
+        self.stop_time = None
+        self.threads = [threading.Thread(target=self.write_frames, daemon=True) for _ in range(self.num_writers)]
+        for thread in self.threads:
+            thread.start()
+        self.grab_thread = threading.Thread(target=self.grab_frames, daemon=True)
+        self.grab_thread.start()
+
+    def stop(self):
+        # Stops grabbing, then waits for the writers to save every frame already queued
+        self.stop_event.set()
+        self.grab_thread.join()
+        self.grab_stop_time = time.perf_counter()
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.stop_time = time.perf_counter()
+
+    def record(self, duration):
+        self.start()
+        try:
+            while time.perf_counter() - self.start_time < duration and self.grab_thread.is_alive():
+                time.sleep(0.1)
+        finally:
+            self.stop()
+        if self.error:
+            raise self.error
+        return self.stats()
+
+    def grab_frames(self):
+        pool_drops = self.pool.dropped_frames
+        while not self.stop_event.is_set():
+            try:
+                lease = self.cam.get_frame_into(self.pool)
+            except self.cam.spin.SpinnakerException as e:
+                if "Stream has been aborted" in str(e):
+                    self.stream_restarts += 1
+                    print("Stream aborted during recording, restarting acquisition...")
+                    try:
+                        self.cam.restart_acquisition()
+                    except Exception as restart_error:
+                        print(f"Failed to restart acquisition: {restart_error}")
+                        self.error = restart_error
+                        break
+                    continue
+                self.error = e
+                break
+            except Exception as e:
+                self.error = e
+                break
+            if lease is None:
+                if self.pool.dropped_frames == pool_drops:
+                    self.incomplete_frames += 1
+                pool_drops = self.pool.dropped_frames
+                continue
+            lease.frame_id = self.frames_grabbed  # Sequence number within this recording
+            self.frames_grabbed += 1
+            try:
+                self.queue.put_nowait(lease)
+            except queue.Full:
+                lease.release()
+                self.queue_full_drops += 1
+            self.peak_queue_depth = max(self.peak_queue_depth, self.queue.qsize())
+
+    def write_frames(self):
+        while True:
+            lease = self.queue.get()
+            if lease is None:
+                return
+            with lease:
+                filepath = codec_path(os.path.join(self.output_dir, f"{self.base_name}_{lease.frame_id:08d}"), self.codec)
+                try:
+                    with self.cam.write_latency.time():
+                        write_frame(filepath, lease.frame, self.codec, self.level)
+                except Exception as e:
+                    print(f"Failed to write frame {lease.frame_id}: {e}")
+                    with self.lock:
+                        self.write_errors += 1
+                    continue
+                with self.lock:
+                    self.frames_written += 1
+                    self.bytes_written += lease.frame.nbytes
+
+    def stats(self):
+        now = time.perf_counter()
+        elapsed = (self.stop_time or now) - self.start_time  # Includes writing out the queue after grabbing stopped
+        grab_elapsed = (self.grab_stop_time or now) - self.start_time
+        dropped = self.queue_full_drops + self.pool.dropped_frames
+        return {
+            "elapsed": elapsed,
+            "frames_grabbed": self.frames_grabbed,
+            "frames_written": self.frames_written,
+            "dropped_frames": dropped,
+            "incomplete_frames": self.incomplete_frames,
+            "stream_restarts": self.stream_restarts,
+            "write_errors": self.write_errors,
+            "queue_depth": self.queue.qsize(),
+            "peak_queue_depth": self.peak_queue_depth,
+            "grab_fps": self.frames_grabbed / grab_elapsed if grab_elapsed else 0.0,
+            "write_mb_per_s": self.bytes_written / 1e6 / elapsed if elapsed else 0.0,
+        }
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Continuous Recording Script')
+    parser.add_argument('cam_id', type=int, help='Camera ID to use')
+    parser.add_argument('output_dir', type=str, help='Folder to write the frames to')
+    parser.add_argument('--duration', type=float, default=10.0, help='Recording length in seconds')
+    parser.add_argument('--writers', type=int, default=4, help='Number of writer threads')
+    parser.add_argument('--queue-size', type=int, default=64, help='Frames buffered for the writers before frames are dropped')
+    parser.add_argument('--base-name', type=str, default='frame', help='Base file name for the frames')
+    parser.add_argument('--codec', choices=list(CODECS), default=DEFAULT_CODEC, help='File format and compression of the frames')
+    parser.add_argument('--level', type=int, help='PNG compression level, 0 to 9')
+    parser.add_argument('--mode', type=str, help='Record in the image format of this profile, or e.g. "Height=540,OffsetY=270,PixelFormat=Mono12p"')
+    parser.add_argument('--backend', choices=['spinnaker', 'simulated'], default='spinnaker', help='Camera backend to use')
+    args = parser.parse_args()
+
+    cam = None
+    start_exporter(f"recorder-cam{args.cam_id}")
+    try:
+        cam = CameraInterface(cam_id=args.cam_id, backend=load_backend(args.backend))
+        cam.apply_config(load_config(cam.serial_number))
+        if args.mode:
+            cam.set_image_format(load_mode(cam.serial_number, args.mode))
+            print(f"Recording mode: {cam.get_image_format()}")
+        recorder = Recorder(cam, args.output_dir, base_name=args.base_name, codec=args.codec, level=args.level,
+                            num_writers=args.writers, queue_size=args.queue_size)
+        stats = recorder.record(args.duration)
+        print(f"Recorded {stats['frames_written']} frames in {stats['elapsed']:.1f} seconds "
+              f"({stats['grab_fps']:.1f} fps, {stats['write_mb_per_s']:.1f} MB/s), "
+              f"dropped {stats['dropped_frames']}, incomplete {stats['incomplete_frames']}")
+    except Exception as e:
+        print(f'Recording failed: {e}')
+    finally:
+        if cam:
+            try:
+                cam.stop_acquisition()
+            except Exception as e:
+                print(f'Failed to stop acquisition: {e}')
+            del cam
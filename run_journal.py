@@ -0,0 +1,148 @@
+import json
+import math
+import os
+import threading
+import time
+
+# Journal records, one JSON object per line
+START = "start"  # A run began, with its settings and schedule
+RESUME = "resume"  # The run was picked up again after a stop or crash
+PLANNED = "planned"  # A capture is about to be taken
+COMPLETED = "completed"  # A capture was saved, with where it went
+FAILED = "failed"  # A capture failed after all its retries
+MISSED = "missed"  # Captures dropped because their deadlines passed while the run was down
+FINISHED = "finished"  # The schedule ran to the end
+STOPPED = "stopped"  # The user stopped the run
+
+class RunJournal:
+    # Append-only log of an interval run, so a run that dies with its process (Tk crash, OOM,
+    # reboot) can be picked up again. Every record is written and flushed to the OS at once,
+    # which survives a crash of the process; fsync, for a crash of the machine, is batched on a
+    # background thread every sync_interval seconds so a capture never waits for the disk.
+    def __init__(self, path, sync_interval=1.0):
+        self.path = path
+        self.sync_interval = sync_interval
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file = open(path, 'a')
+        if self.file.tell() > 0:
+            with open(path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    self.file.write("\n")  # End a line cut short by a crash, so it doesn't swallow the next record
+        self.lock = threading.Lock()
+        self.dirty = threading.Event()
+        self.closed = threading.Event()
+        self.syncs = 0
+        self.sync_thread = threading.Thread(target=self.sync_periodically, daemon=True)
+        self.sync_thread.start()
+
+    def write(self, event, **fields):
+        line = json.dumps({"event": event, "time": time.time(), **fields}) + "\n"
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+        self.dirty.set()
+
+    def start(self, settings, start_time, interval, total):
+        # start_time is the wall clock time of capture 0, interval in seconds
+        self.write(START, settings=settings, start_time=start_time, interval=interval, total=total)
+
+    def sync(self):
+        # Only called from the sync thread, which close() stops first, so the file stays open
+        with self.lock:
+            self.dirty.clear()
+        os.fsync(self.file.fileno())  # Outside the lock, writes carry on meanwhile
+        self.syncs += 1
+
+    def sync_periodically(self):
+        while not self.closed.is_set():
+            self.dirty.wait()
+            if self.closed.wait(self.sync_interval):
+                break
+            try:
+                self.sync()
+            except Exception as e:
+                print(f"Failed to sync the run journal {self.path}: {e}")
+
+    def close(self):
+        self.closed.set()
+        self.dirty.set()
+        self.sync_thread.join()
+        with self.lock:
+            if not self.file.closed:
+                self.file.flush()
+                os.fsync(self.file.fileno())
+                self.syncs += 1
+                self.file.close()
+
+class RunState:
+    # The latest run in a journal, rebuilt from its records
+    def __init__(self, start):
+        self.settings = start["settings"]
+        self.start_time = start["start_time"]
+        self.interval = start["interval"]
+        self.total = start["total"]
+        self.captures = {}  # Index -> completed record, the last attempt that was saved
+        self.failed = set()
+        self.missed = set()
+        self.in_flight = None  # Planned but never completed or failed, the capture the run died in
+        self.resumes = 0
+        self.ended = None  # FINISHED or STOPPED, None if the run died
+
+    def apply(self, record):
+        event = record["event"]
+        if event == PLANNED:
+            self.in_flight = record["index"]
+        elif event == COMPLETED:
+            self.captures[record["index"]] = record
+            self.in_flight = None
+        elif event == FAILED:
+            self.failed.add(record["index"])
+            self.in_flight = None
+        elif event == MISSED:
+            self.missed.update(range(record["first"], record["last"] + 1))
+        elif event == RESUME:
+            self.resumes += 1
+            self.ended = None
+        elif event in (FINISHED, STOPPED):
+            self.ended = event
+
+    @property
+    def captured(self):
+        return len(self.captures)
+
+    @property
+    def resumable(self):
+        return self.ended != FINISHED and self.next_index() < self.total
+
+    def next_index(self):
+        # First capture after the last one that was taken or given up on
+        done = set(self.captures) | self.failed | self.missed
+        return max(done) + 1 if done else 0
+
+    def first_due(self, now=None, skip_missed=True):
+        # Where a resumed schedule starts: the next capture, or with skip_missed the first one
+        # whose deadline hasn't passed yet
+        now = time.time() if now is None else now
+        index = self.next_index()
+        if skip_missed:
+            index = max(index, math.ceil((now - self.start_time) / self.interval))
+        return min(index, self.total)
+
+def read_journal(path):
+    # Returns the RunState of the last run in the journal, None if it has none. A line cut
+    # short by a crash can only be the last one and is ignored.
+    state = None
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record["event"] == START:
+                state = RunState(record)
+            elif state is not None:
+                state.apply(record)
+    return state
@@ -0,0 +1,155 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError
+import serial
+from metrics import get_metrics
+
+READY_MESSAGE = "Shutter Control Ready"
+
+# Acknowledgements ServoControl.ino prints for each command
+ACKNOWLEDGEMENTS = {
+    "OPEN": ("Shutter Opened", "Shutter already open"),
+    "CLOSE": ("Shutter Closed", "Shutter already closed"),
+}
+# Anything else is answered with the current state
+STATE_MESSAGES = ("Shutter already open", "Shutter already closed")
+
+class ShutterError(Exception):
+    pass
+
+class ShutterResponse:
+    def __init__(self, command, message, latency):
+        self.command = command
+        self.message = message
+        self.latency = latency  # Seconds from writing the command to its acknowledgement
+
+    def __str__(self):
+        return self.message
+
+class ShutterController:
+    # Talks to the shutter Arduino without fixed sleeps. A reader thread matches every line the
+    # sketch prints to the command waiting for it, so a command completes as soon as the
+    # Arduino acknowledges it. Commands are answered in order, one at a time.
+    def __init__(self, port, baudrate=9600, ready_timeout=3.0, command_timeout=2.0):
+        self.port = port
+        self.command_timeout = command_timeout
+        self.ready_event = threading.Event()
+        self.write_lock = threading.Lock()
+        self.pending = deque()  # (command, future, sent_at) waiting for their acknowledgement
+        self.is_open = None  # Unknown until the first acknowledgement
+        self.latencies = deque(maxlen=1000)
+        self.latency_histogram = get_metrics().histogram("shutter_latency_seconds", port)
+        self.failures_counter = get_metrics().counter("shutter_failures_total", port)
+        self.running = True
+        self.serial = serial.Serial(port, baudrate, timeout=0.1)
+        self.reader_thread = threading.Thread(target=self.read_responses, daemon=True)
+        self.reader_thread.start()
+        # Opening the port resets the Uno, which announces itself once the sketch is running
+        if not self.ready_event.wait(ready_timeout):
+            print(f"No ready message from the shutter on {port} within {ready_timeout} seconds, continuing anyway")
+
+    def read_responses(self):
+        buffer = b""
+        while self.running:
+            try:
+                chunk = self.serial.read(self.serial.in_waiting or 1)
+            except Exception as e:
+                if self.running:
+                    print(f"Shutter connection on {self.port} failed: {e}")
+                    self.fail_pending(ShutterError(str(e)))
+                return
+            if not chunk:
+                continue
+            buffer += chunk
+            while b"\n" in buffer:
+                line, buffer = buffer.split(b"\n", 1)
+                self.handle_line(line.decode(errors="replace").strip())
+
+    def handle_line(self, line):
+        if not line:
+            return
+        if line == READY_MESSAGE:
+            self.is_open = False  # The sketch closes the shutter on startup
+            self.ready_event.set()
+            return
+        with self.write_lock:
+            match = None
+            while self.pending:
+                command, future, sent_at = self.pending.popleft()
+                if line in ACKNOWLEDGEMENTS.get(command, STATE_MESSAGES):
+                    match = (command, future, sent_at)
+                    break
+                # The Arduino answered a later command, so this one was lost
+                if not future.done():  # Timed out commands were counted as failures already
+                    self.failures_counter.increment()
+                    future.set_exception(ShutterError(f"No acknowledgement for {command}, got '{line}'"))
+        if match is None:
+            print(f"Unexpected message from the shutter: {line}")
+            return
+        command, future, sent_at = match
+        latency = time.perf_counter() - sent_at
+        self.is_open = line in ("Shutter Opened", "Shutter already open")
+        self.latencies.append(latency)
+        self.latency_histogram.observe(latency)
+        if not future.done():  # Cancelled when its caller timed out
+            future.set_result(ShutterResponse(command, line, latency))
+
+    def fail_pending(self, error):
+        with self.write_lock:
+            while self.pending:
+                _, future, _ = self.pending.popleft()
+                if not future.done():
+                    future.set_exception(error)
+
+    def send(self, command):
+        # Returns a Future resolved with the ShutterResponse once the Arduino acknowledges it
+        future = Future()
+        with self.write_lock:
+            self.pending.append((command, future, time.perf_counter()))
+            try:
+                self.serial.write((command + '\n').encode())
+            except Exception as e:
+                self.pending.pop()
+                future.set_exception(ShutterError(f"Failed to send {command}: {e}"))
+        return future
+
+    def send_async(self, command):
+        # Awaitable version of send() for asyncio code
+        return asyncio.wrap_future(self.send(command))
+
+    def command(self, command, timeout=None):
+        # Blocking send, returns the acknowledgement text or None on failure
+        future = self.send(command)
+        try:
+            return future.result(timeout or self.command_timeout).message
+        except TimeoutError:
+            future.cancel()
+            self.failures_counter.increment()
+            print(f"No acknowledgement for {command} from the shutter within {timeout or self.command_timeout} seconds")
+        except Exception as e:
+            print(f"Failed to send command to Arduino: {e}")
+        return None
+
+    def open_shutter(self, timeout=None):
+        return self.command("OPEN", timeout)
+
+    def close_shutter(self, timeout=None):
+        return self.command("CLOSE", timeout)
+
+    def latency_stats(self):
+        latencies = sorted(self.latencies)
+        if not latencies:
+            return {"count": 0}
+        return {
+            "count": len(latencies),
+            "median": latencies[len(latencies) // 2],
+            "max": latencies[-1],
+        }
+
+    def disconnect(self):
+        self.running = False
+        self.reader_thread.join(timeout=1)
+        self.serial.close()
+        self.fail_pending(ShutterError("Shutter connection closed"))
@@ -0,0 +1,201 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+import zlib
+from concurrent.futures import TimeoutError
+from multiprocessing.connection import Listener, Client
+from config_store import load_authkey
+from shutter import ShutterController, ShutterError
+from metrics import start_exporter
+
+# One broker per serial port keeps the Arduino connection open for every client, so opening the
+# live view or the interval GUI no longer resets the board. Brokers listen on localhost, the
+# TCP port is derived from the serial port name. Two names can get the same TCP port, so a
+# client checks which serial port the broker it reached serves before sending it commands.
+BASE_PORT = 6250
+PORT_RANGE = 500
+
+def broker_address(serial_port):
+    return ('localhost', BASE_PORT + zlib.crc32(serial_port.encode()) % PORT_RANGE)
+
+class ShutterBroker:
+    def __init__(self, serial_port, baudrate=9600, idle_timeout=600):
+        self.serial_port = serial_port
+        self.idle_timeout = idle_timeout  # Seconds without clients before the broker exits, 0 to never exit
+        self.shutter = ShutterController(serial_port, baudrate)
+        self.command_lock = threading.Lock()  # One command on the wire at a time, whoever sends it
+        self.clients = 0
+        self.clients_lock = threading.Lock()
+        self.idle_since = time.monotonic()
+        self.running = True
+        self.listener = Listener(broker_address(serial_port), authkey=load_authkey())
+        print(f"Shutter broker for {serial_port} listening on {self.listener.address}")
+
+    def serve_forever(self):
+        threading.Thread(target=self.watch_idle, daemon=True).start()
+        try:
+            while self.running:
+                try:
+                    conn = self.listener.accept()
+                except Exception as e:
+                    print(f"Rejected connection: {e}")
+                    continue
+                if not self.running:
+                    conn.close()
+                    break
+                threading.Thread(target=self.handle_connection, args=(conn,), daemon=True).start()
+        finally:
+            self.listener.close()
+            self.shutter.disconnect()
+
+    def watch_idle(self):
+        while self.running and self.idle_timeout:
+            time.sleep(1)
+            with self.clients_lock:
+                idle = self.clients == 0 and time.monotonic() - self.idle_since > self.idle_timeout
+            if idle:
+                print(f"No clients for {self.idle_timeout} seconds, shutting down")
+                self.shutdown()
+
+    def handle_connection(self, conn):
+        with self.clients_lock:
+            self.clients += 1
+        try:
+            with conn:
+                while self.running:
+                    try:
+                        request = conn.recv()
+                    except (EOFError, OSError):
+                        return
+                    command = request[0]
+                    if command == 'hello':
+                        conn.send(('ok', self.serial_port))
+                    elif command == 'command':
+                        conn.send(self.send_command(request[1], request[2]))
+                    elif command == 'state':
+                        conn.send(('ok', self.shutter.is_open))
+                    elif command == 'stats':
+                        conn.send(('ok', self.shutter.latency_stats()))
+                    elif command == 'shutdown':
+                        conn.send(('ok', None))
+                        self.shutdown()
+                        return
+                    else:
+                        conn.send(('error', f"Unknown request: {command}"))
+        finally:
+            with self.clients_lock:
+                self.clients -= 1
+                if self.clients == 0:
+                    self.idle_since = time.monotonic()
+
+    def send_command(self, command, timeout):
+        with self.command_lock:
+            future = self.shutter.send(command)
+            try:
+                response = future.result(timeout or self.shutter.command_timeout)
+            except Exception as e:
+                future.cancel()
+                if isinstance(e, TimeoutError):
+                    self.shutter.failures_counter.increment()
+                return ('error', f"{command} failed: {str(e) or 'no acknowledgement'}")
+            return ('ok', (response.message, response.latency))
+
+    def shutdown(self):
+        self.running = False
+        # Wake up the accept() call in serve_forever so it sees the flag
+        try:
+            Client(self.listener.address, authkey=load_authkey()).close()
+        except Exception:
+            pass
+
+class ShutterClient:
+    # Same interface as ShutterController, with the commands carried out by the port's broker
+    def __init__(self, serial_port):
+        self.serial_port = serial_port
+        self.lock = threading.Lock()
+        self.conn = Client(broker_address(serial_port), authkey=load_authkey())
+        try:
+            broker_port = self.request('hello')
+        except Exception:
+            self.conn.close()
+            raise
+        if broker_port != serial_port:
+            self.conn.close()
+            raise ShutterError(f"The broker on {broker_address(serial_port)} serves {broker_port}, not {serial_port}; stop it or use another port name")
+
+    def request(self, *message):
+        with self.lock:
+            self.conn.send(message)
+            status, result = self.conn.recv()
+        if status != 'ok':
+            raise ShutterError(result)
+        return result
+
+    def command(self, command, timeout=None):
+        # Returns the acknowledgement text or None on failure
+        try:
+            message, _ = self.request('command', command, timeout)
+            return message
+        except Exception as e:
+            print(f"Failed to send command to Arduino: {e}")
+            return None
+
+    def open_shutter(self, timeout=None):
+        return self.command("OPEN", timeout)
+
+    def close_shutter(self, timeout=None):
+        return self.command("CLOSE", timeout)
+
+    @property
+    def is_open(self):
+        return self.request('state')
+
+    def latency_stats(self):
+        return self.request('stats')
+
+    def shutdown_broker(self):
+        try:
+            self.request('shutdown')
+        finally:
+            self.disconnect()
+
+    def disconnect(self):
+        # Leaves the broker, and the Arduino connection, running for the next client
+        self.conn.close()
+
+def connect_shutter(serial_port, baudrate=9600, python='python3.10', startup_timeout=10):
+    # Connect to the broker for serial_port, starting one if none is running
+    try:
+        return ShutterClient(serial_port)
+    except ConnectionRefusedError:
+        pass
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'shutter_broker.py')
+    proc = subprocess.Popen([python, script, serial_port, '--baudrate', str(baudrate)])
+    deadline = time.monotonic() + startup_timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise ShutterError(f"Shutter broker for {serial_port} exited with code {proc.returncode}")
+        try:
+            return ShutterClient(serial_port)
+        except ConnectionRefusedError:
+            time.sleep(0.05)
+    proc.terminate()
+    raise ShutterError(f"Shutter broker for {serial_port} did not start within {startup_timeout} seconds")
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Shutter Broker')
+    parser.add_argument('serial_port', type=str, help='Serial port of the shutter Arduino')
+    parser.add_argument('--baudrate', type=int, default=9600, help='Serial baud rate')
+    parser.add_argument('--idle-timeout', type=float, default=600, help='Seconds without clients before exiting, 0 to run forever')
+    args = parser.parse_args()
+
+    start_exporter(f"shutter_broker-{os.path.basename(args.serial_port)}")
+    try:
+        broker = ShutterBroker(args.serial_port, args.baudrate, idle_timeout=args.idle_timeout)
+    except Exception as e:
+        print(f'Failed to start shutter broker: {e}')
+        sys.exit(1)
+    broker.serve_forever()
@@ -0,0 +1,615 @@
+# Simulated stand-in for the PySpin module.
+# CameraInterface(backend=simulated_camera) runs the same code paths as with a FLIR camera,
+# which lets the capture tools be exercised and benchmarked without the hardware or the SDK.
+import configparser
+import random
+import threading
+import time
+import numpy as np
+
+# Interface types, numbered as in PySpin
+intfIValue = 0
+intfIBase = 1
+intfIInteger = 2
+intfIBoolean = 3
+intfICommand = 4
+intfIFloat = 5
+intfIString = 6
+intfIRegister = 7
+intfICategory = 8
+intfIEnumeration = 9
+intfIEnumEntry = 10
+intfIPort = 11
+
+AcquisitionMode_Continuous = 0
+AcquisitionMode_SingleFrame = 1
+AcquisitionMode_MultiFrame = 2
+
+TriggerMode_Off = 0
+TriggerMode_On = 1
+
+TriggerSource_Software = 0
+TriggerSource_Line0 = 1
+TriggerSource_Line1 = 2
+TriggerSource_Line2 = 3
+TriggerSource_Line3 = 4
+
+LineMode_Input = 0
+LineMode_Output = 1
+
+LineSource_Off = 0
+LineSource_ExposureActive = 1
+
+PixelFormat_Mono8 = 0
+PixelFormat_Mono12p = 1
+PixelFormat_Mono16 = 2
+
+EVENT_TIMEOUT_INFINITE = 0xFFFFFFFFFFFFFFFF
+
+IMAGE_STATUS_OK = 0
+IMAGE_STATUS_INCOMPLETE = 3  # Missing packets
+
+TRIGGER_SOURCES = {
+    "Software": TriggerSource_Software,
+    "Line0": TriggerSource_Line0,
+    "Line1": TriggerSource_Line1,
+    "Line2": TriggerSource_Line2,
+    "Line3": TriggerSource_Line3,
+}
+
+PIXEL_FORMATS = {8: PixelFormat_Mono8, 12: PixelFormat_Mono12p, 16: PixelFormat_Mono16}
+PIXEL_FORMAT_BITS = {PixelFormat_Mono8: 8, PixelFormat_Mono12p: 12, PixelFormat_Mono16: 16}
+PIXEL_FORMAT_BYTES = {PixelFormat_Mono8: 1.0, PixelFormat_Mono12p: 1.5, PixelFormat_Mono16: 2.0}  # On the link, Mono12p is packed
+
+# Nodes the camera only accepts while not acquiring
+STREAM_LOCKED = ("PixelFormat", "BinningHorizontal", "BinningVertical", "Width", "Height")
+
+# Settings used for every simulated camera, change them with configure() or in the
+# [SimulatedCamera] section of config.ini
+SETTINGS = {
+    "num_cameras": 2,
+    "width": 1440,  # Sensor size
+    "height": 1080,
+    "bit_depth": 8,
+    "frame_rate": 60.0,  # Full sensor readout rate, fewer rows read faster
+    "link_bandwidth": 380.0,  # MB/s the interface carries, USB3 by default, 0 for no limit
+    "incomplete_rate": 0.0,  # Probability that a frame is delivered incomplete
+    "abort_rate": 0.0,  # Probability that a GetNextImage call aborts the stream
+    "buffer_count": 10,  # Frames the stream buffers before the oldest are dropped
+    "model": "Simulated Camera",
+    "serial_base": 90000000,
+    "seed": 0,
+}
+
+# Exposure time (us) at which the synthetic scene fills the lower half of the pixel range
+REFERENCE_EXPOSURE = 10000.0
+
+class SpinnakerException(Exception):
+    pass
+
+class _EnumEntry:
+    def __init__(self, name, value):
+        self.name = name
+        self.value = value
+
+    def GetValue(self):
+        return self.value
+
+    def GetSymbolic(self):
+        return self.name
+
+class _Node:
+    def __init__(self, name, interface, value, writable=True, min_value=None, max_value=None, entries=None, command=None, increment=None, on_change=None):
+        self.name = name
+        self.interface = interface
+        self.value = value
+        self.writable = writable
+        self.min_value = min_value
+        self.max_value = max_value
+        self.entries = entries or {}
+        self.command = command
+        self.increment = increment
+        self.on_change = on_change  # Called after every write, for nodes whose value moves other nodes' limits
+
+    def GetName(self):
+        return self.name
+
+    def GetPrincipalInterfaceType(self):
+        return self.interface
+
+    def GetValue(self):
+        return self.value
+
+    def SetValue(self, value):
+        if not self.writable:
+            raise SpinnakerException(f"Node {self.name} is not writable")
+        if self.interface == intfIEnumeration:
+            self.SetIntValue(value)
+            return
+        if self.min_value is not None and not self.min_value <= value <= self.max_value:
+            raise SpinnakerException(f"Value {value} for {self.name} is out of range [{self.min_value}, {self.max_value}]")
+        if self.interface == intfIInteger:
+            value = int(value)
+            if self.increment and (value - (self.min_value or 0)) % self.increment:
+                raise SpinnakerException(f"Value {value} for {self.name} is not a multiple of {self.increment} from {self.min_value or 0}")
+        elif self.interface == intfIFloat:
+            value = float(value)
+        elif self.interface == intfIBoolean:
+            value = bool(value)
+        self.value = value
+        if self.on_change:
+            self.on_change()
+
+    def GetMin(self):
+        return self.min_value
+
+    def GetMax(self):
+        return self.max_value
+
+    def HasInc(self):
+        return self.increment is not None or self.interface == intfIInteger
+
+    def GetInc(self):
+        if self.increment is None and self.interface == intfIInteger:
+            return 1
+        return self.increment
+
+    def GetEntryByName(self, name):
+        if name not in self.entries:
+            raise SpinnakerException(f"Entry {name} does not exist for {self.name}")
+        return _EnumEntry(name, self.entries[name])
+
+    def GetIntValue(self):
+        return self.value
+
+    def SetIntValue(self, value):
+        if not self.writable:
+            raise SpinnakerException(f"Node {self.name} is not writable")
+        if value not in self.entries.values():
+            raise SpinnakerException(f"Invalid value {value} for {self.name}")
+        self.value = value
+        if self.on_change:
+            self.on_change()
+
+    def Execute(self):
+        if self.command is None:
+            raise SpinnakerException(f"Node {self.name} is not a command")
+        self.command()
+
+    def GetCurrentEntry(self):
+        for name, value in self.entries.items():
+            if value == self.value:
+                return _EnumEntry(name, value)
+        return None
+
+class _NodeMap:
+    def __init__(self, nodes):
+        self.nodes = {node.name: node for node in nodes}
+
+    def GetNode(self, name):
+        return self.nodes.get(name)
+
+def IsAvailable(node):
+    return node is not None
+
+def IsReadable(node):
+    return node is not None
+
+def IsWritable(node):
+    return node is not None and node.writable
+
+# PySpin wraps nodes in typed pointers, the simulated nodes already implement every accessor
+def _node_ptr(node):
+    return node
+
+CValuePtr = CFloatPtr = CIntegerPtr = CBooleanPtr = CStringPtr = CEnumerationPtr = CCommandPtr = _node_ptr
+
+class _StreamBuffer:
+    def __init__(self, data):
+        self.data = data
+        self.held = False
+
+class _Image:
+    def __init__(self, buffer, frame_id, timestamp, status=IMAGE_STATUS_OK):
+        self.buffer = buffer
+        self.data = buffer.data
+        self.frame_id = frame_id
+        self.timestamp = timestamp
+        self.status = status
+        self.released = False
+
+    def IsIncomplete(self):
+        return self.status != IMAGE_STATUS_OK
+
+    def GetImageStatus(self):
+        return self.status
+
+    def GetNDArray(self):
+        return self.data
+
+    def GetWidth(self):
+        return self.data.shape[1]
+
+    def GetHeight(self):
+        return self.data.shape[0]
+
+    def GetFrameID(self):
+        return self.frame_id
+
+    def GetTimeStamp(self):
+        return self.timestamp  # Nanoseconds
+
+    def Release(self):
+        # The stream buffer goes back to the camera and will be overwritten by a later frame
+        if not self.released:
+            self.released = True
+            self.buffer.held = False
+
+class Camera:
+    def __init__(self, index):
+        self.index = index
+        self.serial_number = str(SETTINGS["serial_base"] + index)
+        self.initialized = False
+        self.streaming = False
+        self.aborted = False
+        self.frames_in_acquisition = 0
+        self.frame_id = 0
+        self.dropped_frames = 0
+        self.rng = random.Random(SETTINGS["seed"] + index)
+        self.tl_node_map = _NodeMap([
+            _Node("DeviceSerialNumber", intfIString, self.serial_number, writable=False),
+            _Node("DeviceModelName", intfIString, SETTINGS["model"], writable=False),
+        ])
+        self.node_map = _NodeMap([
+            _Node("ExposureTime", intfIFloat, REFERENCE_EXPOSURE, min_value=13.0, max_value=30000000.0),
+            _Node("Gain", intfIFloat, 0.0, min_value=0.0, max_value=47.9),
+            _Node("BlackLevel", intfIFloat, 0.0, min_value=0.0, max_value=12.0),
+            _Node("ExposureAuto", intfIEnumeration, 2, entries={"Off": 0, "Once": 1, "Continuous": 2}),
+            _Node("GainAuto", intfIEnumeration, 2, entries={"Off": 0, "Once": 1, "Continuous": 2}),
+            _Node("GammaEnabled", intfIBoolean, True),
+            _Node("AcquisitionMode", intfIEnumeration, AcquisitionMode_Continuous, entries={
+                "Continuous": AcquisitionMode_Continuous,
+                "SingleFrame": AcquisitionMode_SingleFrame,
+                "MultiFrame": AcquisitionMode_MultiFrame,
+            }),
+            # Like FLIR cameras, the camera runs as fast as the image format and exposure allow
+            # until AcquisitionFrameRateEnable is set, which makes AcquisitionFrameRate writable
+            _Node("AcquisitionFrameRateEnable", intfIBoolean, False),
+            _Node("AcquisitionFrameRate", intfIFloat, float(SETTINGS["frame_rate"]), writable=False, min_value=1.0, max_value=float(SETTINGS["frame_rate"])),
+            _Node("AcquisitionResultingFrameRate", intfIFloat, float(SETTINGS["frame_rate"]), writable=False),
+            _Node("PixelFormat", intfIEnumeration, PIXEL_FORMATS[SETTINGS["bit_depth"]], entries={
+                "Mono8": PixelFormat_Mono8,
+                "Mono12p": PixelFormat_Mono12p,
+                "Mono16": PixelFormat_Mono16,
+            }),
+            _Node("SensorWidth", intfIInteger, SETTINGS["width"], writable=False),
+            _Node("SensorHeight", intfIInteger, SETTINGS["height"], writable=False),
+            _Node("WidthMax", intfIInteger, SETTINGS["width"], writable=False),
+            _Node("HeightMax", intfIInteger, SETTINGS["height"], writable=False),
+            # Sizes and offsets are in binned pixels
+            _Node("BinningHorizontal", intfIInteger, 1, min_value=1, max_value=4),
+            _Node("BinningVertical", intfIInteger, 1, min_value=1, max_value=4),
+            _Node("Width", intfIInteger, SETTINGS["width"], min_value=16, max_value=SETTINGS["width"], increment=4),
+            _Node("Height", intfIInteger, SETTINGS["height"], min_value=8, max_value=SETTINGS["height"], increment=2),
+            _Node("OffsetX", intfIInteger, 0, min_value=0, max_value=0, increment=4),
+            _Node("OffsetY", intfIInteger, 0, min_value=0, max_value=0, increment=2),
+            _Node("TriggerSelector", intfIEnumeration, 0, entries={"FrameStart": 0}),
+            _Node("TriggerMode", intfIEnumeration, TriggerMode_Off, entries={"Off": TriggerMode_Off, "On": TriggerMode_On}),
+            _Node("TriggerSource", intfIEnumeration, TriggerSource_Software, entries=TRIGGER_SOURCES),
+            _Node("TriggerOverlap", intfIEnumeration, 0, entries={"Off": 0, "ReadOut": 1}),
+            _Node("TriggerSoftware", intfICommand, None, command=self.software_trigger),
+            # The GPIO cables are simulated as wiring the selected output line of a camera to every
+            # input line of the others, which is enough for the usual primary/secondary setup.
+            _Node("LineSelector", intfIEnumeration, TriggerSource_Line0, entries={name: value for name, value in TRIGGER_SOURCES.items() if name != "Software"}),
+            _Node("LineMode", intfIEnumeration, LineMode_Input, entries={"Input": LineMode_Input, "Output": LineMode_Output}),
+            _Node("LineSource", intfIEnumeration, LineSource_Off, entries={"Off": LineSource_Off, "ExposureActive": LineSource_ExposureActive}),
+            _Node("TimestampLatch", intfICommand, None, command=self.latch_timestamp),
+            _Node("TimestampLatchValue", intfIInteger, 0, writable=False),
+        ])
+        self.AcquisitionMode = self.node_map.GetNode("AcquisitionMode")
+        self.binning = (1, 1)
+        for name in ("PixelFormat", "BinningHorizontal", "BinningVertical", "Width", "Height", "OffsetX", "OffsetY",
+                     "ExposureTime", "AcquisitionFrameRateEnable", "AcquisitionFrameRate"):
+            self.node_map.GetNode(name).on_change = self.update_limits
+        self.update_limits()
+        self.scene = None
+        self.frames = None
+        self.frames_key = None
+        self.stream_buffers = []
+        self.next_buffer = 0
+        self.triggers = []  # Times of the triggers waiting for a frame
+        self.trigger_condition = threading.Condition()
+        self.last_ready_at = 0.0
+
+    def Init(self):
+        self.initialized = True
+
+    def DeInit(self):
+        if self.streaming:
+            raise SpinnakerException("Camera is still streaming")
+        self.initialized = False
+
+    def IsInitialized(self):
+        return self.initialized
+
+    def IsValid(self):
+        return True
+
+    def GetNodeMap(self):
+        if not self.initialized:
+            raise SpinnakerException("Camera is not initialized")
+        return self.node_map
+
+    def GetTLDeviceNodeMap(self):
+        return self.tl_node_map
+
+    def BeginAcquisition(self):
+        if not self.initialized:
+            raise SpinnakerException("Camera is not initialized")
+        if self.streaming:
+            raise SpinnakerException("Camera is already streaming")
+        # The image format can't change while streaming
+        for name in STREAM_LOCKED:
+            self.node_map.GetNode(name).writable = False
+        self.streaming = True
+        self.aborted = False
+        self.frames_in_acquisition = 0
+        self.stream_start = time.perf_counter()
+        self.next_frame = 0
+        with self.trigger_condition:
+            self.triggers = []
+
+
+    def EndAcquisition(self):
+        if not self.streaming:
+            raise SpinnakerException("Camera is not started")
+        for name in STREAM_LOCKED:
+            self.node_map.GetNode(name).writable = True
+        with self.trigger_condition:
+            self.streaming = False
+            self.trigger_condition.notify_all()
+        self.aborted = False
+
+    def IsStreaming(self):
+        return self.streaming
+
+    def value(self, name):
+        return self.node_map.GetNode(name).GetValue()
+
+    def trigger(self, source, trigger_time):
+        if self.value("TriggerMode") != TriggerMode_On or self.value("TriggerSource") != source:
+            return
+        with self.trigger_condition:
+            if not self.streaming:
+                return
+            self.triggers.append(trigger_time)
+            if len(self.triggers) > SETTINGS["buffer_count"]:
+                self.dropped_frames += 1
+                self.triggers.pop(0)
+            self.trigger_condition.notify_all()
+
+    def software_trigger(self):
+        self.trigger(TriggerSource_Software, time.perf_counter())
+
+    def wait_for_trigger(self, timeout):
+        with self.trigger_condition:
+            wait = None if timeout == EVENT_TIMEOUT_INFINITE else timeout / 1000
+            self.trigger_condition.wait_for(lambda: self.triggers or not self.streaming, wait)
+            if not self.triggers:
+                raise SpinnakerException("Failed waiting for EventData on NEW_BUFFER_DATA event")
+            return self.triggers.pop(0)
+
+    def latch_timestamp(self):
+        # Frame timestamps come from the same clock
+        self.node_map.GetNode("TimestampLatchValue").value = int(time.perf_counter() * 1e9)
+
+    def max_frame_rate(self):
+        # Readout time is proportional to the rows read, binned rows are read as one; the link
+        # carries the frame's bytes
+        node = self.node_map.GetNode
+        rate = SETTINGS["frame_rate"] * node("SensorHeight").value / node("Height").value
+        if SETTINGS["link_bandwidth"]:
+            frame_bytes = node("Width").value * node("Height").value * PIXEL_FORMAT_BYTES[node("PixelFormat").value]
+            rate = min(rate, SETTINGS["link_bandwidth"] * 1e6 / frame_bytes)
+        return rate
+
+    def update_limits(self):
+        # After a write: binning rescales the size and offsets, and the size, pixel format and
+        # exposure move the limits of the others and the frame rate, as on the camera
+        node = self.node_map.GetNode
+        binning = (node("BinningHorizontal").value, node("BinningVertical").value)
+        for index, (size, offset, sensor) in enumerate((("Width", "OffsetX", "SensorWidth"), ("Height", "OffsetY", "SensorHeight"))):
+            size, offset = node(size), node(offset)
+            old, new = self.binning[index], binning[index]
+            size_max = node(sensor).value // new // size.increment * size.increment
+            if old != new:
+                size.value = max(size.min_value, min(size_max, size.value * old // new // size.increment * size.increment))
+                offset.value = offset.value * old // new // offset.increment * offset.increment
+            node("WidthMax" if index == 0 else "HeightMax").value = size_max
+            size.max_value = size_max - offset.value
+            offset.max_value = (size_max - size.value) // offset.increment * offset.increment
+            offset.value = min(offset.value, offset.max_value)
+        self.binning = binning
+
+        rate = node("AcquisitionFrameRate")
+        rate.max_value = self.max_frame_rate()
+        rate.writable = node("AcquisitionFrameRateEnable").value
+        if not rate.writable or rate.value > rate.max_value:
+            rate.value = rate.max_value
+        node("AcquisitionResultingFrameRate").value = 1.0 / self.frame_period()
+
+    def frame_period(self):
+        # Frames can't be delivered faster than the exposure time allows
+        return max(1.0 / self.value("AcquisitionFrameRate"), self.value("ExposureTime") / 1e6)
+
+    def render_frames(self):
+        # A short loop of precomputed frames, rendered again only when the settings change,
+        # so acquisition costs no more than a copy would
+        sensor_height, sensor_width = self.value("SensorHeight"), self.value("SensorWidth")
+        if self.scene is None:
+            height, width = sensor_height, sensor_width
+            gradient = np.linspace(0.1, 0.9, width, dtype=np.float32)[np.newaxis, :]
+            noise_rng = np.random.default_rng(SETTINGS["seed"] + self.index)
+            self.scene = [np.roll(gradient, i * width // 16, axis=1) + noise_rng.normal(0, 0.015, (height, width)).astype(np.float32)
+                          for i in range(4)]
+        bits = PIXEL_FORMAT_BITS[self.value("PixelFormat")]
+        max_value = (1 << bits) - 1
+        scale = (self.value("ExposureTime") / REFERENCE_EXPOSURE) * 10 ** (self.value("Gain") / 20) * max_value / 2
+        offset = self.value("BlackLevel") / 100 * max_value
+        dtype = np.uint8 if bits == 8 else np.uint16
+        # The region read out, binned by averaging
+        binning_x, binning_y = self.binning
+        x0, y0 = self.value("OffsetX") * binning_x, self.value("OffsetY") * binning_y
+        height, width = self.value("Height"), self.value("Width")
+        frames = []
+        for scene in self.scene:
+            region = scene[y0:y0 + height * binning_y, x0:x0 + width * binning_x]
+            if binning_x > 1 or binning_y > 1:
+                region = region.reshape(height, binning_y, width, binning_x).mean(axis=(1, 3))
+            frames.append(np.clip(region * scale + offset, 0, max_value).astype(dtype))
+        return frames
+
+    def GetNextImage(self, timeout=EVENT_TIMEOUT_INFINITE):
+        # timeout is in milliseconds, as in PySpin
+        if not self.streaming:
+            raise SpinnakerException("Camera is not started")
+        if self.aborted or (SETTINGS["abort_rate"] and self.rng.random() < SETTINGS["abort_rate"]):
+            self.aborted = True  # Stays aborted until acquisition is restarted
+            raise SpinnakerException("Spinnaker: Stream has been aborted. [-1010]")
+        if self.AcquisitionMode.GetValue() == AcquisitionMode_SingleFrame and self.frames_in_acquisition >= 1:
+            raise SpinnakerException("Failed waiting for EventData on NEW_BUFFER_DATA event")
+
+        period = self.frame_period()
+        if self.value("TriggerMode") == TriggerMode_On:
+            # Exposure starts at the trigger, a trigger during the previous frame waits for it to finish
+            trigger_time = self.wait_for_trigger(timeout)
+            ready_at = max(trigger_time + self.value("ExposureTime") / 1e6, self.last_ready_at + period)
+            wait = ready_at - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+        else:
+            now = time.perf_counter()
+            available = int((now - self.stream_start) / period)
+            if available - self.next_frame > SETTINGS["buffer_count"]:
+                # The consumer fell behind, the stream only holds the newest frames
+                self.dropped_frames += available - self.next_frame - SETTINGS["buffer_count"]
+                self.next_frame = available - SETTINGS["buffer_count"]
+            ready_at = self.stream_start + (self.next_frame + 1) * period
+            wait = ready_at - now
+            if timeout != EVENT_TIMEOUT_INFINITE and wait > timeout / 1000:
+                time.sleep(timeout / 1000)
+                raise SpinnakerException("Failed waiting for EventData on NEW_BUFFER_DATA event")
+            if wait > 0:
+                time.sleep(wait)
+        self.last_ready_at = ready_at
+        if self.value("LineMode") == LineMode_Output and self.value("LineSource") == LineSource_ExposureActive:
+            _pulse_line(self, ready_at - self.value("ExposureTime") / 1e6)
+
+        key = tuple(self.value(name) for name in ("ExposureTime", "Gain", "BlackLevel", "PixelFormat", "Width", "Height", "OffsetX", "OffsetY",
+                                                  "BinningHorizontal", "BinningVertical"))
+        if key != self.frames_key:
+            self.frames = self.render_frames()
+            self.frames_key = key
+        frame = self.frames[(self.frame_id + 1) % len(self.frames)]
+        buffer = self.take_stream_buffer(frame)
+        np.copyto(buffer.data, frame)
+        self.next_frame += 1
+        self.frames_in_acquisition += 1
+        self.frame_id += 1
+        status = IMAGE_STATUS_OK
+        if SETTINGS["incomplete_rate"] and self.rng.random() < SETTINGS["incomplete_rate"]:
+            status = IMAGE_STATUS_INCOMPLETE
+        return _Image(buffer, self.frame_id, int(ready_at * 1e9), status)
+
+    def take_stream_buffer(self, frame):
+        # Like the driver, fill a fixed set of stream buffers and fail once the application holds them all
+        if not self.stream_buffers or self.stream_buffers[0].data.shape != frame.shape or self.stream_buffers[0].data.dtype != frame.dtype:
+            self.stream_buffers = [_StreamBuffer(np.empty_like(frame)) for _ in range(SETTINGS["buffer_count"])]
+            self.next_buffer = 0
+        for _ in range(len(self.stream_buffers)):
+            buffer = self.stream_buffers[self.next_buffer]
+            self.next_buffer = (self.next_buffer + 1) % len(self.stream_buffers)
+            if not buffer.held:
+                buffer.held = True
+                return buffer
+        raise SpinnakerException("No free stream buffers available, release images before grabbing more")
+
+class CameraList:
+    def __init__(self, cameras):
+        self.cameras = list(cameras)
+
+    def GetSize(self):
+        return len(self.cameras)
+
+    def __len__(self):
+        return len(self.cameras)
+
+    def __getitem__(self, index):
+        return self.cameras[index]
+
+    def __iter__(self):
+        return iter(self.cameras)
+
+    def GetByIndex(self, index):
+        return self.cameras[index]
+
+    def GetBySerial(self, serial_number):
+        for cam in self.cameras:
+            if cam.serial_number == serial_number:
+                return cam
+        raise SpinnakerException(f"Camera with serial {serial_number} not found")
+
+    def Clear(self):
+        self.cameras = []
+
+class System:
+    _instance = None
+    _lock = threading.Lock()
+
+    def __init__(self):
+        self.cameras = [Camera(i) for i in range(SETTINGS["num_cameras"])]
+
+    @classmethod
+    def GetInstance(cls):
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def GetCameras(self):
+        return CameraList(self.cameras)
+
+    def ReleaseInstance(self):
+        with System._lock:
+            System._instance = None
+
+def _pulse_line(sender, pulse_time):
+    # A rising edge on sender's output line, seen by every other camera triggered from a line
+    system = System._instance
+    if system is not None:
+        for cam in system.cameras:
+            if cam is not sender and cam.value("TriggerSource") != TriggerSource_Software:
+                cam.trigger(cam.value("TriggerSource"), pulse_time)
+
+def configure(**settings):
+    # Changes apply to cameras created by the next System.GetInstance()
+    unknown = set(settings) - set(SETTINGS)
+    if unknown:
+        raise ValueError(f"Unknown simulated camera settings: {', '.join(sorted(unknown))}")
+    if settings.get("bit_depth", SETTINGS["bit_depth"]) not in PIXEL_FORMATS:
+        raise ValueError(f"Unsupported bit depth {settings['bit_depth']}, use one of {sorted(PIXEL_FORMATS)}")
+    SETTINGS.update(settings)
+
+def load_settings(path='config.ini'):
+    config = configparser.ConfigParser()
+    config.read(path)
+    if not config.has_section('SimulatedCamera'):
+        return
+    settings = {}
+    for key, default in SETTINGS.items():
+        if config.has_option('SimulatedCamera', key):
+            value = config.get('SimulatedCamera', key)
+            settings[key] = type(default)(value)
+    configure(**settings)
+
+load_settings()
@@ -0,0 +1,79 @@
+import os
+import sys
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+from interval_scheduler import CATCH_UP, SKIP, IntervalScheduler
+
+class FakeClock:
+    # Time only moves when the scheduler waits or a task says how long it took
+    def __init__(self, now=100.0):
+        self.now = now
+        self.scheduler = None
+
+    def __call__(self):
+        return self.now
+
+    def wait(self, timeout):
+        self.now += timeout
+        return self.scheduler.stopped()
+
+def make_scheduler(interval, total, durations, policy=SKIP, on_task=None):
+    # durations: seconds each capture index takes, 0 for any index not listed
+    clock = FakeClock()
+    started = []
+    def task(index):
+        started.append((index, clock.now))
+        if on_task:
+            on_task(scheduler, index)
+        clock.now += durations.get(index, 0.0)
+    scheduler = IntervalScheduler(interval, total, task, policy=policy, clock=clock, wait=clock.wait, spin_threshold=0, log=None)
+    clock.scheduler = scheduler
+    return scheduler, started
+
+def test_deadlines_do_not_drift():
+    # Each capture takes 3 of its 10 seconds, the next one still starts on the grid
+    scheduler, started = make_scheduler(10.0, 5, {index: 3.0 for index in range(5)})
+    scheduler.run()
+    assert started == [(index, 100.0 + index * 10.0) for index in range(5)]
+    stats = scheduler.stats()
+    assert stats["captures"] == 5 and stats["skipped"] == 0 and stats["max_jitter"] == 0.0
+
+def test_skip_drops_the_deadlines_that_passed():
+    scheduler, started = make_scheduler(10.0, 5, {0: 25.0}, policy=SKIP)
+    scheduler.run()
+    assert started == [(0, 100.0), (3, 130.0), (4, 140.0)]
+    assert [record.index for record in scheduler.records if record.skipped] == [1, 2]
+    assert scheduler.stats()["skipped"] == 2
+
+def test_catch_up_runs_the_missed_captures_back_to_back():
+    scheduler, started = make_scheduler(10.0, 5, {0: 25.0, 1: 1.0, 2: 1.0}, policy=CATCH_UP)
+    scheduler.run()
+    assert started == [(0, 100.0), (1, 125.0), (2, 126.0), (3, 130.0), (4, 140.0)]
+    assert not any(record.skipped for record in scheduler.records)
+
+def test_resume_continues_on_the_original_grid():
+    scheduler, started = make_scheduler(10.0, 5, {})
+    scheduler.run(start_time=75.0, first_index=3)
+    assert started == [(3, 105.0), (4, 115.0)]
+
+def test_stop_from_a_task_ends_the_run():
+    def stop_at_second(scheduler, index):
+        if index == 1:
+            scheduler.stop()
+    scheduler, started = make_scheduler(10.0, 5, {}, on_task=stop_at_second)
+    scheduler.run()
+    assert [index for index, _ in started] == [0, 1]
+    assert scheduler.stopped()
+
+def test_stop_interrupts_the_wait():
+    scheduler, started = make_scheduler(10.0, 5, {})
+    clock = scheduler.clock
+    def wait(timeout):
+        scheduler.stop()  # Stopped while waiting for the second capture
+        return clock.wait(timeout)
+    scheduler.wait = wait
+    scheduler.run()
+    assert started == [(0, 100.0)]
+    assert len(scheduler.records) == 1
@@ -0,0 +1,99 @@
+import json
+import os
+import sys
+import time
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+import run_journal
+from run_journal import RunJournal, read_journal
+
+SETTINGS = {"interval": 1.0, "output_dir": "out"}
+
+def start_run(path, captured, total=10, **kwargs):
+    # A run of total captures 60 seconds apart with the first captured ones saved
+    journal = RunJournal(path, **kwargs)
+    journal.start(SETTINGS, 1000.0, 60.0, total)
+    for index in range(captured):
+        journal.write(run_journal.PLANNED, index=index)
+        journal.write(run_journal.COMPLETED, index=index, attempt=0, path=f"image_{index}.tif", frame_index=None, timing={})
+    return journal
+
+def test_append_and_read_back(tmp_path):
+    path = str(tmp_path / "run_journal.jsonl")
+    journal = start_run(path, 3)
+    journal.write(run_journal.PLANNED, index=3)
+    journal.write(run_journal.FAILED, index=3)
+    journal.close()
+
+    with open(path) as f:
+        events = [json.loads(line)["event"] for line in f]
+    assert events[0] == run_journal.START and events[-1] == run_journal.FAILED
+    state = read_journal(path)
+    assert state.settings == SETTINGS and state.total == 10 and state.interval == 60.0
+    assert state.captured == 3 and state.failed == {3}
+    assert state.next_index() == 4 and state.in_flight is None
+    assert state.resumable
+
+    # Reopening appends to the same run
+    journal = RunJournal(path)
+    journal.write(run_journal.STOPPED, captured=3)
+    journal.close()
+    assert read_journal(path).ended == run_journal.STOPPED
+
+def test_fsync_is_batched(tmp_path):
+    journal = start_run(str(tmp_path / "run_journal.jsonl"), 50, total=100, sync_interval=0.1)
+    time.sleep(0.3)
+    syncs = journal.syncs
+    assert 1 <= syncs <= 3  # About one per sync_interval, not one per record
+    journal.close()
+    assert journal.syncs == syncs + 1  # close() syncs whatever is left
+
+def test_torn_last_line_is_ignored(tmp_path):
+    path = str(tmp_path / "run_journal.jsonl")
+    start_run(path, 2).close()
+    with open(path, 'a') as f:
+        f.write('{"event": "completed", "index": 2, "pa')  # Died in the middle of a write
+    state = read_journal(path)
+    assert state.captured == 2 and state.next_index() == 2
+
+def test_resume_after_truncation(tmp_path):
+    path = str(tmp_path / "run_journal.jsonl")
+    start_run(path, 4).close()
+    # A crash of the machine loses the end of the file, mid-record
+    with open(path, 'rb') as f:
+        data = f.read()
+    last_line = data.rindex(b"\n", 0, len(data) - 1) + 1
+    with open(path, 'r+') as f:
+        f.truncate(last_line + 20)
+    state = read_journal(path)
+    assert state.captured == 3 and state.in_flight == 3  # The last capture's completion was lost
+    assert state.resumable
+
+    first_index = state.first_due(now=1000.0 + 3 * 60.0 - 1)  # Back before capture 3 was due
+    assert first_index == state.next_index() == 3
+    journal = RunJournal(path)  # Ends the torn line, so the next record starts on its own
+    journal.write(run_journal.RESUME, index=first_index)
+    journal.write(run_journal.PLANNED, index=3)
+    journal.write(run_journal.COMPLETED, index=3, attempt=0, path="image_3.tif", frame_index=None, timing={})
+    journal.close()
+
+    state = read_journal(path)
+    assert state.resumes == 1 and state.captured == 4 and state.next_index() == 4
+    assert state.ended is None and state.in_flight is None
+
+def test_finished_run_is_not_resumable(tmp_path):
+    path = str(tmp_path / "run_journal.jsonl")
+    journal = start_run(path, 2, total=2)
+    journal.write(run_journal.FINISHED, captured=2)
+    journal.close()
+    assert not read_journal(path).resumable
+
+def test_first_due_skips_the_deadlines_that_passed(tmp_path):
+    path = str(tmp_path / "run_journal.jsonl")
+    start_run(path, 2).close()
+    state = read_journal(path)
+    now = 1000.0 + 5 * 60.0 + 1  # Capture 5's deadline has just passed
+    assert state.first_due(now=now) == 6
+    assert state.first_due(now=now, skip_missed=False) == 2
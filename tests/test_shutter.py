@@ -0,0 +1,87 @@
+import asyncio
+import os
+import sys
+import time
+import pytest
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+pytest.importorskip("serial")
+pytest.importorskip("pty")
+from concurrent.futures import Future
+from fake_arduino import FakeArduino
+from shutter import ShutterController, ShutterError
+
+@pytest.fixture
+def arduino():
+    arduino = FakeArduino(boot_time=0.05, step_delay=0.001)
+    yield arduino
+    arduino.stop()
+
+@pytest.fixture
+def shutter(arduino):
+    shutter = ShutterController(arduino.port, ready_timeout=2.0, command_timeout=2.0)
+    yield shutter
+    shutter.disconnect()
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+def test_ready_message_marks_the_shutter_closed(shutter):
+    assert shutter.ready_event.is_set()
+    assert shutter.is_open is False
+
+def test_commands_return_their_acknowledgement(arduino, shutter):
+    assert shutter.open_shutter() == "Shutter Opened"
+    assert shutter.is_open is True
+    assert shutter.open_shutter() == "Shutter already open"
+    assert shutter.close_shutter() == "Shutter Closed"
+    assert shutter.is_open is False
+    assert arduino.commands == ["OPEN", "OPEN", "CLOSE"]
+    stats = shutter.latency_stats()
+    assert stats["count"] == 3 and stats["max"] < 2.0
+
+def test_open_returns_after_the_sweep(arduino, shutter):
+    start = time.perf_counter()
+    shutter.open_shutter()
+    assert time.perf_counter() - start >= 91 * arduino.step_delay
+
+def test_timeout_returns_none_and_the_late_acknowledgement_is_ignored(arduino, shutter):
+    arduino.step_delay = 0.005  # A 0.455 s sweep
+    assert shutter.open_shutter(timeout=0.05) is None
+    assert wait_for(lambda: shutter.is_open)  # The acknowledgement still updates the state
+    assert not shutter.pending
+    assert shutter.close_shutter() == "Shutter Closed"
+
+def test_unanswered_command_fails_when_a_later_one_is_acknowledged(shutter):
+    # A command the Arduino never saw, as if the line got lost on the wire
+    lost = Future()
+    with shutter.write_lock:
+        shutter.pending.append(("CLOSE", lost, time.perf_counter()))
+    assert shutter.open_shutter() == "Shutter Opened"
+    with pytest.raises(ShutterError, match="No acknowledgement for CLOSE"):
+        lost.result(timeout=0)
+
+def test_unexpected_lines_are_skipped(arduino, shutter, capsys):
+    arduino.println("garbage")
+    assert wait_for(lambda: "Unexpected message from the shutter: garbage" in capsys.readouterr().out)
+    assert shutter.open_shutter() == "Shutter Opened"
+
+def test_send_async(shutter):
+    async def open_shutter():
+        return await shutter.send_async("OPEN")
+    response = asyncio.run(open_shutter())
+    assert response.command == "OPEN" and response.message == "Shutter Opened"
+
+def test_disconnect_fails_pending_commands(arduino, shutter):
+    arduino.step_delay = 0.01  # Still sweeping when the connection closes
+    future = shutter.send("OPEN")
+    shutter.disconnect()
+    with pytest.raises(ShutterError):
+        future.result(timeout=1)
@@ -0,0 +1,53 @@
+import os
+import subprocess
+import sys
+import numpy as np
+import pytest
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+h5py = pytest.importorskip("h5py")
+from timelapse_store import TimelapseReader, TimelapseWriter
+
+# Appends three frames and dies without closing the container, like a crashed capture server
+KILLED_WRITER = '''
+import os, sys, time
+import numpy as np
+from timelapse_store import TimelapseWriter
+writer = TimelapseWriter(sys.argv[1])
+for i in range(3):
+    writer.append(np.full((4, 6), i, np.uint8), timestamp=float(i))
+print("written", flush=True)
+if len(sys.argv) > 2:
+    time.sleep(float(sys.argv[2]))
+os._exit(1)
+'''
+
+def test_resume_after_killed_writer(tmp_path):
+    path = str(tmp_path / "run.h5")
+    subprocess.run([sys.executable, "-c", KILLED_WRITER, path], cwd=REPO, check=False)
+    with pytest.raises(OSError):
+        h5py.File(path, "a", libver="latest")  # The consistency flags are still set
+
+    with TimelapseWriter(path) as writer:
+        assert len(writer) == 3
+        assert writer.append(np.full((4, 6), 3, np.uint8), timestamp=3.0) == 3
+
+    with TimelapseReader(path) as reader:
+        assert len(reader) == 4
+        assert [int(reader[i][0, 0]) for i in range(4)] == [0, 1, 2, 3]
+        assert reader.metadata(3)["timestamp"] == 3.0
+
+def test_live_writer_is_not_recovered(tmp_path):
+    path = str(tmp_path / "run.h5")
+    process = subprocess.Popen([sys.executable, "-c", KILLED_WRITER, path, "30"], cwd=REPO, stdout=subprocess.PIPE, text=True)
+    try:
+        assert process.stdout.readline().strip() == "written"
+        with pytest.raises(Exception, match="another process"):
+            TimelapseWriter(path)
+    finally:
+        process.kill()
+        process.wait()
+    with TimelapseReader(path) as reader:
+        assert len(reader) == 3
@@ -0,0 +1,166 @@
+import os
+import threading
+import numpy as np
+from config_store import FileLock
+
+try:
+    import h5py
+except ImportError:
+    h5py = None  # The HDF5 output format needs h5py (python -m pip install h5py)
+
+# One row per frame in the container's index
+INDEX_DTYPE = np.dtype([
+    ("timestamp", "f8"),  # Seconds since the epoch
+    ("serial_number", "S32"),
+    ("exposure_time", "f8"),
+    ("gain", "f8"),
+    ("black_level", "f8"),
+    ("shutter_open_duration", "f8"),  # Seconds, 0 when the shutter was not used
+])
+
+def require_h5py():
+    if h5py is None:
+        raise ImportError("h5py is not installed, the HDF5 output format is unavailable")
+
+def recover(path):
+    # A writer that died leaves the file flagged as open for writing, and HDF5 refuses to open
+    # it again (h5clear -s clears the flags). Everything it flushed can still be read in SWMR
+    # mode, so the frames that have an index row are copied to a new file that replaces it.
+    # Returns the number of frames kept.
+    temp_path = path + ".recovering"
+    with h5py.File(path, "r", libver="latest", swmr=True) as source, h5py.File(temp_path, "w", libver="latest") as target:
+        length = min(source["frames"].shape[0], source["index"].shape[0]) if "frames" in source and "index" in source else 0
+        for name in ("frames", "index"):
+            if name in source:
+                target.copy(source[name], name)
+                target[name].resize(length, axis=0)
+    os.replace(temp_path, path)
+    return length
+
+class TimelapseWriter:
+    # Appends frames to a single HDF5 file: a chunked, compressed "frames" stack with one chunk
+    # per frame, and an "index" table with each frame's metadata. Appending to an existing
+    # file continues the same stack. Once frames exist the file is in SWMR mode, so a
+    # TimelapseReader can follow a run while it is being written. A file left by a writer that
+    # died is recovered first; the writer holds <path>.lock while open, which tells it apart
+    # from a file another process is still writing.
+    def __init__(self, path, compression="gzip", compression_level=1):
+        require_h5py()
+        self.path = path
+        self.compression = compression
+        self.compression_opts = compression_level if compression == "gzip" else None
+        self.lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.owner = FileLock(path, timeout=0)
+        try:
+            self.owner.__enter__()
+        except TimeoutError:
+            raise Exception(f"{path} is being written by another process")
+        try:
+            try:
+                self.file = h5py.File(path, "a", libver="latest")
+            except OSError as e:
+                if "already open for write" not in str(e):
+                    raise
+                frames = recover(path)
+                print(f"Recovered {path} from a writer that did not close it, {frames} frames kept")
+                self.file = h5py.File(path, "a", libver="latest")
+        except BaseException:
+            self.owner.__exit__(None, None, None)
+            raise
+        self.frames = self.file.get("frames")
+        if "index" in self.file:
+            self.index = self.file["index"]
+        else:
+            self.index = self.file.create_dataset("index", shape=(0,), maxshape=(None,), dtype=INDEX_DTYPE, chunks=(1024,))
+        if self.frames is not None:
+            self.file.swmr_mode = True
+
+    def __len__(self):
+        return self.index.shape[0]
+
+    def create_frames(self, frame):
+        self.frames = self.file.create_dataset(
+            "frames", shape=(0,) + frame.shape, maxshape=(None,) + frame.shape, dtype=frame.dtype,
+            chunks=(1,) + frame.shape, compression=self.compression, compression_opts=self.compression_opts)
+        self.file.swmr_mode = True  # No datasets can be created after this
+
+    def append(self, frame, timestamp, serial_number="", exposure_time=np.nan, gain=np.nan, black_level=np.nan, shutter_open_duration=0.0):
+        # Returns the index of the stored frame
+        with self.lock:
+            if self.frames is None:
+                self.create_frames(frame)
+            if frame.shape != self.frames.shape[1:] or frame.dtype != self.frames.dtype:
+                raise ValueError(f"Frame {frame.shape} {frame.dtype} does not match the container's {self.frames.shape[1:]} {self.frames.dtype}")
+            position = self.frames.shape[0]
+            self.frames.resize(position + 1, axis=0)
+            self.frames[position] = frame
+            self.index.resize(position + 1, axis=0)
+            self.index[position] = (timestamp, str(serial_number).encode(), exposure_time, gain, black_level, shutter_open_duration)
+            self.file.flush()  # Keep the file readable if the process dies mid-run
+            return position
+
+    def close(self):
+        with self.lock:
+            if self.file.id.valid:
+                self.file.close()
+                self.owner.__exit__(None, None, None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+class TimelapseReader:
+    # Random access to a container written by TimelapseWriter, frames are only read when requested
+    def __init__(self, path):
+        require_h5py()
+        self.file = h5py.File(path, "r", libver="latest", swmr=True)
+        self.frames = self.file["frames"]
+        self.refresh()
+
+    def refresh(self):
+        # Pick up frames appended since the file was opened
+        self.frames.refresh()
+        self.file["index"].refresh()
+        # A frame counts once its index row is written too. The index is small, keep it in memory
+        length = min(self.frames.shape[0], self.file["index"].shape[0])
+        self.index = self.file["index"][:length]
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, item):
+        return self.frames[item]
+
+    def metadata(self, frame_index):
+        row = self.index[frame_index]
+        return {
+            "timestamp": float(row["timestamp"]),
+            "serial_number": row["serial_number"].decode(),
+            "exposure_time": float(row["exposure_time"]),
+            "gain": float(row["gain"]),
+            "black_level": float(row["black_level"]),
+            "shutter_open_duration": float(row["shutter_open_duration"]),
+        }
+
+    def frame_range(self, start_time, end_time):
+        # Indices of the frames with start_time <= timestamp < end_time, timestamps are increasing
+        timestamps = self.index["timestamp"]
+        return int(np.searchsorted(timestamps, start_time, side="left")), int(np.searchsorted(timestamps, end_time, side="left"))
+
+    def frames_between(self, start_time, end_time):
+        start, stop = self.frame_range(start_time, end_time)
+        return self.frames[start:stop], self.index[start:stop]
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()